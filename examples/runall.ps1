@@ -21,8 +21,8 @@ $tasks = @(
   # Boots up the cluster with all daemons running
   "python $PY_PATH $CONFIG_ARGS start",
 
-  # Creates an external hive table pointing to the astro data
-  "python $PY_PATH $CONFIG_ARGS exec-hive-file -f `"hive/create_m33_raw_ext_tbl.hql`"",
+  # Creates an external hive table pointing to the astro data (and computes its statistics)
+  "python $PY_PATH $CONFIG_ARGS exec-hive-file -f `"hive/create_m33_raw_ext_tbl.hql`" --analyze",
 
   # Creates a schematized view on the external hive table (extracts columns from text)
   "python $PY_PATH $CONFIG_ARGS exec-hive-file -f `"hive/create_m33_schem_view.hql`"",
@@ -30,8 +30,8 @@ $tasks = @(
   # Runs a query to check the output of the view
   "python $PY_PATH $CONFIG_ARGS exec-hive-query -e `"SELECT * FROM m33_schem LIMIT 100`"",
 
-  # Creates a new Hive table stored as CSV, and inserts the view
-  "python $PY_PATH $CONFIG_ARGS exec-hive-file -f `"hive/create_insert_m33_tbl.hql`"",
+  # Creates a new Hive table stored as CSV, inserts the view, and computes its statistics
+  "python $PY_PATH $CONFIG_ARGS exec-hive-file -f `"hive/create_insert_m33_tbl.hql`" --analyze",
 
   # Runs a query to check the contents of the hive table
   "python $PY_PATH $CONFIG_ARGS exec-hive-query -e `"SELECT * FROM m33 LIMIT 100`"",
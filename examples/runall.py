@@ -36,9 +36,9 @@ def main():
   print_task_doc('start')
   playground.start(config, wait=True)
 
-  # Creates an external hive table pointing to the astro data
+  # Creates an external hive table pointing to the astro data (and computes its statistics)
   print_task_doc('hive_script1')
-  playground.exec_hive_file(config, 'hive/create_m33_raw_ext_tbl.hql')
+  playground.exec_hive_file(config, 'hive/create_m33_raw_ext_tbl.hql', analyze=True)
 
   # Creates a schematized view on the external hive table (extracts columns from text)
   print_task_doc('hive_script2')
@@ -48,9 +48,9 @@ def main():
   print_task_doc('hive_query_check1')
   playground.exec_hive_query(config, 'SELECT * FROM m33_schem LIMIT 100')
 
-  # Creates a new Hive table stored as CSV, and inserts the view
+  # Creates a new Hive table stored as CSV, inserts the view, and computes its statistics
   print_task_doc('hive_script3')
-  playground.exec_hive_file(config, 'hive/create_insert_m33_tbl.hql')
+  playground.exec_hive_file(config, 'hive/create_insert_m33_tbl.hql', analyze=True)
 
   # Runs a query to check the output of the hive table
   print_task_doc('hive_query_check2')
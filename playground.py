@@ -4,14 +4,32 @@ Orchestrates a hadoop + Hive + SQL cluster of docker nodes
 """
 import argparse
 import collections
+import concurrent.futures
+import contextlib
+import csv
+import datetime
 import distutils.dir_util
+import hashlib
+import heapq
+import importlib
+import io
 import json
+import mmap
 import os
+import queue
+import random
 import re
 import shutil
+import socket
+import sqlite3
+import statistics
 import subprocess
 import sys
+import tarfile
+import threading
 import time
+import urllib.parse
+import xml.etree.ElementTree
 
 # PyPI installed modules...
 import requests
@@ -19,6 +37,9 @@ import requests
 # The root directory of the playground repository
 ROOT_DIR = os.path.dirname(os.path.realpath(__file__))
 
+# The jdk path on the docker nodes
+JAVA_HOME = '/himage/jdk1.8.0_271'
+
 # The hadoop distribution path on the docker nodes
 HADOOP_HOME = '/himage/hadoop-3.3.0'
 
@@ -40,27 +61,391 @@ NUM_DATA_NODES = 1
 # The number of node manager nodes in the cluster (this variable only affects health checks)
 NUM_NODE_MANAGERS = 1
 
+# The default number of rows sent to the sql server node in a single hive-to-sql batch
+HIVE_TO_SQL_BATCH_SIZE = 1000
+
+# The default number of hive-to-sql batches buffered in memory between the reader and the writers
+HIVE_TO_SQL_QUEUE_SIZE = 8
+
+# The kinds of pipeline steps (see run_pipeline())
+PIPELINE_STEP_KINDS = ['setup', 'start', 'stop', 'hive-file', 'hive-query', 'sql-file', \
+  'sql-query', 'sqoop-export']
+
+# The pipeline step kinds whose results do not persist, which always run
+PIPELINE_UNCACHED_KINDS = ['start', 'stop']
+
+# The pipeline step kinds which open hive sessions
+PIPELINE_HIVE_KINDS = ['hive-file', 'hive-query']
+
+# SQL Server refuses more than this many rows in a single INSERT ... VALUES statement
+SQL_MAX_INSERT_ROWS = 1000
+
+# Hive output values written to sql as numeric literals rather than strings. Leading zeros are
+# excluded since they only survive as strings.
+SQL_NUMBER_PATTERN = r'-?(?:0|[1-9]\d*)(?:\.\d+)?(?:[eE][-+]?\d+)?'
+
+# The HDFS directory that partitioned ingests lay their hive-style partition directories out under
+PARTITION_ROOT = '/data_part'
+
+# The HDFS directory normalized ingests write the normalized data files to
+NORMALIZED_ROOT = '/data_norm'
+
+# The field delimiter of normalized data files
+NORMALIZED_DELIMITER = '\t'
+
+# The extended attribute marking an HDFS directory as the output of an ingest, which a later ingest
+# may clear before writing to it again
+INGEST_ROOT_XATTR = 'user.playground.ingest'
+
+# The HDFS directory compacted ingests write the container files to
+COMPACTED_ROOT = '/data_compact'
+
+# The size compacted ingests fill each container file up to, and the block size they are written
+# with, so that each container is a single block (and a single map split)
+COMPACT_BLOCK_SIZE = 134217728 # 128MB
+
+# The header lines at the start of each m33 data file (skip.header.line.count of m33_raw)
+M33_HEADER_LINES = 3
+
+# The number of hashes a distinct value sketch of an ingest profile keeps. The distinct counts it
+# estimates are off by about 1/sqrt(size).
+PROFILE_SKETCH_SIZE = 256
+
+# The hive column types whose statistics are seeded as numbers
+HIVE_INTEGER_TYPES = ['tinyint', 'smallint', 'int', 'bigint']
+HIVE_DECIMAL_TYPES = ['float', 'double', 'decimal']
+
+# The number of bytes of a data file each local-preview task parses
+LOCAL_PREVIEW_CHUNK_SIZE = 16777216 # 16MB
+
+# A partition pattern for the example m33 data: peculiarity from the parent folder, age from the
+# file name (for example cp/hmix.a000011z0790 becomes peculiarity=cp/age=000011)
+M33_PARTITION_PATTERN = r'(?P<peculiarity>nocp|cp)/hmix\.a(?P<age>\d+)'
+
+# Hive statements reading less than this many bytes are run in local mode instead of on YARN
+LOCAL_MODE_THRESHOLD = 134217728 # 128MB
+
+# Session settings which run a hive statement in the hive server process (as a fetch task if
+# possible), skipping the YARN application startup
+HIVE_LOCAL_MODE_SETTINGS = [
+  ('mapreduce.framework.name', 'local'),
+  ('hive.fetch.task.conversion', 'more'),
+  ('hive.fetch.task.conversion.threshold', str(LOCAL_MODE_THRESHOLD))
+]
+
+# Session settings which run a hive statement on YARN
+HIVE_YARN_MODE_SETTINGS = [
+  ('mapreduce.framework.name', 'yarn'),
+  ('hive.fetch.task.conversion', 'minimal')
+]
+
+# The nodes running the hadoop image, which all share the hadoop configuration files
+HADOOP_NODES = ['nn1', 'dn1', 'rman', 'nm1', 'mrhist', 'hs', 'client']
+
+# The memory in MB held back from the node managers for the sql server, the master daemons and the
+# host itself when sizing YARN resources
+RESERVED_MEMORY_MB = 8192
+
+# The fraction of a YARN container's memory given to the JVM heap of the task running in it
+CONTAINER_HEAP_RATIO = 0.8
+
+# The largest uber mode threshold: one HDFS block, hadoop's own default for the threshold. Larger
+# jobs gain more from running their tasks in parallel than from skipping the container startup.
+UBER_MAX_BYTES_LIMIT = 134217728 # 128MB
+
+# The host resources and the YARN/MapReduce resource sizes derived from them
+ResourcePlan = collections.namedtuple('ResourcePlan', \
+  'host_cpus host_memory_mb workers node_memory_mb node_vcores min_allocation_mb' \
+  ' map_memory_mb reduce_memory_mb am_memory_mb uber_max_bytes')
+
+# The smallest and largest HDFS block sizes chosen when planning block sizes automatically
+MIN_BLOCK_SIZE = 1048576 # 1MB
+MAX_BLOCK_SIZE = 268435456 # 256MB
+
+# A long-running daemon of the cluster: its name, node, start command, the environment variable
+# its startup script reads its jvm options from, and the main class its jvm shows in jps
+HadoopDaemon = collections.namedtuple('HadoopDaemon', \
+  'name node_name start_args opts_var main_class')
+
+# The daemons in the order they start in
+HADOOP_DAEMONS = [
+  HadoopDaemon('namenode', 'nn1', ['%s/bin/hdfs' % (HADOOP_HOME), '--daemon', 'start', \
+    'namenode'], 'HDFS_NAMENODE_OPTS', 'org.apache.hadoop.hdfs.server.namenode.NameNode'),
+  HadoopDaemon('datanode', 'dn1', ['%s/bin/hdfs' % (HADOOP_HOME), '--daemon', 'start', \
+    'datanode'], 'HDFS_DATANODE_OPTS', 'org.apache.hadoop.hdfs.server.datanode.DataNode'),
+  HadoopDaemon('resourcemanager', 'rman', ['%s/bin/yarn' % (HADOOP_HOME), '--daemon', 'start', \
+    'resourcemanager'], 'YARN_RESOURCEMANAGER_OPTS', \
+    'org.apache.hadoop.yarn.server.resourcemanager.ResourceManager'),
+  HadoopDaemon('nodemanager', 'nm1', ['%s/bin/yarn' % (HADOOP_HOME), '--daemon', 'start', \
+    'nodemanager'], 'YARN_NODEMANAGER_OPTS', \
+    'org.apache.hadoop.yarn.server.nodemanager.NodeManager'),
+  HadoopDaemon('historyserver', 'mrhist', ['%s/bin/mapred' % (HADOOP_HOME), '--daemon', 'start', \
+    'historyserver'], 'MAPRED_HISTORYSERVER_OPTS', \
+    'org.apache.hadoop.mapreduce.v2.hs.JobHistoryServer'),
+  HadoopDaemon('metastore', 'hs', ['%s/bin/hive' % (HIVE_HOME), '--service', 'metastore'], \
+    'HADOOP_CLIENT_OPTS', 'org.apache.hadoop.hive.metastore.HiveMetaStore'),
+  HadoopDaemon('hiveserver2', 'hs', ['%s/bin/hiveserver2' % (HIVE_HOME)], 'HADOOP_CLIENT_OPTS', \
+    'org.apache.hive.service.server.HiveServer2'),
+]
+
+# The ways to suspend the cluster: pause freezes the container processes in memory, stop stops the
+# containers without removing them
+SUSPEND_MODES = ['pause', 'stop']
+
+# The directory the daemons write their gc logs to. It is created before a daemon starts, since
+# nothing else creates it on the nodes which only run hive daemons.
+GC_LOG_DIR = HADOOP_HOME + '/logs'
+
+# The jvm options enabling gc logging, formatted with the daemon name. The logs do not end in .log
+# so that the log commands, which expect log4j records, leave them alone.
+GC_LOG_OPTIONS = '-Xloggc:' + GC_LOG_DIR + '/gc-%s.gclog -XX:+PrintGCDetails' \
+  ' -XX:+PrintGCDateStamps -XX:+UseGCLogFileRotation -XX:NumberOfGCLogFiles=5' \
+  ' -XX:GCLogFileSize=10M'
+
+# The metastore database backends the hive server can use
+METASTORE_TYPES = ['derby', 'mssql']
+
+# The ways setup can choose the block size and replication of the ingested data: the cluster
+# defaults, or planned from the data files and the host (see plan_block_layout())
+BLOCK_LAYOUTS = ['default', 'auto']
+
+# The name of the hive metastore database on the sql node (applicable to the mssql metastore)
+METASTORE_DATABASE = 'metastore'
+
+# The thrift port of the standalone metastore service on the hs node
+METASTORE_PORT = 9083
+
+# The log files of the daemons on the hadoop nodes (shell glob patterns)
+LOG_FILE_PATTERNS = ['%s/logs/*.log' % (HADOOP_HOME), '/tmp/root/hive.log']
+
+# The log levels in increasing order of severity
+LOG_LEVELS = ['TRACE', 'DEBUG', 'INFO', 'WARN', 'ERROR', 'FATAL']
+
+# Reads the new part of every log file on a node and filters it there, so that only matching
+# records travel over the exec channel. Expects "path inode offset" lines on stdin and the filters
+# in the environment. Prints a header line (starting with \x01) per file followed by one line per
+# record: the timestamp, a tab, and the record with its lines joined by \x1f. Continuation lines
+# left over from a record read by a previous call have an empty timestamp.
+LOG_SCAN_SCRIPT = r'''
+declare -A offsets
+while read -r path inode offset; do offsets["$path"]="$inode $offset"; done
+for f in $LOG_PATTERNS; do
+  [ -f "$f" ] || continue
+  daemon=$(basename "$f" .log); daemon=${daemon#hadoop-*-}; daemon=${daemon%-$(hostname)}
+  [ -z "$LOG_DAEMON" ] || [[ "$daemon" =~ $LOG_DAEMON ]] || continue
+  read -r inode size <<< "$(stat -c '%i %s' "$f")"
+  read -r old_inode old_offset <<< "${offsets[$f]}"
+  start=0
+  if [ "$old_inode" = "$inode" ] && [ "${old_offset:-0}" -le "$size" ]; then start=$old_offset; fi
+  printf '\001%s %s %s %s\n' "$f" "$inode" "$size" "$daemon"
+  tail -c +$((start + 1)) "$f" | head -c $((size - start)) | LC_ALL=C awk '
+    BEGIN {
+      split("TRACE DEBUG INFO WARN ERROR FATAL", names, " ")
+      for (i in names) rank[names[i]] = i
+      min = ENVIRON["LOG_LEVEL"] == "" ? 0 : rank[ENVIRON["LOG_LEVEL"]]
+      since = ENVIRON["LOG_SINCE"]; until = ENVIRON["LOG_UNTIL"]; pat = ENVIRON["LOG_REGEX"]
+    }
+    function flush() {
+      if (rec == "") return
+      if (ts == "") {
+        if (min == 0 && pat == "") print "\t" rec
+      } else if ((since == "" || ts >= since) && (until == "" || substr(ts, 1, 19) <= until) \
+        && rank[lvl] >= min && (pat == "" || rec ~ pat)) {
+        print ts "\t" rec
+      }
+      rec = ""
+    }
+    /^[0-9][0-9][0-9][0-9]-[0-9][0-9]-[0-9][0-9][ T][0-9][0-9]:[0-9][0-9]:[0-9][0-9]/ {
+      # Hadoop writes "yyyy-MM-dd HH:mm:ss,SSS LEVEL", hive "yyyy-MM-ddTHH:mm:ss,SSS  LEVEL"
+      flush(); ts = substr($0, 1, 10) " " substr($0, 12, 12)
+      lvl = substr($0, 11, 1) == "T" ? $2 : $3; rec = $0; next
+    }
+    { rec = rec == "" ? $0 : rec "\037" $0 }
+    END { flush() }'
+done
+'''
+
+# Parses the first line of a log4j record: timestamp, (padded) level, optional [thread], logger and
+# message. Hadoop separates the date and time with a space and hive (ISO8601) with a T.
+LOG_RECORD_PATTERN = r'(?P<ts>\d{4}-\d{2}-\d{2}[ T]\S+)\s+(?P<level>[A-Z]+)\s+' \
+  r'(?:\[(?P<thread>[^\]]*)\]\s+)?(?P<logger>[^\s:]+):\s?(?P<message>.*)'
+
+# The canned queries of the log index, as (description, sql, default threshold in ms). The
+# regexp_extract(text, pattern, group) function is available to the queries.
+LOG_QUERIES = collections.OrderedDict([
+  ('gc-pauses', ('JVM pauses (usually garbage collection) detected by the JvmPauseMonitor.', \
+    """
+    SELECT * FROM (
+      SELECT ts, node, daemon,
+        CAST(regexp_extract(message, 'pause of approximately (\\d+)ms', 1) AS INTEGER) AS pause_ms,
+        message
+      FROM log_records WHERE logger LIKE '%JvmPauseMonitor')
+    WHERE pause_ms >= :threshold ORDER BY pause_ms DESC LIMIT :limit
+    """, 1000)),
+  ('slow-block-reports', ('Block reports which took long to send or to process.', \
+    """
+    SELECT * FROM (
+      SELECT ts, node, daemon,
+        CAST(COALESCE(regexp_extract(message, 'processing time: (\\d+) msecs', 1),
+          regexp_extract(message, 'and (\\d+) msecs for RPC', 1)) AS INTEGER) AS ms,
+        message
+      FROM log_records WHERE message LIKE '%processReport%' OR message LIKE '%block report%')
+    WHERE ms >= :threshold ORDER BY ms DESC LIMIT :limit
+    """, 100)),
+  ('container-failures', ('YARN containers which failed or were killed.', \
+    """
+    SELECT ts, node, daemon, regexp_extract(message, '(container_\\w+)', 1) AS container, message
+    FROM log_records
+    WHERE instr(message, 'container_') > 0 AND (message LIKE '%EXITED_WITH_FAILURE%'
+      OR message LIKE '%Container killed%' OR message LIKE '%Exit code%'
+      OR level IN ('ERROR', 'FATAL'))
+    ORDER BY ts LIMIT :limit
+    """, 0)),
+  ('long-running-containers', ('YARN containers which ran longest (still running ones until the' \
+    ' latest indexed record).', \
+    """
+    SELECT container, start, finish,
+      (julianday(COALESCE(finish, (SELECT max(ts) FROM log_records))) - julianday(start)) * 86400
+        AS seconds
+    FROM (
+      SELECT regexp_extract(message, '(container_\\w+) transitioned', 1) AS container,
+        MIN(CASE WHEN message LIKE '%to RUNNING' THEN ts END) AS start,
+        MAX(CASE WHEN message LIKE '%from RUNNING to%' THEN ts END) AS finish
+      FROM log_records WHERE daemon = 'nodemanager' AND message LIKE '%transitioned from%'
+      GROUP BY 1)
+    WHERE start IS NOT NULL AND seconds * 1000 >= :threshold ORDER BY seconds DESC LIMIT :limit
+    """, 60000)),
+])
+
+# The physical layout of an ORC table created by the playground: the bucketing columns, the sort
+# columns within each bucket, the bucket count, and the columns with bloom filter indexes
+TableLayout = collections.namedtuple('TableLayout', \
+  'cluster_by sort_by buckets bloom_filter_columns')
+
+# The rows per ORC row group, the unit min/max and bloom filter indexes skip
+ORC_ROW_INDEX_STRIDE = 10000
+
+# The selective queries benchmarked against the m33 table layouts ({table} is replaced)
+LAYOUT_BENCHMARK_QUERIES = [
+  'SELECT count(*), avg(flam) FROM {table} WHERE wavelength BETWEEN 5000 AND 5050',
+  'SELECT count(*), max(flam) FROM {table} WHERE age_mil = 11',
+]
+
+# The session setting profiles hive-tune compares, as (name, value) lists applied on top of the
+# server defaults
+HIVE_TUNING_PROFILES = collections.OrderedDict([
+  ('default', []),
+  ('vectorized', [
+    ('hive.vectorized.execution.enabled', 'true'),
+    ('hive.vectorized.execution.reduce.enabled', 'true')
+  ]),
+  ('mapjoin', [
+    ('hive.auto.convert.join', 'true'),
+    ('hive.auto.convert.join.noconditionaltask', 'true'),
+    ('hive.auto.convert.join.noconditionaltask.size', '268435456')
+  ]),
+  ('more-reducers', [
+    ('hive.exec.reducers.bytes.per.reducer', '33554432')
+  ]),
+  ('fewer-reducers', [
+    ('hive.exec.reducers.bytes.per.reducer', '1073741824')
+  ]),
+  ('compress-intermediate', [
+    ('hive.exec.compress.intermediate', 'true'),
+    ('mapreduce.map.output.compress', 'true'),
+    ('mapreduce.map.output.compress.codec', 'org.apache.hadoop.io.compress.DefaultCodec')
+  ]),
+  ('combined', [
+    ('hive.vectorized.execution.enabled', 'true'),
+    ('hive.vectorized.execution.reduce.enabled', 'true'),
+    ('hive.auto.convert.join', 'true'),
+    ('hive.auto.convert.join.noconditionaltask', 'true'),
+    ('hive.auto.convert.join.noconditionaltask.size', '268435456'),
+    ('hive.exec.compress.intermediate', 'true')
+  ])
+])
+
+# The coefficient of variation below which hive-tune considers the timings of a profile stable
+HIVE_TUNING_STABLE_CV = 0.1
+
+# The relative median speedup over the default profile below which hive-tune keeps the defaults
+HIVE_TUNING_MIN_GAIN = 0.05
+
+# The image layers built from ./bin/ in Dockerfile order, as the source path relative to ./bin/ and
+# the subdirectories left to later (configuration) layers (removed in the Dockerfile's staging
+# stage). Keep this in sync with the Dockerfile.
+IMAGE_LAYERS = [
+  ('install.sh', []),
+  ('jdk1.8.0_271', []),
+  ('hadoop-3.3.0', ['etc/hadoop']),
+  ('apache-hive-3.1.2-bin', ['conf']),
+  ('sqoop-1.4.7.bin__hadoop-2.6.0', ['conf']),
+  ('helper-scripts', []),
+  ('hadoop-3.3.0/etc/hadoop', []),
+  ('apache-hive-3.1.2-bin/conf', []),
+  ('sqoop-1.4.7.bin__hadoop-2.6.0/conf', []),
+]
+
+# The image label holding the hash of the image build inputs
+IMAGE_HASH_LABEL = 'playground.inputs-hash'
+
+# The file caching the digests of the image build inputs and the layers each image was built from.
+# It lives next to the repository rather than in a volumes directory, which setup destroys.
+BUILD_CACHE_FILE = os.path.join(ROOT_DIR, '.build-cache.json')
+
 # The minimum amount of disk space each node requires to operate (applicable in health checks)
 MIN_DISK_SPACE = 8589934592 # 1GB
 
-# Exposed localhost ports for each of the nodes
-PORT_UI_NN1    = 3000
-PORT_UI_DN1    = 3001
-PORT_UI_RMAN   = 3002
-PORT_UI_NM1    = 3003
-PORT_UI_MRHIST = 3004
-PORT_UI_HS     = 3005
-PORT_SQL_SQL   = 3006
+# Exposed localhost ports for each of the nodes, as offsets from the project's port base (see
+# host_port())
+PORT_OFFSET_NN1    = 0
+PORT_OFFSET_DN1    = 1
+PORT_OFFSET_RMAN   = 2
+PORT_OFFSET_NM1    = 3
+PORT_OFFSET_MRHIST = 4
+PORT_OFFSET_HS     = 5
+PORT_OFFSET_SQL    = 6
+
+# The port base used unless the project configures another one
+DEFAULT_PORT_BASE = 3000
+
+# The distance between the port bases tried when picking free ports automatically
+PORT_BASE_STEP = 10
+
+# The file recording the port base each project picked automatically, and the lock file guarding it.
+# A picked base stays reserved for a while, since the ports of a cluster which is still booting
+# are not bound yet and would look free to a cluster booting at the same time.
+PORT_RESERVATIONS_FILE = os.path.join(ROOT_DIR, '.port-reservations.json')
+PORT_RESERVATIONS_LOCK = PORT_RESERVATIONS_FILE + '.lock'
+PORT_RESERVATION_SECONDS = 600
+
+# The environment variables the docker-compose file reads the host port of each node from
+PORT_ENV_VARS = [
+  (PORT_OFFSET_NN1, 'port_ui_nn1'),
+  (PORT_OFFSET_DN1, 'port_ui_dn1'),
+  (PORT_OFFSET_RMAN, 'port_ui_rman'),
+  (PORT_OFFSET_NM1, 'port_ui_nm1'),
+  (PORT_OFFSET_MRHIST, 'port_ui_mrhist'),
+  (PORT_OFFSET_HS, 'port_ui_hs'),
+  (PORT_OFFSET_SQL, 'port_sql_sql'),
+]
+
+# The published ports of the workers, used to probe a worker directly once the masters report it
+# unhealthy
+WORKER_PORTS = {'dn1': PORT_OFFSET_DN1, 'nm1': PORT_OFFSET_NM1}
+
+# The number of seconds since its last heartbeat after which a data node is reported unhealthy
+DATANODE_STALE_SECONDS = 30
 
 # Descriptions of what each port does
 PORT_DOC = [
-  (PORT_UI_NN1,    'http', 'Web UI for the primary name node'),
-  (PORT_UI_DN1,    'http', 'Web UI for data node 1'),
-  (PORT_UI_RMAN,   'http', 'Web UI for YARN resource manager'),
-  (PORT_UI_NM1,    'http', 'Web UI for node manager 1'),
-  (PORT_UI_MRHIST, 'http', 'Web UI map reduce history server'),
-  (PORT_UI_HS,     'http', 'Web UI for hive server'),
-  (PORT_SQL_SQL,   'sql (tcp/ip)', 'SQL server connection port')
+  (PORT_OFFSET_NN1,    'http', 'Web UI for the primary name node'),
+  (PORT_OFFSET_DN1,    'http', 'Web UI for data node 1'),
+  (PORT_OFFSET_RMAN,   'http', 'Web UI for YARN resource manager'),
+  (PORT_OFFSET_NM1,    'http', 'Web UI for node manager 1'),
+  (PORT_OFFSET_MRHIST, 'http', 'Web UI map reduce history server'),
+  (PORT_OFFSET_HS,     'http', 'Web UI for hive server'),
+  (PORT_OFFSET_SQL,    'sql (tcp/ip)', 'SQL server connection port')
 ]
 
 # A health checklist item description
@@ -79,11 +464,16 @@ class Config:
   """
   Represents the configuration for any playground tasks
   """
-  def __init__(self, project_name=None, source_dir=None, data_dir=None, volumes_dir=None):
+  def __init__(self, project_name=None, source_dir=None, data_dir=None, volumes_dir=None, \
+    metastore='derby', jvm_options=None, port_base=DEFAULT_PORT_BASE, block_layout='default'):
     self.project_name = project_name
     self.source_dir = source_dir
     self.data_dir = data_dir
     self.volumes_dir = volumes_dir
+    self.metastore = metastore
+    self.jvm_options = jvm_options
+    self.port_base = port_base
+    self.block_layout = block_layout
 
   @property
   def project_name(self):
@@ -139,6 +529,65 @@ class Config:
     else:
       self._volumes_dir = None
 
+  @property
+  def metastore(self):
+    """
+    The hive metastore database: 'derby' for an embedded database in the hs node (one connection
+    at a time), or 'mssql' for a database on the sql node behind a standalone metastore service.
+    """
+    return self._metastore
+
+  @metastore.setter
+  def metastore(self, value):
+    if value not in METASTORE_TYPES:
+      raise ValueError('Unknown metastore "%s". Expected one of: %s' % \
+        (value, ', '.join(METASTORE_TYPES)))
+    self._metastore = value
+
+  @property
+  def jvm_options(self):
+    """
+    Extra jvm options per daemon name (see HADOOP_DAEMONS), for example heap sizes and the garbage
+    collector: {"namenode": "-Xmx2g -XX:+UseG1GC"}.
+    """
+    return self._jvm_options
+
+  @jvm_options.setter
+  def jvm_options(self, value):
+    value = dict(value or {})
+    unknown = set(value) - set(_d.name for _d in HADOOP_DAEMONS)
+    if unknown:
+      raise ValueError('Unknown daemons in jvm options: %s' % (', '.join(sorted(unknown))))
+    self._jvm_options = value
+
+  @property
+  def port_base(self):
+    """
+    The first localhost port the nodes are exposed on, or 'auto' to pick free ports when the
+    cluster boots (remembered until they are taken by something else). Give clusters which run
+    side by side different port bases.
+    """
+    return self._port_base
+
+  @port_base.setter
+  def port_base(self, value):
+    self._port_base = value if value == 'auto' else int(value)
+
+  @property
+  def block_layout(self):
+    """
+    How setup chooses the block size and replication of the ingested data: 'default' for the
+    cluster defaults, or 'auto' to plan them from the data files and the host.
+    """
+    return self._block_layout
+
+  @block_layout.setter
+  def block_layout(self, value):
+    if value not in BLOCK_LAYOUTS:
+      raise ValueError('Unknown block layout "%s". Expected one of: %s' % \
+        (value, ', '.join(BLOCK_LAYOUTS)))
+    self._block_layout = value
+
   def save(self, filename):
     """
     Saves the configuration to a file.
@@ -148,7 +597,11 @@ class Config:
         'project_name': self._project_name, \
         'source_dir': self._source_dir, \
         'data_dir': self._data_dir, \
-        'volumes_dir': self._volumes_dir \
+        'volumes_dir': self._volumes_dir, \
+        'metastore': self._metastore, \
+        'jvm_options': self._jvm_options, \
+        'port_base': self._port_base, \
+        'block_layout': self._block_layout \
       }, _fp, indent=2)
 
   @staticmethod
@@ -163,43 +616,219 @@ class Config:
       _c.source_dir = _j['source_dir']
       _c.data_dir = _j['data_dir']
       _c.volumes_dir = _j['volumes_dir']
+      _c.metastore = _j.get('metastore', 'derby')
+      _c.jvm_options = _j.get('jvm_options', {})
+      _c.port_base = _j.get('port_base', DEFAULT_PORT_BASE)
+      _c.block_layout = _j.get('block_layout', 'default')
       return _c
 
-def exec_docker(config, node_name, command, workdir=None, \
-  interactive=False, detached=False, check=True):
+def state_path(config, name):
   """
-  Executes a command on a node through docker.
+  Gets the path of a json file the playground uses to remember things between runs. State lives
+  in the volumes directory so that it is destroyed together with the cluster it describes.
+  """
+  return os.path.join(config.volumes_dir, 'state', '%s.json' % (name))
+
+def load_state(config, name):
+  """
+  Loads a named playground state object. Returns an empty dictionary if nothing was saved yet.
+  """
+  _f = state_path(config, name)
+  if not os.path.exists(_f):
+    return {}
+  with open(_f, 'r') as _fp:
+    return json.load(_fp)
+
+def save_state(config, name, state):
+  """
+  Saves a named playground state object.
+  """
+  _f = state_path(config, name)
+  if not os.path.exists(os.path.dirname(_f)):
+    os.makedirs(os.path.dirname(_f))
+  with open(_f, 'w') as _fp:
+    json.dump(state, _fp, indent=2)
+
+def docker_exec_args(config, node_name, args, workdir=None, \
+  interactive=False, detached=False, keep_stdin=False, env=None):
+  """
+  Builds the docker command line which executes the given argument list on a node, optionally with
+  extra environment variables.
   """
   _args = ['docker', 'exec']
+  for name, value in (env or {}).items():
+    _args.append('-e')
+    _args.append('%s=%s' % (name, value))
   if workdir:
     _args.append('-w')
     _args.append(workdir)
   if interactive:
     _args.append('-i')
     _args.append('-t')
+  elif keep_stdin:
+    _args.append('-i')
   if detached:
     _args.append('-d')
   _args.append('%s_%s_1' % (config.project_name, node_name))
+  _args.extend(args)
+  return _args
+
+def exec_docker(config, node_name, command, workdir=None, \
+  interactive=False, detached=False, check=True):
+  """
+  Executes a command on a node through docker.
+  """
+  _cmd_args = []
   split_spaces = True
   for _c in command.split('"'):
     if split_spaces:
       _splt = _c.split(' ')
       for _s in _splt:
         if _s:
-          _args.append(_s)
+          _cmd_args.append(_s)
     else:
-      _args.append(_c)
+      _cmd_args.append(_c)
     split_spaces = not split_spaces
+  _args = docker_exec_args(config, node_name, _cmd_args, workdir=workdir, \
+    interactive=interactive, detached=detached)
   output = subprocess.run(_args, check=check, shell=True)
   return output.returncode
 
 
-def build_img(config):
+def hash_image_layer(path, excludes, cache):
   """
-  Builds or rebuilds the dockerfile images.
+  Hashes the contents of a file or directory tree, leaving out the excluded subdirectories.
+  File digests are reused from the cache (keyed by path, checked against size and modification
+  time) so that unchanged distributions are not read again. Returns the hash and the total size.
   """
-  set_environment(config)
-  os.system('docker-compose -p %s -f "%s" build' % (config.project_name, COMPOSE_FILE))
+  _h = hashlib.sha256()
+  total = 0
+  if os.path.isfile(path):
+    files = [path]
+  else:
+    files = []
+    for root, dirs, names in os.walk(path):
+      dirs[:] = sorted(d for d in dirs if os.path.relpath(os.path.join(root, d), path) \
+        .replace(os.sep, '/') not in excludes)
+      files.extend(os.path.join(root, name) for name in sorted(names))
+  for _f in files:
+    stat = os.stat(_f)
+    entry = cache.get(_f)
+    if entry is None or entry[0] != stat.st_size or entry[1] != stat.st_mtime:
+      _fh = hashlib.sha256()
+      with open(_f, 'rb') as _fp:
+        for chunk in iter(lambda: _fp.read(1048576), b''):
+          _fh.update(chunk)
+      entry = [stat.st_size, stat.st_mtime, _fh.hexdigest()]
+      cache[_f] = entry
+    _h.update(('%s %s\n' % (os.path.relpath(_f, path).replace(os.sep, '/'), entry[2])) \
+      .encode('utf-8'))
+    total += stat.st_size
+  return _h.hexdigest(), total
+
+def image_name(config):
+  """
+  Gets the name of the image shared by the cluster nodes (see the docker-compose file).
+  """
+  return 'playground/%s:1' % (config.project_name)
+
+def load_build_cache():
+  """
+  Loads the build cache (see BUILD_CACHE_FILE). Returns an empty dictionary if there is none.
+  """
+  if not os.path.exists(BUILD_CACHE_FILE):
+    return {}
+  with open(BUILD_CACHE_FILE, 'r') as _fp:
+    return json.load(_fp)
+
+def save_build_cache(cache):
+  """
+  Saves the build cache. The file is replaced in one step since clusters of a pool may build at
+  the same time.
+  """
+  _tmp = '%s.%d' % (BUILD_CACHE_FILE, os.getpid())
+  with open(_tmp, 'w') as _fp:
+    json.dump(cache, _fp, indent=2)
+  os.replace(_tmp, BUILD_CACHE_FILE)
+
+def image_inputs_hash():
+  """
+  Hashes the Dockerfile and every image layer source in ./bin/. Returns the combined hash, the
+  hash of each layer, and the total size of the inputs.
+  """
+  state = load_build_cache()
+  cache = state.get('files', {})
+  layers = collections.OrderedDict()
+  total = 0
+  for source, excludes in IMAGE_LAYERS:
+    path = os.path.join(ROOT_DIR, 'bin', *source.split('/'))
+    if not os.path.exists(path):
+      print('Image input "%s" does not exist.' % (path))
+      layers[source] = None
+      continue
+    layers[source], size = hash_image_layer(path, excludes, cache)
+    total += size
+  _h = hashlib.sha256()
+  with open(os.path.join(ROOT_DIR, 'Dockerfile'), 'rb') as _fp:
+    _h.update(_fp.read())
+  for source, digest in layers.items():
+    _h.update(('%s %s\n' % (source, digest)).encode('utf-8'))
+  state['files'] = {_f: entry for _f, entry in cache.items() if os.path.exists(_f)}
+  save_build_cache(state)
+  return _h.hexdigest(), layers, total
+
+def built_image_hash(config):
+  """
+  Gets the inputs hash label of the built image, or None if there is no such image.
+  """
+  result = subprocess.run(['docker', 'image', 'inspect', '-f', \
+    '{{ index .Config.Labels "%s" }}' % (IMAGE_HASH_LABEL), image_name(config)], \
+    stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, universal_newlines=True)
+  if result.returncode != 0:
+    return None
+  return result.stdout.strip() or None
+
+def build_img(config, force=False):
+  """
+  Builds or rebuilds the dockerfile images. The build is skipped if the image was already built
+  from the same Dockerfile and ./bin/ contents (unless forced). Each distribution and each
+  configuration directory is its own image layer, so only the layers whose inputs changed are
+  rebuilt.
+  """
+  _start = time.time()
+  inputs_hash, layers, total = image_inputs_hash()
+  print('Hashed %s of image inputs in %fs.' % (format_bytes(total), time.time() - _start))
+  if not force and built_image_hash(config) == inputs_hash:
+    print('Image %s is up to date. Skipping build.' % (image_name(config)))
+    return
+
+  state = load_build_cache()
+  previous = state.get('layers', {}).get(image_name(config), {})
+  changed = [source for source, digest in layers.items() if previous.get(source) != digest]
+  if previous and changed:
+    print('Changed image layers: %s' % (', '.join(changed)))
+
+  _start = time.time()
+  env = dict(os.environ)
+  env['DOCKER_BUILDKIT'] = '1'
+  proc = subprocess.Popen(['docker', 'build', '--progress=plain', '-t', image_name(config), \
+    '--label', '%s=%s' % (IMAGE_HASH_LABEL, inputs_hash), ROOT_DIR], env=env, \
+    stdout=subprocess.PIPE, stderr=subprocess.STDOUT, universal_newlines=True)
+  transferred = []
+  for line in proc.stdout:
+    print(line, end='')
+    match = re.search(r'transferring context: ([\d.]+\s*[kMG]?B)', line)
+    if match:
+      transferred.append(match.group(1))
+  proc.wait()
+  if proc.returncode != 0:
+    raise subprocess.CalledProcessError(proc.returncode, proc.args)
+
+  state = load_build_cache()
+  state.setdefault('layers', {})[image_name(config)] = layers
+  save_build_cache(state)
+  print('Image %s built in %fs. Build context sent to the daemon: %s.' % (image_name(config), \
+    time.time() - _start, transferred[-1] if transferred else 'unknown'))
 
 def format_hdfs(config):
   """
@@ -207,11 +836,771 @@ def format_hdfs(config):
   """
   exec_docker(config, 'nn1', '%s/bin/hdfs namenode -format -force clust' % (HADOOP_HOME))
 
-def ingest_data(config):
+def ingest_data(config, partition_pattern=None, partition_root=PARTITION_ROOT, \
+  block_size=None, replication=None, profile=False, header_lines=M33_HEADER_LINES):
+  """
+  Ingests data from the configured data volume into hdfs. The block size and replication are the
+  cluster defaults unless given, and either can be 'auto' to plan it from the data files (see
+  plan_block_layout()). If a partition pattern is given, the ingested files are afterwards laid out
+  as hive-style partition directories (see partition_ingested_data()), which moves them out of
+  /data. If profile is set, the data files are profiled from the bytes copied to HDFS (see
+  put_profiled_data()), the profiles are saved in the ingest manifest, and the statistics of the
+  hive tables over the ingested files are set from them (see seed_ingested_tables()).
+  """
+  if block_size == 'auto' or replication == 'auto':
+    plan = plan_resources(*detect_host_resources())
+    auto_block_size, auto_replication = plan_block_layout(local_file_sizes(config.data_dir), \
+      NUM_DATA_NODES, plan.node_vcores * plan.workers)
+    block_size = auto_block_size if block_size == 'auto' else block_size
+    replication = auto_replication if replication == 'auto' else replication
+  properties = collections.OrderedDict()
+  if block_size:
+    properties['dfs.blocksize'] = int(block_size)
+  if replication:
+    properties['dfs.replication'] = int(replication)
+  options = ''.join('-D %s=%d ' % _p for _p in properties.items())
+  if options:
+    print('Ingesting with %s' % (options))
+  if profile:
+    entries = put_profiled_data(config, properties, header_lines)
+    if entries is None:
+      return
+  else:
+    exec_docker(config, 'nn1', '%s/bin/hadoop fs %s-put /data /data' % (HADOOP_HOME, options))
+  print_ingest_summary(config, '/data')
+  moves = []
+  if partition_pattern:
+    moves = partition_ingested_data(config, partition_pattern, partition_root)
+  if profile:
+    save_ingest_manifest(config, entries, moves, header_lines)
+    seed_ingested_tables(config)
+
+def local_file_sizes(directory):
+  """
+  Lists the sizes of all files in a local directory tree.
+  """
+  return [os.path.getsize(os.path.join(_r, _f)) for _r, _d, _fs in os.walk(directory) \
+    for _f in _fs]
+
+def count_blocks(file_sizes, block_size):
+  """
+  Counts the HDFS blocks (and therefore the map splits of splittable files) the files occupy.
+  """
+  return sum(-(-_s // block_size) for _s in file_sizes)
+
+def plan_block_layout(file_sizes, datanodes, parallel_tasks):
+  """
+  Chooses a block size and replication for a dataset. Replication is capped by the number of data
+  nodes. The block size is the largest power of two (between MIN_BLOCK_SIZE and MAX_BLOCK_SIZE)
+  which still splits the data into enough blocks to keep every parallel map task busy; larger
+  blocks mean fewer block objects in name node memory and fewer map tasks to schedule. Datasets too
+  small to fill every task get one block per file.
+  """
+  replication = max(min(3, datanodes), 1)
+  if not file_sizes:
+    return MAX_BLOCK_SIZE, replication
+  target = min(parallel_tasks, count_blocks(file_sizes, MIN_BLOCK_SIZE))
+  block_size = MAX_BLOCK_SIZE
+  while block_size > MIN_BLOCK_SIZE and count_blocks(file_sizes, block_size) < target:
+    block_size //= 2
+  return block_size, replication
+
+def print_ingest_summary(config, path):
   """
-  Ingests data from the configured data volume into hdfs.
+  Prints the file, block and estimated map split counts of an ingested HDFS path.
   """
-  exec_docker(config, 'nn1', '%s/bin/hadoop fs -put /data /data' % (HADOOP_HOME))
+  files = hdfs_list_files(config, path)
+  if files is None:
+    print('Could not list %s for the ingest summary.' % (path))
+    return
+  blocks = sum(count_blocks([_f['length']], _f['blockSize']) for _f in files)
+  block_sizes = sorted(set(_f['blockSize'] for _f in files))
+  replications = sorted(set(_f['replication'] for _f in files))
+  print('Ingest summary for %s: %d files, %s, %d blocks (block size %s, replication %s),' \
+    ' %d block replicas, ~%d map splits.' % (path, len(files), \
+    format_bytes(sum(_f['length'] for _f in files)), blocks, \
+    '/'.join(format_bytes(_b) for _b in block_sizes), '/'.join(str(_r) for _r in replications), \
+    sum(count_blocks([_f['length']], _f['blockSize']) * _f['replication'] for _f in files), \
+    blocks))
+
+def plan_partition_layout(data_dir, partition_pattern, partition_root=PARTITION_ROOT):
+  """
+  Maps the files of the local data directory to hive-style partition directories. The pattern is
+  searched for in each file path relative to the data directory, and its named groups become the
+  partition columns in the order they are declared. Returns a list of (ingested HDFS path,
+  partitioned HDFS path) tuples; files that do not match the pattern are left out.
+  """
+  regex = re.compile(partition_pattern)
+  columns = [_n for _n, _i in sorted(regex.groupindex.items(), key=lambda _g: _g[1])]
+  moves = []
+  for root, _dirs, files in os.walk(data_dir):
+    for name in sorted(files):
+      rel_path = os.path.relpath(os.path.join(root, name), data_dir).replace(os.sep, '/')
+      match = regex.search(rel_path)
+      if not match:
+        continue
+      partition = '/'.join('%s=%s' % (_c, urllib.parse.quote(match.group(_c), safe='')) \
+        for _c in columns)
+      moves.append(('/data/%s' % (rel_path), \
+        '%s/%s/%s' % (partition_root.rstrip('/'), partition, name)))
+  return moves
+
+def partition_ingested_data(config, partition_pattern, partition_root=PARTITION_ROOT):
+  """
+  Moves ingested files into hive-style partition directories derived from their paths, for
+  example /data/m33_0.01/cp/hmix.a000011z0790 to /data_part/peculiarity=cp/age=000011/. Moves are
+  HDFS renames, so no data is copied, but the files are no longer under /data afterwards and tables
+  over /data (like m33_raw) no longer see them. Queries filtering on the partition columns then
+  only read the matching directories. Returns the (source, destination) paths of the files moved.
+  """
+  moves = plan_partition_layout(config.data_dir, partition_pattern, partition_root)
+  if not moves:
+    print('No files in the data directory match the partition pattern.')
+    return []
+  _start = time.time()
+  for directory in sorted(set(_dst.rsplit('/', 1)[0] for _src, _dst in moves)):
+    if webhdfs_request(config, directory, 'MKDIRS', method='PUT') is None:
+      print('Could not create partition directory "%s".' % (directory))
+      return []
+  moved = []
+  for src, dst in moves:
+    jsn = webhdfs_request(config, src, 'RENAME', method='PUT', params={'destination': dst})
+    if jsn is None or not jsn.get('boolean'):
+      print('Could not move "%s" to "%s".' % (src, dst))
+      continue
+    moved.append((src, dst))
+  print('Partitioned %d/%d files into %d partitions under %s in %fs.' % (len(moved), \
+    len(moves), len(set(_dst.rsplit('/', 1)[0] for _src, _dst in moves)), partition_root, \
+    time.time() - _start))
+  return moved
+
+def normalized_chunks(path, header_lines=0, delimiter=NORMALIZED_DELIMITER, \
+  chunk_size=1048576):
+  """
+  Reads a text data file and yields its normalized rows in chunks of about chunk_size bytes: the
+  header lines are left out, the values of each row are trimmed and separated by the delimiter
+  instead of runs of whitespace, and line endings become \\n.
+  """
+  separator = delimiter.encode()
+  rows = []
+  size = 0
+  with open(path, 'rb') as _fp:
+    for index, line in enumerate(_fp):
+      if index < header_lines:
+        continue
+      row = separator.join(line.split()) + b'\n'
+      rows.append(row)
+      size += len(row)
+      if size >= chunk_size:
+        yield b''.join(rows)
+        rows = []
+        size = 0
+  if rows:
+    yield b''.join(rows)
+
+def hdfs_put_stream(config, dst, chunks, properties=None):
+  """
+  Streams chunks of bytes into a new HDFS file (overwriting it) through hdfs dfs -put on the name
+  node, without writing them to a local file first. The properties (for example dfs.blocksize) are
+  passed as -D options. Returns the number of bytes written.
+  """
+  args = ['%s/bin/hdfs' % (HADOOP_HOME), 'dfs']
+  for name, value in (properties or {}).items():
+    args += ['-D', '%s=%s' % (name, value)]
+  proc = subprocess.Popen(docker_exec_args(config, 'nn1', args + ['-put', '-f', '-', dst], \
+    keep_stdin=True), stdin=subprocess.PIPE)
+  written = 0
+  try:
+    for chunk in chunks:
+      proc.stdin.write(chunk)
+      written += len(chunk)
+    proc.stdin.close()
+  except BrokenPipeError:
+    # The put failed; its exit code is raised below
+    pass
+  if proc.wait() != 0:
+    raise subprocess.CalledProcessError(proc.returncode, proc.args)
+  return written
+
+def prepare_ingest_root(config, root):
+  """
+  Empties (or creates) the HDFS directory an ingest writes to, so that files left by an earlier
+  ingest are not read by the table, and marks it with INGEST_ROOT_XATTR. A directory which exists
+  but holds files not written by an ingest is left alone. Returns whether the directory is ready.
+  """
+  if webhdfs_request(config, root, 'GETFILESTATUS') is not None:
+    if webhdfs_request(config, root, 'GETXATTRS', params={'xattr.name': INGEST_ROOT_XATTR}) is None:
+      listing = webhdfs_request(config, root, 'LISTSTATUS')
+      if listing is None or listing['FileStatuses']['FileStatus']:
+        print('"%s" is not empty and was not written by an ingest. Choose another root.' % (root))
+        return False
+    if webhdfs_request(config, root, 'DELETE', method='DELETE', \
+      params={'recursive': 'true'}) is None:
+      print('Could not clear "%s".' % (root))
+      return False
+  if webhdfs_request(config, root, 'MKDIRS', method='PUT') is None or \
+    webhdfs_request(config, root, 'SETXATTR', method='PUT', \
+    params={'xattr.name': INGEST_ROOT_XATTR, 'flag': 'CREATE'}) is None:
+    print('Could not create directory "%s".' % (root))
+    return False
+  return True
+
+def infer_text_columns(path, header_lines=0, sample_rows=100):
+  """
+  Infers hive columns for a text data file from the first rows after the header: one column per
+  whitespace separated value, named col0, col1, ..., which is DOUBLE if every sampled value is a
+  number and STRING otherwise.
+  """
+  numeric = []
+  with open(path, 'rb') as _fp:
+    for index, line in enumerate(_fp):
+      if index >= header_lines + sample_rows:
+        break
+      if index < header_lines:
+        continue
+      for column, value in enumerate(line.split()):
+        if column == len(numeric):
+          numeric.append(True)
+        try:
+          float(value)
+        except ValueError:
+          numeric[column] = False
+  return [('col%d' % (_i), 'DOUBLE' if _n else 'STRING') for _i, _n in enumerate(numeric)]
+
+def parse_hive_columns(text):
+  """
+  Parses a column list such as "wavelength DOUBLE, flam DOUBLE" into (name, type) tuples.
+  """
+  return [tuple(_c.split(None, 1)) for _c in text.split(',') if _c.strip()]
+
+def ingest_normalized(config, table, columns=None, partition_pattern=None, header_lines=0, \
+  root=NORMALIZED_ROOT, delimiter=NORMALIZED_DELIMITER, workers=4):
+  """
+  Ingests the data files normalized (see normalized_chunks()) as they stream into HDFS under root,
+  and (re)creates an external ROW FORMAT DELIMITED table over them, so hive's native text SerDe
+  splits the columns without per-row string functions, and files without headers to skip can be
+  split across map tasks. The columns are a list of (name, type) tuples, inferred from the first
+  data file if not given (see infer_text_columns()). If a partition pattern is given, the files are
+  laid out as hive-style partition directories (see plan_partition_layout()) and the partitions
+  are registered with the table; otherwise the files are stored directly under root, named by
+  their path in the data directory. Files are streamed by several puts at once. Files left under
+  root by an earlier ingest are removed first (see prepare_ingest_root()).
+  """
+  if partition_pattern:
+    moves = plan_partition_layout(config.data_dir, partition_pattern, root)
+    partition_columns = [_n for _n, _i in sorted(re.compile(partition_pattern).groupindex.items(), \
+      key=lambda _g: _g[1])]
+  else:
+    moves = []
+    for _dir, _dirs, _files in os.walk(config.data_dir):
+      for name in sorted(_files):
+        rel_path = os.path.relpath(os.path.join(_dir, name), config.data_dir).replace(os.sep, '/')
+        moves.append(('/data/%s' % (rel_path), '%s/%s' % (root.rstrip('/'), \
+          rel_path.replace('/', '_'))))
+    partition_columns = []
+  if not moves:
+    print('No data files to ingest.')
+    return
+  files = [(os.path.join(config.data_dir, *_src[len('/data/'):].split('/')), _dst) \
+    for _src, _dst in moves]
+  columns = columns or infer_text_columns(files[0][0], header_lines)
+  if not prepare_ingest_root(config, root):
+    return
+  for directory in sorted(set(_dst.rsplit('/', 1)[0] for _src, _dst in files)):
+    if webhdfs_request(config, directory, 'MKDIRS', method='PUT') is None:
+      print('Could not create directory "%s".' % (directory))
+      return
+  _start = time.time()
+  with concurrent.futures.ThreadPoolExecutor(max_workers=workers) as executor:
+    written = list(executor.map(lambda _f: hdfs_put_stream(config, _f[1], \
+      normalized_chunks(_f[0], header_lines, delimiter)), files))
+  print('Normalized %d files (%s read, %s written) into %s in %fs.' % (len(files), \
+    format_bytes(sum(os.path.getsize(_f) for _f, _dst in files)), format_bytes(sum(written)), \
+    root, time.time() - _start))
+  print_ingest_summary(config, root)
+  create_delimited_table(config, table, columns, partition_columns, root, delimiter)
+
+def create_delimited_table(config, table, columns, partition_columns, root, \
+  delimiter=NORMALIZED_DELIMITER):
+  """
+  (Re)creates an external ROW FORMAT DELIMITED text table over an HDFS directory and registers
+  the partition directories under it, if the table has (string) partition columns.
+  """
+  statements = [
+    'DROP TABLE IF EXISTS %s' % (table),
+    'CREATE EXTERNAL TABLE %s (%s)%s\n  ROW FORMAT DELIMITED FIELDS TERMINATED BY \'%s\'\n' \
+    '  STORED AS TEXTFILE\n  LOCATION \'%s\'' % (table, ', '.join('%s %s' % _c for _c in columns), \
+    '\n  PARTITIONED BY (%s)' % (', '.join('%s STRING' % _c for _c in partition_columns)) \
+    if partition_columns else '', delimiter.encode('unicode_escape').decode(), root)
+  ]
+  exec_hive_file(config, write_client_script(config, 'create_%s.hql' % (table), \
+    ';\n'.join(statements) + ';\n'))
+  if partition_columns:
+    register_partitions(config, table, root)
+
+def source_tagged_chunks(files, header_lines=0, delimiter=NORMALIZED_DELIMITER):
+  """
+  Yields the normalized rows (see normalized_chunks()) of several data files given as (local path,
+  path in the data directory) tuples, with the path in the data directory prepended to each row as
+  its first value.
+  """
+  separator = delimiter.encode()
+  for path, rel_path in files:
+    prefix = rel_path.encode() + separator
+    for chunk in normalized_chunks(path, header_lines, delimiter):
+      # Every chunk ends with a newline, after which no row follows
+      yield prefix + chunk.replace(b'\n', b'\n' + prefix)[:-len(prefix)]
+
+def compact_files(config, directory, files, header_lines=0, block_size=COMPACT_BLOCK_SIZE, \
+  delimiter=NORMALIZED_DELIMITER):
+  """
+  Streams the rows of several data files (see source_tagged_chunks()) into container files named
+  part-00000, part-00001, ... in an HDFS directory. A container is closed before it would grow
+  beyond the block size. Returns the number of containers written.
+  """
+  chunks = source_tagged_chunks(files, header_lines, delimiter)
+  pending = [next(chunks, None)]
+  def container():
+    size = 0
+    while pending[0] is not None and (size == 0 or size + len(pending[0]) <= block_size):
+      yield pending[0]
+      size += len(pending[0])
+      pending[0] = next(chunks, None)
+  containers = 0
+  while pending[0] is not None:
+    hdfs_put_stream(config, '%s/part-%05d' % (directory, containers), container(), \
+      {'dfs.blocksize': block_size})
+    containers += 1
+  return containers
+
+def ingest_compacted(config, table, columns=None, partition_pattern=None, header_lines=0, \
+  root=COMPACTED_ROOT, block_size=COMPACT_BLOCK_SIZE, delimiter=NORMALIZED_DELIMITER, workers=4):
+  """
+  Ingests many small data files packed into container files of up to one HDFS block each, so the
+  name node tracks a few large files and hive runs one map task per block instead of one per file.
+  The rows are normalized as by ingest_normalized(), and each row starts with a source_file column
+  holding the path of its original file in the data directory (in place of INPUT__FILE__NAME). If
+  a partition pattern is given, the files of each partition are packed into its partition
+  directory. An external delimited table with the source_file column followed by the data columns
+  is (re)created over the containers. Prints the file and block counts before and after. Files left
+  under root by an earlier ingest are removed first (see prepare_ingest_root()).
+  """
+  groups = collections.OrderedDict()
+  if partition_pattern:
+    for src, dst in plan_partition_layout(config.data_dir, partition_pattern, root):
+      rel_path = src[len('/data/'):]
+      groups.setdefault(dst.rsplit('/', 1)[0], []).append((os.path.join(config.data_dir, \
+        *rel_path.split('/')), rel_path))
+    partition_columns = [_n for _n, _i in sorted(re.compile(partition_pattern).groupindex.items(), \
+      key=lambda _g: _g[1])]
+  else:
+    for _dir, _dirs, _files in os.walk(config.data_dir):
+      for name in sorted(_files):
+        _f = os.path.join(_dir, name)
+        groups.setdefault(root.rstrip('/'), []).append((_f, \
+          os.path.relpath(_f, config.data_dir).replace(os.sep, '/')))
+    partition_columns = []
+  files = [_f for _g in groups.values() for _f in _g]
+  if not files:
+    print('No data files to ingest.')
+    return
+  columns = columns or infer_text_columns(files[0][0], header_lines)
+  # Leftover containers of an earlier, larger ingest would be read as well
+  if not prepare_ingest_root(config, root):
+    return
+  for directory in groups.keys():
+    if webhdfs_request(config, directory, 'MKDIRS', method='PUT') is None:
+      print('Could not create directory "%s".' % (directory))
+      return
+  _start = time.time()
+  with concurrent.futures.ThreadPoolExecutor(max_workers=workers) as executor:
+    containers = sum(executor.map(lambda _g: compact_files(config, _g[0], _g[1], header_lines, \
+      block_size, delimiter), groups.items()))
+  sizes = [os.path.getsize(_f) for _f, _rel in files]
+  compacted = hdfs_list_files(config, root) or []
+  print('Compacted %d files (%d blocks) into %d files (%d blocks) under %s in %fs.' % \
+    (len(files), count_blocks(sizes, block_size), containers, \
+    sum(count_blocks([_f['length']], _f['blockSize']) for _f in compacted), root, \
+    time.time() - _start))
+  print_ingest_summary(config, root)
+  create_delimited_table(config, table, [('source_file', 'STRING')] + columns, \
+    partition_columns, root, delimiter)
+
+class DistinctSketch:
+  """
+  A k minimum values sketch which estimates the number of distinct values it was given from the k
+  smallest 64 bit value hashes. Sketches of different files merge into the sketch of their union.
+  """
+  def __init__(self, hashes=None, size=PROFILE_SKETCH_SIZE):
+    self.size = size
+    # A max heap (of negated hashes) of the smallest hashes, and the same hashes as a set
+    self._heap = []
+    self._hashes = set()
+    for _h in hashes or []:
+      self.add_hash(_h)
+
+  def add(self, value):
+    """
+    Adds a value (bytes).
+    """
+    self.add_hash(int.from_bytes(hashlib.blake2b(value, digest_size=8).digest(), 'big'))
+
+  def add_hash(self, value_hash):
+    """
+    Adds the hash of a value.
+    """
+    if value_hash in self._hashes:
+      return
+    if len(self._heap) < self.size:
+      heapq.heappush(self._heap, -value_hash)
+      self._hashes.add(value_hash)
+    elif value_hash < -self._heap[0]:
+      self._hashes.discard(-heapq.heapreplace(self._heap, -value_hash))
+      self._hashes.add(value_hash)
+
+  def merge(self, other):
+    """
+    Adds the hashes of another sketch.
+    """
+    for _h in other.hashes():
+      self.add_hash(_h)
+
+  def hashes(self):
+    """
+    Lists the kept hashes.
+    """
+    return sorted(self._hashes)
+
+  def estimate(self):
+    """
+    Estimates the number of distinct values.
+    """
+    if len(self._heap) < self.size:
+      return len(self._heap)
+    return int((self.size - 1) * float(1 << 64) / (-self._heap[0] + 1))
+
+def new_field_profile():
+  """
+  Creates an empty profile of one parsed column of a data file.
+  """
+  return {'count': 0, 'missing': 0, 'non_numeric': 0, 'min': None, 'max': None, \
+    'total_length': 0, 'max_length': 0, 'sketch': []}
+
+class DataFileProfiler:
+  """
+  Profiles the rows of a text data file from chunks of its bytes, so a file is profiled while it is
+  being copied. The first header_lines lines are left out, and each row is split into columns by
+  the delimiter (runs of whitespace if None). The profile (see result()) has the row count, the row
+  bytes and the longest row, a distinct row sketch, and per column the rows having it, the rows
+  missing it, the values which are not numbers, the numeric min and max, the total and longest
+  value length and a distinct value sketch (see DistinctSketch).
+  """
+  def __init__(self, header_lines=0, delimiter=None):
+    self.header_lines = header_lines
+    self.delimiter = delimiter
+    self._lines = 0
+    # The start of a line continued in the next chunk
+    self._partial = b''
+    self._profile = {'rows': 0, 'bytes': 0, 'max_row_length': 0}
+    self._row_sketch = DistinctSketch()
+    self._fields = []
+    self._sketches = []
+
+  def update(self, chunk):
+    """
+    Profiles the lines completed by the next chunk of the file.
+    """
+    lines = (self._partial + chunk).split(b'\n')
+    self._partial = lines.pop()
+    for line in lines:
+      self._add_line(line)
+
+  def _add_line(self, line):
+    self._lines += 1
+    if self._lines <= self.header_lines:
+      return
+    profile = self._profile
+    row = line.rstrip(b'\r')
+    profile['rows'] += 1
+    profile['bytes'] += len(row)
+    profile['max_row_length'] = max(profile['max_row_length'], len(row))
+    self._row_sketch.add(row)
+    values = row.split(self.delimiter.encode()) if self.delimiter else row.split()
+    while len(self._fields) < len(values):
+      self._fields.append(new_field_profile())
+      # Rows seen so far did not have the new column
+      self._fields[-1]['missing'] = profile['rows'] - 1
+      self._sketches.append(DistinctSketch())
+    for field, sketch, value in zip(self._fields, self._sketches, values):
+      field['count'] += 1
+      field['total_length'] += len(value)
+      field['max_length'] = max(field['max_length'], len(value))
+      sketch.add(value)
+      try:
+        number = float(value)
+      except ValueError:
+        field['non_numeric'] += 1
+        continue
+      field['min'] = number if field['min'] is None else min(field['min'], number)
+      field['max'] = number if field['max'] is None else max(field['max'], number)
+    for field in self._fields[len(values):]:
+      field['missing'] += 1
+
+  def result(self):
+    """
+    Profiles a last line without a line ending and returns the profile of the file.
+    """
+    if self._partial:
+      self._add_line(self._partial)
+      self._partial = b''
+    profile = dict(self._profile)
+    profile['row_sketch'] = self._row_sketch.hashes()
+    profile['fields'] = [dict(_f, sketch=_s.hashes()) for _f, _s in \
+      zip(self._fields, self._sketches)]
+    return profile
+
+def profiled_chunks(path, profiler, chunk_size=1048576):
+  """
+  Reads a file and yields its bytes unchanged in chunks of chunk_size bytes, passing each chunk to
+  the profiler (see DataFileProfiler) on the way.
+  """
+  with open(path, 'rb') as _fp:
+    for chunk in iter(lambda: _fp.read(chunk_size), b''):
+      profiler.update(chunk)
+      yield chunk
+
+def merge_profiles(profiles):
+  """
+  Merges the profiles of several data files (see DataFileProfiler) into the profile of all of their
+  rows.
+  """
+  merged = {'rows': 0, 'bytes': 0, 'max_row_length': 0, 'fields': []}
+  row_sketch = DistinctSketch()
+  sketches = []
+  for profile in profiles:
+    merged['rows'] += profile['rows']
+    merged['bytes'] += profile['bytes']
+    merged['max_row_length'] = max(merged['max_row_length'], profile['max_row_length'])
+    row_sketch.merge(DistinctSketch(profile['row_sketch']))
+    while len(merged['fields']) < len(profile['fields']):
+      merged['fields'].append(new_field_profile())
+      merged['fields'][-1]['missing'] = merged['rows'] - profile['rows']
+      sketches.append(DistinctSketch())
+    for field, sketch, other in zip(merged['fields'], sketches, profile['fields']):
+      for key in ['count', 'missing', 'non_numeric', 'total_length']:
+        field[key] += other[key]
+      field['max_length'] = max(field['max_length'], other['max_length'])
+      for key, pick in [('min', min), ('max', max)]:
+        if other[key] is not None:
+          field[key] = other[key] if field[key] is None else pick(field[key], other[key])
+      sketch.merge(DistinctSketch(other['sketch']))
+    for field in merged['fields'][len(profile['fields']):]:
+      field['missing'] += profile['rows']
+  for field, sketch in zip(merged['fields'], sketches):
+    field['sketch'] = sketch.hashes()
+  merged['row_sketch'] = row_sketch.hashes()
+  return merged
+
+def put_profiled_data(config, properties=None, header_lines=0, delimiter=None, workers=4):
+  """
+  Copies the files of the local data directory to the same paths under /data in HDFS, streaming
+  each file through hdfs dfs -put (see hdfs_put_stream()) and profiling the bytes as they are sent
+  (see profiled_chunks()), so every file is read once. The properties are passed to the puts.
+  Files are streamed by several puts at once. Returns a dictionary of the HDFS path of each file to
+  its manifest entry, or None if a directory could not be created.
+  """
+  files = []
+  for root, _dirs, names in os.walk(config.data_dir):
+    for name in sorted(names):
+      _f = os.path.join(root, name)
+      files.append((_f, os.path.relpath(_f, config.data_dir).replace(os.sep, '/')))
+  for directory in sorted(set(('/data/%s' % (_rel)).rsplit('/', 1)[0] for _f, _rel in files)):
+    if webhdfs_request(config, directory, 'MKDIRS', method='PUT') is None:
+      print('Could not create directory "%s".' % (directory))
+      return None
+
+  def put_file(item):
+    path, rel_path = item
+    profiler = DataFileProfiler(header_lines, delimiter)
+    size = hdfs_put_stream(config, '/data/%s' % (rel_path), profiled_chunks(path, profiler), \
+      properties)
+    return '/data/%s' % (rel_path), {'local': rel_path, 'size': size, \
+      'header_lines': header_lines, 'delimiter': delimiter, 'profile': profiler.result()}
+
+  _start = time.time()
+  with concurrent.futures.ThreadPoolExecutor(max_workers=workers) as executor:
+    entries = dict(executor.map(put_file, files))
+  print('Copied and profiled %d files (%s) in %fs.' % (len(entries), \
+    format_bytes(sum(_e['size'] for _e in entries.values())), time.time() - _start))
+  return entries
+
+def save_ingest_manifest(config, entries, moves=None, header_lines=0):
+  """
+  Saves the ingest manifest: the profile of each ingested file (see put_profiled_data()) under its
+  final HDFS path after the partitioning moves, and the merged profile of each HDFS directory.
+  """
+  entries = dict(entries)
+  for src, dst in moves or []:
+    if src in entries:
+      entries[dst] = entries.pop(src)
+  directories = collections.defaultdict(list)
+  for path, entry in entries.items():
+    directories[path.rsplit('/', 1)[0]].append(entry['profile'])
+  manifest = {
+    'ingested': datetime.datetime.now().isoformat(),
+    'header_lines': header_lines,
+    'files': entries,
+    'directories': {_d: merge_profiles(_p) for _d, _p in sorted(directories.items())}
+  }
+  save_state(config, 'ingest', manifest)
+  for directory, profile in manifest['directories'].items():
+    print('%s: %d rows, %s, ~%d distinct rows, %d columns.' % (directory, profile['rows'], \
+      format_bytes(profile['bytes']), DistinctSketch(profile['row_sketch']).estimate(), \
+      len(profile['fields'])))
+
+def m33_file_columns(rel_path):
+  """
+  Derives the columns of the m33_schem view which are constant for a data file: the age from the
+  hmix.a<age> file name (None if the name does not match) and is_peculiar from the directory the
+  file is in (1 for cp, 0 for nocp and -1 otherwise).
+  """
+  match = re.search(r'(hmix\.a)(\d*)', rel_path)
+  age = int(match.group(2)) if match and match.group(2) else None
+  parts = rel_path.split('/')
+  return age, {'nocp': 0, 'cp': 1}.get(parts[-2] if len(parts) > 1 else '', -1)
+
+def m33_parse_row(row):
+  """
+  Parses the wavelength and flam of an m33 data row exactly like the m33_schem view does with
+  split(trim(row_str), '  '). Values which do not cast to a double are NaN (NULL in hive).
+  """
+  data = row.strip(b' ').split(b'  ')
+  values = []
+  for value in (data + [b''])[:2]:
+    try:
+      values.append(float(value))
+    except ValueError:
+      values.append(float('nan'))
+  return values
+
+def _local_preview_chunk(path, rel_path, start, end, limit):
+  """
+  Parses the rows starting within a byte range of an m33 data file (a process pool task of
+  local_preview()). Returns the row count, the bytes parsed, [non-null count, min, max, sum] per
+  column and up to limit sample rows.
+  """
+  # pylint: disable=import-outside-toplevel
+  import numpy
+  age, is_peculiar = m33_file_columns(rel_path)
+  result = {'rows': 0, 'bytes': 0, 'columns': {}, 'sample': []}
+  with open(path, 'rb') as _fp:
+    if os.fstat(_fp.fileno()).st_size == 0:
+      return result
+    with mmap.mmap(_fp.fileno(), 0, access=mmap.ACCESS_READ) as data:
+      header_end = 0
+      for _ in range(M33_HEADER_LINES):
+        newline = data.find(b'\n', header_end)
+        header_end = len(data) if newline < 0 else newline + 1
+      begin = 0 if start == 0 else data.find(b'\n', start - 1) + 1 or len(data)
+      begin = max(begin, header_end)
+      stop = data.find(b'\n', end - 1)
+      stop = len(data) if stop < 0 else stop + 1
+      if begin >= stop:
+        return result
+      block = data[begin:stop]
+  lines = block.count(b'\n') + (0 if block.endswith(b'\n') else 1)
+  values = None
+  # Fast path: every row holds two values separated by exactly two spaces (so splitting on '  '
+  # and on any whitespace agree), and the tokens of the whole block are cast at once
+  buf = numpy.frombuffer(block, dtype=numpy.uint8)
+  blank = (buf == 32) | (buf == 10)
+  token_starts = numpy.flatnonzero(~blank & numpy.concatenate(([True], blank[:-1])))
+  token_ends = numpy.flatnonzero(~blank & numpy.concatenate((blank[1:], [True]))) + 1
+  line_starts = numpy.concatenate(([0], numpy.flatnonzero(buf == 10)[:lines - 1] + 1, \
+    [len(buf)]))
+  if not numpy.any((buf == 9) | (buf == 13)) and \
+    numpy.all(numpy.diff(numpy.searchsorted(token_starts, line_starts)) == 2) and \
+    numpy.all(token_starts[1::2] - token_ends[0::2] == 2):
+    try:
+      values = numpy.array(block.split()).astype(numpy.float64).reshape(-1, 2)
+    except ValueError:
+      values = None
+  if values is None:
+    values = numpy.array([m33_parse_row(_r) for _r in block.split(b'\n')[:lines]], \
+      dtype=numpy.float64).reshape(-1, 2)
+  result['rows'] = len(values)
+  result['bytes'] = len(block)
+  for index, name in enumerate(['wavelength', 'flam']):
+    column = values[:, index][~numpy.isnan(values[:, index])]
+    result['columns'][name] = [len(column), float(column.min()) if len(column) else None, \
+      float(column.max()) if len(column) else None, float(column.sum())]
+  for name, value in [('age_mil', age), ('is_peculiar', is_peculiar)]:
+    result['columns'][name] = [len(values) if value is not None else 0, value, value, \
+      value * len(values) if value is not None else 0]
+  result['sample'] = [(age, None if numpy.isnan(_w) else float(_w), \
+    None if numpy.isnan(_f) else float(_f), is_peculiar) for _w, _f in values[:limit]]
+  return result
+
+def local_preview(config, path=None, workers=None, limit=10, chunk_size=LOCAL_PREVIEW_CHUNK_SIZE):
+  """
+  Runs the m33_schem transformation (see examples/src/hive/create_m33_schem_view.hql) over the
+  files of the local data directory, or a path within it, without the cluster: the header lines are
+  skipped, each row is split into the wavelength and flam doubles, the age comes from the file
+  name and is_peculiar from the directory. The files are memory-mapped and split into chunks which
+  a process pool parses with NumPy. Prints the rows per second, a profile of each column (as the
+  view would return them) and sample rows. Requires numpy.
+  """
+  # Checked before the process pool starts, where every task would fail instead
+  try:
+    importlib.import_module('numpy')
+  except ImportError:
+    print('local-preview requires numpy. Install it with "pipenv install" or "pip install numpy".')
+    return None
+  root = os.path.join(config.data_dir, path) if path else config.data_dir
+  if not os.path.exists(root):
+    print('Path %s does not exist.' % (root))
+    return None
+  files = [root] if os.path.isfile(root) else \
+    [os.path.join(_r, _f) for _r, _d, _fs in os.walk(root) for _f in _fs]
+  tasks = []
+  for _f in sorted(files):
+    rel_path = os.path.relpath(_f, config.data_dir).replace(os.sep, '/')
+    size = os.path.getsize(_f)
+    for start in range(0, max(size, 1), int(chunk_size)):
+      tasks.append((_f, rel_path, start, min(start + int(chunk_size), size), limit))
+  if not tasks:
+    print('No data files found in %s.' % (root))
+    return None
+  _start = time.time()
+  with concurrent.futures.ProcessPoolExecutor(max_workers=workers) as executor:
+    results = list(executor.map(_local_preview_chunk, *zip(*tasks)))
+  seconds = time.time() - _start
+  rows = sum(_r['rows'] for _r in results)
+  parsed = sum(_r['bytes'] for _r in results)
+  columns = collections.OrderedDict()
+  for name in ['age_mil', 'wavelength', 'flam', 'is_peculiar']:
+    stats = [_r['columns'][name] for _r in results if _r['rows']]
+    count = sum(_s[0] for _s in stats)
+    columns[name] = {
+      'non_null': count,
+      'nulls': rows - count,
+      'min': min((_s[1] for _s in stats if _s[0]), default=None),
+      'max': max((_s[2] for _s in stats if _s[0]), default=None),
+      'mean': sum(_s[3] for _s in stats) / count if count else None
+    }
+  print('Parsed %d rows from %d files (%s) in %fs: %d rows/s, %s/s.' % (rows, \
+    len(set(_t[0] for _t in tasks)), format_bytes(parsed), seconds, rows / max(seconds, 1e-9), \
+    format_bytes(parsed / max(seconds, 1e-9))))
+  print('%-12s %12s %8s %16s %16s %16s' % ('COLUMN', 'NON-NULL', 'NULLS', 'MIN', 'MAX', 'MEAN'))
+  for name, stats in columns.items():
+    print('%-12s %12d %8d %16s %16s %16s' % (name, stats['non_null'], stats['nulls'], \
+      *('%.6g' % (stats[_k]) if stats[_k] is not None else 'NULL' for _k in ['min', 'max', \
+      'mean'])))
+  sample = [_row for _r in results for _row in _r['sample']][:limit]
+  for row in sample:
+    print('\t'.join('NULL' if _v is None else str(_v) for _v in row))
+  return {'rows': rows, 'bytes': parsed, 'seconds': seconds, 'columns': columns, \
+    'sample': sample}
 
 def copy_source(config):
   """
@@ -236,39 +1625,462 @@ def setup_hive(config):
   exec_docker(config, 'nn1', fs_cmd + '-mkdir -p /user/hive/warehouse', check=False)
   exec_docker(config, 'nn1', fs_cmd + '-chmod g+w /tmp')
   exec_docker(config, 'nn1', fs_cmd + '-chmod g+w /user/hive/warehouse')
-  exec_docker(config, 'hs', '%s/bin/schematool -dbType derby -initSchema' % \
-    (HIVE_HOME), workdir='/metastore')
+  if config.metastore == 'mssql':
+    wait_for_sql(config)
+    print('Creating metastore database.')
+    subprocess.run(docker_exec_args(config, 'client', sqlcmd_args() + ['-Q', \
+      "IF DB_ID('%s') IS NULL CREATE DATABASE %s" % (METASTORE_DATABASE, METASTORE_DATABASE)]), \
+      check=True)
+    subprocess.run(docker_exec_args(config, 'hs', ['%s/bin/schematool' % (HIVE_HOME), \
+      '-dbType', 'mssql', '-initSchema', \
+      '-url', metastore_jdbc_url(), \
+      '-driver', 'com.microsoft.sqlserver.jdbc.SQLServerDriver', \
+      '-userName', 'sa', \
+      '-passWord', SQL_TEST_PASSWORD]), check=True)
+  else:
+    exec_docker(config, 'hs', '%s/bin/schematool -dbType derby -initSchema' % \
+      (HIVE_HOME), workdir='/metastore')
+
+def metastore_jdbc_url():
+  """
+  Gets the jdbc url of the metastore database on the sql node.
+  """
+  return 'jdbc:sqlserver://sql:1433;databaseName=%s' % (METASTORE_DATABASE)
+
+def metastore_hiveconf():
+  """
+  Builds the --hiveconf arguments pointing the metastore service at the database on the sql node.
+  The sql server jdbc driver is already on the hadoop classpath (share/hadoop/yarn/lib).
+  """
+  properties = [
+    ('javax.jdo.option.ConnectionURL', metastore_jdbc_url()),
+    ('javax.jdo.option.ConnectionDriverName', 'com.microsoft.sqlserver.jdbc.SQLServerDriver'),
+    ('javax.jdo.option.ConnectionUserName', 'sa'),
+    ('javax.jdo.option.ConnectionPassword', SQL_TEST_PASSWORD),
+    ('hive.metastore.port', str(METASTORE_PORT)),
+  ]
+  _args = []
+  for name, value in properties:
+    _args.extend(['--hiveconf', '%s=%s' % (name, value)])
+  return _args
+
+def wait_for_sql(config, timeout=120, interval=5):
+  """
+  Blocks until the sql node accepts logins. Returns whether it did before the timeout.
+  """
+  for _t in range(int(timeout / interval)):
+    result = subprocess.run(docker_exec_args(config, 'client', sqlcmd_args() + ['-l', '5', \
+      '-Q', 'SELECT 1']), stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    if result.returncode == 0:
+      return True
+    print('...Waiting for sql node...')
+    time.sleep(interval)
+  print('SQL node did not accept logins after %ds.' % (timeout))
+  return False
+
+def wait_for_port(config, node_name, port, timeout=120, interval=2):
+  """
+  Blocks until something listens on a port of a node. Returns whether it did before the timeout.
+  """
+  for _t in range(int(timeout / interval)):
+    result = subprocess.run(docker_exec_args(config, node_name, ['bash', '-c', \
+      'echo > /dev/tcp/localhost/%d' % (port)]), stdout=subprocess.DEVNULL, \
+      stderr=subprocess.DEVNULL)
+    if result.returncode == 0:
+      return True
+    time.sleep(interval)
+  print('Nothing is listening on %s:%d after %ds.' % (node_name, port, timeout))
+  return False
 
 def cluster_up(config):
   """
   Boots the cluster up but does not run any of the daemons.
   """
-  set_environment(config)
-  os.system('docker-compose -p %s -f "%s" up -d' % (config.project_name, COMPOSE_FILE))
+  allocate_ports(config)
+  unpause_suspended(config)
+  compose_command(config, 'up -d')
+
+def detect_host_resources():
+  """
+  Detects the number of cpus and the memory in MB available to docker containers. Docker is asked
+  first since on Windows and Mac the containers run in a virtual machine smaller than the host.
+  """
+  try:
+    output = subprocess.run(['docker', 'info', '--format', '{{.NCPU}} {{.MemTotal}}'], \
+      stdout=subprocess.PIPE, universal_newlines=True, check=True)
+    cpus, memory = output.stdout.split()
+    return int(cpus), int(memory) // 1048576
+  except (OSError, ValueError, subprocess.CalledProcessError):
+    pass
+  try:
+    memory = os.sysconf('SC_PAGE_SIZE') * os.sysconf('SC_PHYS_PAGES') // 1048576
+  except (AttributeError, ValueError, OSError):
+    memory = 8192
+  return os.cpu_count() or 1, memory
+
+def plan_resources(host_cpus, host_memory_mb, workers=NUM_NODE_MANAGERS):
+  """
+  Sizes the node manager resources, container sizes and uber mode thresholds for the host. The
+  memory left over after the reserved memory is split between the node managers, and containers
+  are sized so that each node manager can run about one map task per vcore. Uber jobs run all of
+  their tasks one after another in the application master, so the uber mode threshold is a quarter
+  of the application master heap, up to UBER_MAX_BYTES_LIMIT.
+  """
+  reserved = min(RESERVED_MEMORY_MB, host_memory_mb // 2)
+  node_memory = max((host_memory_mb - reserved) // workers, 2048)
+  # One cpu is left to the master daemons on anything bigger than a laptop
+  node_vcores = max((host_cpus - 1 if host_cpus > 2 else host_cpus) // workers, 1)
+  min_allocation = 512 if node_memory <= 8192 else 1024
+  map_memory = max(min(node_memory // node_vcores, 4096) // min_allocation * min_allocation, \
+    min_allocation)
+  reduce_memory = min(map_memory * 2, node_memory)
+  # Uber tasks run inside the application master, so it must fit the largest task
+  am_memory = max(map_memory, reduce_memory)
+  return ResourcePlan(host_cpus=host_cpus, host_memory_mb=host_memory_mb, workers=workers, \
+    node_memory_mb=node_memory, node_vcores=node_vcores, min_allocation_mb=min_allocation, \
+    map_memory_mb=map_memory, reduce_memory_mb=reduce_memory, am_memory_mb=am_memory, \
+    uber_max_bytes=min(int(am_memory * CONTAINER_HEAP_RATIO) * 1048576 // 4, UBER_MAX_BYTES_LIMIT))
+
+def resource_plan_properties(plan):
+  """
+  Converts a resource plan to a dictionary of hadoop configuration file name to properties.
+  """
+  def heap(memory_mb):
+    return '-Xmx%dm' % (int(memory_mb * CONTAINER_HEAP_RATIO))
+  return {
+    'yarn-site.xml': collections.OrderedDict([
+      ('yarn.nodemanager.resource.memory-mb', plan.node_memory_mb),
+      ('yarn.nodemanager.resource.cpu-vcores', plan.node_vcores),
+      ('yarn.nodemanager.vmem-check-enabled', 'false'),
+      ('yarn.scheduler.minimum-allocation-mb', plan.min_allocation_mb),
+      ('yarn.scheduler.maximum-allocation-mb', plan.node_memory_mb),
+      ('yarn.scheduler.maximum-allocation-vcores', plan.node_vcores)
+    ]),
+    'mapred-site.xml': collections.OrderedDict([
+      ('mapreduce.map.memory.mb', plan.map_memory_mb),
+      ('mapreduce.map.java.opts', heap(plan.map_memory_mb)),
+      ('mapreduce.reduce.memory.mb', plan.reduce_memory_mb),
+      ('mapreduce.reduce.java.opts', heap(plan.reduce_memory_mb)),
+      ('yarn.app.mapreduce.am.resource.mb', plan.am_memory_mb),
+      ('yarn.app.mapreduce.am.command-opts', heap(plan.am_memory_mb)),
+      ('mapreduce.job.ubertask.enable', 'true'),
+      ('mapreduce.job.ubertask.maxmaps', 9),
+      ('mapreduce.job.ubertask.maxreduces', 1),
+      ('mapreduce.job.ubertask.maxbytes', plan.uber_max_bytes)
+    ])
+  }
+
+def print_resource_plan(plan):
+  """
+  Prints a resource plan.
+  """
+  print('Host resources: %d cpus, %dMB memory, %d node manager(s).' % \
+    (plan.host_cpus, plan.host_memory_mb, plan.workers))
+  print('Node manager resources: %d vcores, %dMB memory (containers of %dMB to %dMB).' % \
+    (plan.node_vcores, plan.node_memory_mb, plan.min_allocation_mb, plan.node_memory_mb))
+  print('Map tasks: %dMB, reduce tasks: %dMB, application master: %dMB, heap ratio: %.2f.' % \
+    (plan.map_memory_mb, plan.reduce_memory_mb, plan.am_memory_mb, CONTAINER_HEAP_RATIO))
+  print('Concurrent map tasks per node manager: %d. Uber mode for jobs up to %s.' % \
+    (min(plan.node_memory_mb // plan.map_memory_mb, plan.node_vcores), \
+    format_bytes(plan.uber_max_bytes)))
+
+def merge_site_properties(site_xml, properties):
+  """
+  Sets properties in the text of a hadoop *-site.xml file, keeping every other property.
+  """
+  root = xml.etree.ElementTree.fromstring(site_xml)
+  existing = {_p.findtext('name'): _p for _p in root.findall('property')}
+  for name, value in properties.items():
+    prop = existing.get(name)
+    if prop is None:
+      prop = xml.etree.ElementTree.SubElement(root, 'property')
+      xml.etree.ElementTree.SubElement(prop, 'name').text = name
+      xml.etree.ElementTree.SubElement(prop, 'value')
+    prop.find('value').text = str(value)
+  return '<?xml version="1.0"?>\n%s\n' % (xml.etree.ElementTree.tostring(root, \
+    encoding='unicode'))
+
+def update_site_properties(config, filename, properties, nodes=None):
+  """
+  Sets properties in a hadoop configuration file on every hadoop node of the running cluster.
+  Returns the new text of the file.
+  """
+  path = '%s/etc/hadoop/%s' % (HADOOP_HOME, filename)
+  nodes = nodes or HADOOP_NODES
+  output = subprocess.run(docker_exec_args(config, nodes[0], ['cat', path]), \
+    stdout=subprocess.PIPE, universal_newlines=True, check=True)
+  site_xml = merge_site_properties(output.stdout, properties)
+  for node in nodes:
+    subprocess.run(docker_exec_args(config, node, ['sh', '-c', 'cat > %s' % (path)], \
+      keep_stdin=True), input=site_xml, universal_newlines=True, check=True)
+  return site_xml
+
+def site_file_edited(config, filename, state):
+  """
+  Checks whether a hadoop configuration file has local edits which sizing would overwrite: changes
+  to the shipped file in ./bin/ not committed to git, or changes on the nodes to the file as shipped
+  or as last written by size_resources() (whose hashes are kept in the sizing state).
+  """
+  local = os.path.join(ROOT_DIR, 'bin', os.path.basename(HADOOP_HOME), 'etc', 'hadoop', filename)
+  try:
+    if subprocess.run(['git', '-C', ROOT_DIR, 'diff', '--quiet', 'HEAD', '--', local], \
+      stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL).returncode == 1:
+      return True
+  except OSError:
+    pass
+  known = [state.get(filename)]
+  if os.path.exists(local):
+    with open(local, 'r') as _fp:
+      known.append(hashlib.sha256(_fp.read().encode('utf-8')).hexdigest())
+  output = subprocess.run(docker_exec_args(config, HADOOP_NODES[0], ['cat', '%s/etc/hadoop/%s' % \
+    (HADOOP_HOME, filename)]), stdout=subprocess.PIPE, universal_newlines=True, check=True)
+  return hashlib.sha256(output.stdout.encode('utf-8')).hexdigest() not in known
+
+def size_resources(config, force=False):
+  """
+  Sizes the YARN and MapReduce resources for the host and writes them to the hadoop configuration
+  of the running cluster. Daemons pick the sizes up when they are (re)started. Files with local
+  edits (see site_file_edited()) are left alone unless forced, so hand-tuned settings survive.
+  Prints which files were written.
+  """
+  plan = plan_resources(*detect_host_resources())
+  print_resource_plan(plan)
+  state = load_state(config, 'sizing')
+  written = []
+  for filename, properties in resource_plan_properties(plan).items():
+    if not force and site_file_edited(config, filename, state):
+      print('Leaving %s as is since it has local edits (use size-resources --force to size it' \
+        ' anyway).' % (filename))
+      continue
+    state[filename] = hashlib.sha256(update_site_properties(config, filename, properties) \
+      .encode('utf-8')).hexdigest()
+    written.append(filename)
+  save_state(config, 'sizing', state)
+  if written:
+    print('Wrote the sized properties to %s in %s/etc/hadoop on every hadoop node.' % \
+      (', '.join(written), HADOOP_HOME))
+  return plan
+
+def start_daemon(config, name, extra_args=None, detached=False, workdir=None):
+  """
+  Starts a daemon (see HADOOP_DAEMONS) on its node with gc logging and its configured jvm options.
+  """
+  daemon = next(_d for _d in HADOOP_DAEMONS if _d.name == name)
+  options = ' '.join([GC_LOG_OPTIONS % (name), config.jvm_options.get(name, '')]).strip()
+  # The jvm only warns and runs without gc logging if the directory is missing
+  subprocess.run(docker_exec_args(config, daemon.node_name, ['mkdir', '-p', GC_LOG_DIR]), \
+    check=True)
+  subprocess.run(docker_exec_args(config, daemon.node_name, daemon.start_args + \
+    (extra_args or []), workdir=workdir, detached=detached, env={daemon.opts_var: options}), \
+    check=True)
 
 def start_hadoop_daemons(config):
   """
   Runs all daemons in the hadoop distribution on their respective nodes.
   """
-  exec_docker(config, 'nn1', '%s/bin/hdfs --daemon start namenode' % (HADOOP_HOME))
-  exec_docker(config, 'dn1', '%s/bin/hdfs --daemon start datanode' % (HADOOP_HOME))
-  exec_docker(config, 'rman', '%s/bin/yarn --daemon start resourcemanager' % (HADOOP_HOME))
-  exec_docker(config, 'nm1', '%s/bin/yarn --daemon start nodemanager' % (HADOOP_HOME))
-  exec_docker(config, 'mrhist', '%s/bin/mapred --daemon start historyserver' % (HADOOP_HOME))
+  for name in ['namenode', 'datanode', 'resourcemanager', 'nodemanager', 'historyserver']:
+    start_daemon(config, name)
+
+def start_hive_server(config, names=None):
+  """
+  Starts the hive server daemon. With the mssql metastore, a standalone metastore service is
+  started first and the hive server connects to it, so that any number of sessions can access
+  metadata concurrently. If names are given, only those of the two daemons are started.
+  """
+  names = names or ['metastore', 'hiveserver2']
+  if config.metastore == 'mssql':
+    if 'metastore' in names:
+      wait_for_sql(config)
+      start_daemon(config, 'metastore', metastore_hiveconf(), detached=True, workdir='/metastore')
+      wait_for_port(config, 'hs', METASTORE_PORT)
+    if 'hiveserver2' in names:
+      start_daemon(config, 'hiveserver2', ['--hiveconf', 'hive.metastore.uris=thrift://hs:%d' % \
+        (METASTORE_PORT)], detached=True, workdir='/metastore')
+  elif 'hiveserver2' in names:
+    start_daemon(config, 'hiveserver2', detached=True, workdir='/metastore')
+
+def cluster_daemons(config):
+  """
+  Lists the names of the daemons (see HADOOP_DAEMONS) the cluster runs. The standalone metastore
+  only runs with the mssql metastore.
+  """
+  return [_d.name for _d in HADOOP_DAEMONS if _d.name != 'metastore' or config.metastore == 'mssql']
+
+def running_daemons(config):
+  """
+  Lists the names of the daemons (see HADOOP_DAEMONS) whose jvms are running, from jps on each of
+  their nodes.
+  """
+  running = []
+  for node in sorted(set(_d.node_name for _d in HADOOP_DAEMONS)):
+    output = subprocess.run(docker_exec_args(config, node, ['%s/bin/jps' % (JAVA_HOME), '-lm']), \
+      stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, universal_newlines=True)
+    if output.returncode != 0:
+      continue
+    running.extend(_d.name for _d in HADOOP_DAEMONS \
+      if _d.node_name == node and _d.main_class in output.stdout)
+  return running
+
+def compose_command(config, command):
+  """
+  Runs a docker-compose command on the project's containers.
+  """
+  set_environment(config)
+  return os.system('docker-compose -p %s -f "%s" %s' % (config.project_name, COMPOSE_FILE, \
+    command))
+
+def suspend(config, mode='pause'):
+  """
+  Suspends the cluster without removing its containers, so that resume() brings it back in seconds
+  instead of recreating the containers and cold starting every daemon. In pause mode the processes
+  of every container are frozen and keep their memory, so the daemons resume where they left off.
+  In stop mode the containers are stopped, which frees their memory, and resume() starts the
+  daemons again in the existing containers.
+  """
+  if mode not in SUSPEND_MODES:
+    raise ValueError('Unknown suspend mode "%s". Use one of: %s.' % (mode, \
+      ', '.join(SUSPEND_MODES)))
+  _start = time.time()
+  print('Suspending cluster (%s).' % (mode))
+  if compose_command(config, mode) != 0:
+    print('Could not suspend the cluster.')
+    return
+  save_state(config, 'suspend', {'mode': mode, 'suspended': datetime.datetime.now().isoformat()})
+  print('Cluster suspended in %fs. Run resume to bring it back.' % (time.time() - _start))
+
+def resume(config, wait=True, timeout=200):
+  """
+  Resumes a cluster suspended by suspend(). Only the daemons which are no longer running (see
+  running_daemons()) are started, then the cluster is checked for health.
+  """
+  state = load_state(config, 'suspend')
+  if not state:
+    print('The cluster is not suspended.')
+    return
+  _start = time.time()
+  print('Resuming cluster (%s).' % (state['mode']))
+  if compose_command(config, 'unpause' if state['mode'] == 'pause' else 'start') != 0:
+    print('Could not resume the cluster. Use stop and then start instead.')
+    return
+  os.remove(state_path(config, 'suspend'))
+  running = running_daemons(config)
+  missing = [_n for _n in cluster_daemons(config) if _n not in running]
+  if missing:
+    print('Starting daemons which are not running: %s.' % (', '.join(missing)))
+    for daemon in HADOOP_DAEMONS:
+      if daemon.name in missing and daemon.name not in ['metastore', 'hiveserver2']:
+        # The pid file left by the stopped container may name an unrelated process by now
+        subprocess.run(docker_exec_args(config, daemon.node_name, ['sh', '-c', \
+          'rm -f /tmp/*-%s.pid' % (daemon.name)]), check=False)
+        start_daemon(config, daemon.name)
+    if 'metastore' in missing or 'hiveserver2' in missing:
+      start_hive_server(config, missing)
+  else:
+    print('All daemons are still running.')
+  if wait:
+    wait_for_healthy_nodes_print(config, timeout)
+  print('Cluster resumed in %fs.' % (time.time() - _start))
 
-def start_hive_server(config):
+def unpause_suspended(config):
   """
-  Starts the hive server daemon.
+  Unpauses the containers of a cluster suspended in pause mode, since paused containers can be
+  neither recreated nor removed, and forgets the suspension.
   """
-  exec_docker(config, 'hs', '%s/bin/hiveserver2' % (HIVE_HOME), \
-    detached=True, workdir='/metastore')
+  if not os.path.exists(state_path(config, 'suspend')):
+    return
+  if load_state(config, 'suspend').get('mode') == 'pause':
+    compose_command(config, 'unpause')
+  os.remove(state_path(config, 'suspend'))
 
 def cluster_down(config):
   """
   Spins the cluster down.
   """
-  set_environment(config)
-  os.system('docker-compose -p %s -f "%s" down' % (config.project_name, COMPOSE_FILE))
+  unpause_suspended(config)
+  compose_command(config, 'down')
+
+def port_base(config):
+  """
+  Gets the port base of the project: the configured one, or the one picked by allocate_ports().
+  """
+  if config.port_base != 'auto':
+    return config.port_base
+  return load_state(config, 'ports').get('base', DEFAULT_PORT_BASE)
+
+def host_port(config, port):
+  """
+  Gets the localhost port a node port (one of the PORT_* offsets) is exposed on.
+  """
+  return port_base(config) + port
+
+def ports_free(base):
+  """
+  Checks whether all node ports from a port base are free on the host.
+  """
+  for port, _ in PORT_ENV_VARS:
+    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as _s:
+      try:
+        _s.bind(('', base + port))
+      except OSError:
+        return False
+  return True
+
+@contextlib.contextmanager
+def port_reservations_lock(timeout=60):
+  """
+  Holds the lock on the port reservations, which is exclusive across processes, for the duration
+  of a with block.
+  """
+  _start = time.time()
+  while True:
+    try:
+      os.close(os.open(PORT_RESERVATIONS_LOCK, os.O_CREAT | os.O_EXCL | os.O_WRONLY))
+      break
+    except FileExistsError:
+      if time.time() - _start >= timeout:
+        raise RuntimeError('Could not lock the port reservations within %ds. Remove "%s" if no' \
+          ' other playground process is running.' % (timeout, PORT_RESERVATIONS_LOCK))
+      time.sleep(0.1)
+  try:
+    yield
+  finally:
+    os.remove(PORT_RESERVATIONS_LOCK)
+
+def allocate_ports(config):
+  """
+  Picks the port base for a cluster about to boot if the project uses automatic ports. The
+  previous base is kept while its ports are free (or the cluster already runs on them), so the
+  urls of a project only change when another process took its ports. The base is picked and
+  reserved under a lock (see PORT_RESERVATIONS_FILE), so clusters booting at the same time never
+  pick the same ports.
+  """
+  if config.port_base != 'auto':
+    return config.port_base
+  with port_reservations_lock():
+    reservations = {}
+    if os.path.exists(PORT_RESERVATIONS_FILE):
+      with open(PORT_RESERVATIONS_FILE, 'r') as _fp:
+        reservations = json.load(_fp)
+    now = time.time()
+    reservations = {_p: _r for _p, _r in reservations.items() \
+      if now - _r['time'] < PORT_RESERVATION_SECONDS}
+    reserved = set(_r['base'] for _p, _r in reservations.items() if _p != config.project_name)
+    state = load_state(config, 'ports')
+    base = state.get('base')
+    if base is None or base in reserved or not (ports_free(base) or \
+      gen_docker_health_report(config, 'nn1').is_healthy):
+      base = DEFAULT_PORT_BASE
+      while base in reserved or not ports_free(base):
+        base += PORT_BASE_STEP
+        if base + len(PORT_ENV_VARS) > 65535:
+          raise RuntimeError('No free ports found for the cluster.')
+      state['base'] = base
+      save_state(config, 'ports', state)
+      print('Exposing the cluster on ports %d-%d.' % (base, base + len(PORT_ENV_VARS) - 1))
+    reservations[config.project_name] = {'base': base, 'time': now}
+    with open(PORT_RESERVATIONS_FILE, 'w') as _fp:
+      json.dump(reservations, _fp, indent=2)
+  return base
 
 def metric_request(port):
   """
@@ -285,6 +2097,109 @@ def metric_request(port):
   except ValueError:
     return None
 
+def rm_nodes_request(config):
+  """
+  Fetches the node managers known to the resource manager from its REST api. Returns the list of
+  node objects, or None on error.
+  """
+  try:
+    _r = requests.get('http://localhost:%d/ws/v1/cluster/nodes' % \
+      (host_port(config, PORT_OFFSET_RMAN)))
+  except:
+    return None
+  if _r.status_code != 200:
+    return None
+  try:
+    return ((_r.json().get('nodes') or {}).get('node')) or []
+  except ValueError:
+    return None
+
+def webhdfs_request(config, path, op, method='GET', params=None):
+  """
+  Sends a WebHDFS request for an HDFS path to the name node. Returns the parsed json, or None on
+  error. Only metadata operations are supported since data operations redirect to the data nodes,
+  which are not reachable from the host.
+  """
+  _params = {'op': op, 'user.name': 'root'}
+  if params:
+    _params.update(params)
+  try:
+    _r = requests.request(method, 'http://localhost:%d/webhdfs/v1%s' % \
+      (host_port(config, PORT_OFFSET_NN1), path), \
+      params=_params)
+  except:
+    return None
+  if _r.status_code != 200:
+    return None
+  try:
+    return _r.json()
+  except ValueError:
+    return None
+
+def hdfs_path(location):
+  """
+  Strips the scheme and authority from an HDFS location uri such as hdfs://nn1:9000/data.
+  """
+  return urllib.parse.urlparse(location).path or '/'
+
+def hdfs_list_files(config, path):
+  """
+  Recursively lists the files under an HDFS path. Returns a list of WebHDFS FileStatus objects,
+  each with an added 'path' key, or None if the path could not be listed.
+  """
+  jsn = webhdfs_request(config, path, 'LISTSTATUS')
+  if jsn is None:
+    return None
+  files = []
+  for status in jsn['FileStatuses']['FileStatus']:
+    child = '%s/%s' % (path.rstrip('/'), status['pathSuffix']) if status['pathSuffix'] else path
+    if status['type'] == 'DIRECTORY':
+      child_files = hdfs_list_files(config, child)
+      if child_files is None:
+        return None
+      files.extend(child_files)
+    else:
+      status['path'] = child
+      files.append(status)
+  return files
+
+def hdfs_partition_dirs(config, path, prefix=''):
+  """
+  Lists the hive-style partition directories (name=value/...) under an HDFS path. Returns a list of
+  (partition key, HDFS path) tuples for the deepest partition directories.
+  """
+  jsn = webhdfs_request(config, path, 'LISTSTATUS')
+  if jsn is None:
+    return []
+  partitions = []
+  for status in jsn['FileStatuses']['FileStatus']:
+    if status['type'] != 'DIRECTORY' or '=' not in status['pathSuffix']:
+      continue
+    key = prefix + status['pathSuffix']
+    child = '%s/%s' % (path.rstrip('/'), status['pathSuffix'])
+    partitions.extend(hdfs_partition_dirs(config, child, key + '/') or [(key, child)])
+  return partitions
+
+def hdfs_content_size(config, path):
+  """
+  Gets the total number of bytes stored under an HDFS path, or None if it does not exist.
+  """
+  jsn = webhdfs_request(config, path, 'GETCONTENTSUMMARY')
+  if jsn is None:
+    return None
+  return jsn['ContentSummary']['length']
+
+def hdfs_fingerprint(config, path):
+  """
+  Summarizes the files under an HDFS path as [file count, total bytes, latest modification time]
+  so that changes to the path can be detected cheaply. Returns None if the path does not exist.
+  """
+  files = hdfs_list_files(config, path)
+  if files is None:
+    return None
+  return [len(files), sum(_f['length'] for _f in files), \
+    max((_f['modificationTime'] for _f in files), default=0)]
+
 def find_bean_by_name(jsn, nme):
   """
   Extracts a bean of the given name from jmx metrics json object.
@@ -462,16 +2377,97 @@ def gen_docker_health_report(config, node_name):
   else:
     return NodeHealthReport(is_healthy=False, message='\u274C Node not running')
 
+def probe_worker(config, host, json_checker_func):
+  """
+  Probes a worker's own jmx endpoint for details once a master reported it unhealthy. Returns the
+  report message, indented under the worker.
+  """
+  if host not in WORKER_PORTS:
+    return '    No published port to probe %s directly.' % (host)
+  report = gen_node_health_report(metric_request(host_port(config, WORKER_PORTS[host])), \
+    json_checker_func)
+  return '\n'.join('    ' + _l for _l in ('Direct probe of %s:' % (host) + '\n' + \
+    report.message).split('\n'))
+
+def gen_datanodes_report(config, namenode_jsn):
+  """
+  Generates a health report on all data nodes from the LiveNodes and DeadNodes the name node
+  reports, so that a single request covers any number of data nodes. Only data nodes reported
+  unhealthy are probed directly.
+  """
+  bean_name = 'Hadoop:service=NameNode,name=NameNodeInfo'
+  live = extract_bean_prop(namenode_jsn, bean_name, 'LiveNodes') if namenode_jsn else None
+  dead = extract_bean_prop(namenode_jsn, bean_name, 'DeadNodes') if namenode_jsn else None
+  if live is None or dead is None:
+    return NodeHealthReport(is_healthy=False, message='\u274C Could not fetch the data node' \
+      ' reports from the name node.')
+  live = json.loads(live)
+  dead = json.loads(dead)
+  healthy = len(live) >= NUM_DATA_NODES and not dead
+  messages = ['%s %d/%d data nodes live, %d dead.' % ('\u2705' if healthy else '\u274C', \
+    len(live), NUM_DATA_NODES, len(dead))]
+  for name, info in sorted(live.items()):
+    host = name.split(':')[0]
+    problems = []
+    if info.get('lastContact', 0) > DATANODE_STALE_SECONDS:
+      problems.append('last contact %ds ago' % (info['lastContact']))
+    if info.get('volfails', 0):
+      problems.append('%d failed volumes' % (info['volfails']))
+    if info.get('remaining', MIN_DISK_SPACE) < MIN_DISK_SPACE:
+      problems.append('insufficient disk space (%d bytes remaining)' % (info['remaining']))
+    if info.get('adminState', 'In Service') != 'In Service':
+      problems.append('admin state "%s"' % (info['adminState']))
+    if problems:
+      healthy = False
+      messages.append('\u274C %s: %s' % (host, ', '.join(problems)))
+      messages.append(probe_worker(config, host, json_checker_datanode))
+    else:
+      messages.append('\u2705 %s: live' % (host))
+  for name in sorted(dead):
+    host = name.split(':')[0]
+    messages.append('\u274C %s: dead' % (host))
+    messages.append(probe_worker(config, host, json_checker_datanode))
+  return NodeHealthReport(is_healthy=healthy, message='\n'.join(messages))
+
+def gen_nodemanagers_report(config):
+  """
+  Generates a health report on all node managers from the resource manager's nodes api, so that a
+  single request covers any number of node managers. Only node managers reported unhealthy are
+  probed directly.
+  """
+  nodes = rm_nodes_request(config)
+  if nodes is None:
+    return NodeHealthReport(is_healthy=False, message='\u274C Could not fetch the node manager' \
+      ' reports from the resource manager.')
+  running = [_n for _n in nodes if _n.get('state') == 'RUNNING']
+  healthy = len(running) >= NUM_NODE_MANAGERS and len(running) == len(nodes)
+  messages = ['%s %d/%d node managers running.' % ('\u2705' if healthy else '\u274C', \
+    len(running), NUM_NODE_MANAGERS)]
+  for node in sorted(nodes, key=lambda _n: _n.get('nodeHostName', '')):
+    host = node.get('nodeHostName', '?')
+    if node.get('state') == 'RUNNING':
+      messages.append('\u2705 %s: running' % (host))
+    else:
+      messages.append('\u274C %s: %s%s' % (host, node.get('state'), \
+        ' (%s)' % (node['healthReport']) if node.get('healthReport') else ''))
+      messages.append(probe_worker(config, host, json_checker_response_only))
+  return NodeHealthReport(is_healthy=healthy, message='\n'.join(messages))
+
 def gen_health_summary(config):
   """
-  Generates a health report summary on the running cluster.
-  """
-  _name_node1 = gen_node_health_report(metric_request(PORT_UI_NN1), json_checker_namenode)
-  _data_node1 = gen_node_health_report(metric_request(PORT_UI_DN1), json_checker_datanode)
-  _rman  = gen_node_health_report(metric_request(PORT_UI_RMAN), json_checker_resourcemanager)
-  _nm1 = gen_node_health_report(metric_request(PORT_UI_NM1), json_checker_response_only)
-  _mrhist = gen_node_health_report(metric_request(PORT_UI_MRHIST), json_checker_response_only)
-  _hs = gen_node_health_report(metric_request(PORT_UI_HS), json_checker_response_only)
+  Generates a health report summary on the running cluster. The workers' health comes from the
+  masters' views of them (see gen_datanodes_report() and gen_nodemanagers_report()).
+  """
+  _nn1_jsn = metric_request(host_port(config, PORT_OFFSET_NN1))
+  _name_node1 = gen_node_health_report(_nn1_jsn, json_checker_namenode)
+  _data_node1 = gen_datanodes_report(config, _nn1_jsn)
+  _rman  = gen_node_health_report(metric_request(host_port(config, PORT_OFFSET_RMAN)), \
+    json_checker_resourcemanager)
+  _nm1 = gen_nodemanagers_report(config)
+  _mrhist = gen_node_health_report(metric_request(host_port(config, PORT_OFFSET_MRHIST)), \
+    json_checker_response_only)
+  _hs = gen_node_health_report(metric_request(host_port(config, PORT_OFFSET_HS)), \
+    json_checker_response_only)
   _client = gen_docker_health_report(config, 'client')
   _sql = gen_docker_health_report(config, 'sql')
   _cluster_healthy = \
@@ -516,11 +2512,11 @@ def print_summary(summary):
   """
   print('NAME NODE 1')
   print_node_health(summary.nn1)
-  print('DATA NODE 1')
+  print('DATA NODES')
   print_node_health(summary.dn1)
   print('RESOURCE MANAGER')
   print_node_health(summary.rman)
-  print('NODE MANAGER 1')
+  print('NODE MANAGERS')
   print_node_health(summary.nm1)
   print('MAP REDUCE HISTORY SERVER')
   print_node_health(summary.mrhist)
@@ -536,6 +2532,43 @@ def print_summary(summary):
   else:
     print('\u274C Unhealthy')
 
+def gen_gc_summary(jsn):
+  """
+  Summarizes the garbage collection of a daemon from its jmx metrics json: the pause count, total
+  and last pause per collector, the heap used after the last collection, and the current heap
+  usage. The jvm only keeps the last pause, so see the gc-pauses log query for the longest ones.
+  """
+  if not jsn:
+    return 'No metrics.'
+  parts = []
+  latest = {}
+  for bean in jsn.get('beans', []):
+    if not bean.get('name', '').startswith('java.lang:type=GarbageCollector'):
+      continue
+    last = bean.get('LastGcInfo') or {}
+    parts.append('%s: %d pauses, %dms total, %dms last' % (bean.get('Name'), \
+      bean.get('CollectionCount', 0), bean.get('CollectionTime', 0), last.get('duration', 0)))
+    if last.get('endTime', -1) > latest.get('endTime', -1):
+      latest = last
+  heap_after_gc = sum(_p.get('value', {}).get('used', 0) \
+    for _p in latest.get('memoryUsageAfterGc', []))
+  memory = next((_b for _b in jsn.get('beans', []) if _b.get('name') == 'java.lang:type=Memory'), \
+    None)
+  if memory:
+    heap = memory.get('HeapMemoryUsage', {})
+    parts.append('heap after last gc %s, heap %s used of %s max' % (format_bytes(heap_after_gc), \
+      format_bytes(heap.get('used', 0)), format_bytes(max(heap.get('max', 0), 0))))
+  return '; '.join(parts) or 'No garbage collector metrics.'
+
+def print_gc_summary(config):
+  """
+  Prints the garbage collection summary of each daemon with a jmx endpoint.
+  """
+  for name, port in [('namenode', PORT_OFFSET_NN1), ('datanode', PORT_OFFSET_DN1), \
+    ('resourcemanager', PORT_OFFSET_RMAN), ('nodemanager', PORT_OFFSET_NM1), \
+    ('historyserver', PORT_OFFSET_MRHIST), ('hiveserver2', PORT_OFFSET_HS)]:
+    print('%s: %s' % (name, gen_gc_summary(metric_request(host_port(config, port)))))
+
 def print_health(config):
   """
   Prints the health of the cluster
@@ -544,6 +2577,9 @@ def print_health(config):
   print()
   summary = gen_health_summary(config)
   print_summary(summary)
+  print()
+  print('GARBAGE COLLECTION')
+  print_gc_summary(config)
 
 def wait_for_healthy_nodes_print(config, timeout):
   """
@@ -587,10 +2623,17 @@ def wait_for_healthy_nodes(config, timeout=200, interval=5):
       time.sleep(interval)
   return _summary
 
-def setup(config):
+def setup(config, use_snapshot=False, snapshot_root=None):
   """
-  One-time setup for the cluster.
+  One-time setup for the cluster. If use_snapshot is set, a snapshot matching the data directory
+  and configuration is restored instead when there is one, and otherwise one is taken after setup.
+  Snapshots are kept next to the volumes directory unless another snapshot root is given.
   """
+  if use_snapshot:
+    print('Looking for a matching snapshot.')
+    if restore(config, root=snapshot_root):
+      return
+
   print('Destroying volumes.')
   destroy_volumes(config)
 
@@ -600,6 +2643,9 @@ def setup(config):
   print('Formatting HDFS.')
   format_hdfs(config)
 
+  print('Sizing YARN resources for the host.')
+  size_resources(config)
+
   print('Starting Hadoop Daemons.')
   start_hadoop_daemons(config)
 
@@ -607,7 +2653,8 @@ def setup(config):
   setup_hive(config)
 
   print('Ingesting configured data volume into HDFS (this could take some time).')
-  ingest_data(config)
+  layout = 'auto' if config.block_layout == 'auto' else None
+  ingest_data(config, block_size=layout, replication=layout)
 
   print('Copying configured source folder to the client node volume.')
   copy_source(config)
@@ -615,22 +2662,376 @@ def setup(config):
   print('Spinning cluster down.')
   cluster_down(config)
 
-def print_port_doc():
+  if use_snapshot:
+    print('Taking a snapshot of the volumes.')
+    snapshot(config, root=snapshot_root)
+
+def snapshots_dir(config):
   """
-  Prints documentation on the exposed ports.
+  Gets the directory holding the volume snapshots, next to (not in) the volumes directory.
   """
-  print('Exposed ports on localhost:')
+  return '%s-snapshots' % (config.volumes_dir.rstrip('/\\'))
+
+def snapshot_label(config):
+  """
+  Labels the cluster state that setup would produce with a hash of the data directory (file
+  names, sizes and modification times) and the files defining the cluster. The source directory is
+  left out since it is copied to the client node again on restore.
+  """
+  _h = hashlib.sha256()
+  for root, dirs, files in os.walk(config.data_dir):
+    dirs.sort()
+    for name in sorted(files):
+      _f = os.path.join(root, name)
+      _h.update(('%s %d %d\n' % (os.path.relpath(_f, config.data_dir).replace(os.sep, '/'), \
+        os.path.getsize(_f), int(os.path.getmtime(_f)))).encode('utf-8'))
+  for _f in [COMPOSE_FILE, os.path.join(ROOT_DIR, 'Dockerfile')]:
+    with open(_f, 'rb') as _fp:
+      _h.update(_fp.read())
+  _h.update(config.metastore.encode('utf-8'))
+  if config.block_layout != 'default':
+    _h.update(config.block_layout.encode('utf-8'))
+  return _h.hexdigest()[:16]
+
+def copy_tree_fast(src, dst):
+  """
+  Copies a directory tree, using copy-on-write reflinks where the file system supports them so
+  that even large volumes copy almost instantly. Hard links are not used since the cluster
+  modifies files such as the name node edit logs and the metastore database in place.
+  """
+  if sys.platform.startswith('linux') and shutil.which('cp'):
+    subprocess.run(['cp', '-a', '--reflink=auto', src, dst], check=True)
+  else:
+    shutil.copytree(src, dst, symlinks=True)
+
+def snapshot(config, archive=False, root=None):
+  """
+  Captures the volumes directory of a set up (and spun down) cluster, labeled by
+  snapshot_label(). Snapshots are plain copies by default, or compressed tar archives if archive is
+  set. They are stored in snapshots_dir() unless another root directory is given.
+  """
+  if not os.path.exists(config.volumes_dir):
+    print('Volumes directory does not exist. Nothing to snapshot.')
+    return None
+  cluster_down(config)
+  label = snapshot_label(config)
+  root = root or snapshots_dir(config)
+  if not os.path.exists(root):
+    os.makedirs(root)
+  _start = time.time()
+  target = os.path.join(root, label + ('.tar.gz' if archive else ''))
+  partial = target + '.partial'
+  # Left over by an interrupted snapshot
+  if os.path.isdir(partial):
+    shutil.rmtree(partial)
+  elif os.path.exists(partial):
+    os.remove(partial)
+  if archive:
+    with tarfile.open(partial, 'w:gz') as _tf:
+      _tf.add(config.volumes_dir, arcname='volumes')
+  else:
+    copy_tree_fast(config.volumes_dir, partial)
+  for existing in [os.path.join(root, label), os.path.join(root, label + '.tar.gz')]:
+    if os.path.isdir(existing):
+      shutil.rmtree(existing)
+    elif os.path.exists(existing):
+      os.remove(existing)
+  os.rename(partial, target)
+  with open(os.path.join(root, label + '.json'), 'w') as _fp:
+    json.dump({'label': label, 'archive': archive, 'data_dir': config.data_dir, \
+      'created': datetime.datetime.now().isoformat()}, _fp, indent=2)
+  print('Snapshot %s taken in %fs.' % (label, time.time() - _start))
+  return label
+
+def restore(config, label=None, root=None):
+  """
+  Replaces the volumes directory with a snapshot, by default the one matching the current data
+  directory and configuration, and copies the source directory to the client volume again.
+  Snapshots are looked up in snapshots_dir() unless another root directory is given. Since
+  snapshots do not depend on the project name, one snapshot can seed several projects. Returns
+  False if there is no such snapshot.
+  """
+  label = label or snapshot_label(config)
+  root = root or snapshots_dir(config)
+  if os.path.isdir(os.path.join(root, label)):
+    archive = None
+  elif os.path.exists(os.path.join(root, label + '.tar.gz')):
+    archive = os.path.join(root, label + '.tar.gz')
+  else:
+    print('No snapshot %s found in %s.' % (label, root))
+    return False
+  _start = time.time()
+  destroy_volumes(config)
+  if not os.path.exists(os.path.dirname(config.volumes_dir)):
+    os.makedirs(os.path.dirname(config.volumes_dir))
+  if archive:
+    extract_dir = config.volumes_dir + '.restore'
+    # Left over by an interrupted restore
+    if os.path.exists(extract_dir):
+      shutil.rmtree(extract_dir)
+    with tarfile.open(archive, 'r:gz') as _tf:
+      _tf.extractall(extract_dir)
+    os.rename(os.path.join(extract_dir, 'volumes'), config.volumes_dir)
+    os.rmdir(extract_dir)
+  else:
+    copy_tree_fast(os.path.join(root, label), config.volumes_dir)
+  # Automatic ports belong to the project, not to the snapshot
+  if os.path.exists(state_path(config, 'ports')):
+    os.remove(state_path(config, 'ports'))
+  copy_source(config)
+  print('Snapshot %s restored in %fs.' % (label, time.time() - _start))
+  return True
+
+class ClusterPool:
+  """
+  A pool of pre-started clusters which test suites lease instead of booting their own. The pool
+  members are copies of a base configuration under their own project names, volumes and
+  (automatic) ports, seeded from a shared snapshot. On release a cluster is reset to the baseline
+  recorded when it was first leased: hive databases, tables and views and HDFS paths created since
+  are dropped. If baseline HDFS files were changed or removed, the cluster is restored from the
+  snapshot instead. Leases are exclusive across processes through lease files. For example:
+
+    with ClusterPool(config, size=2).leased() as cluster_config:
+      exec_hive_query(cluster_config, 'SELECT ...')
+  """
+  def __init__(self, config, size=2):
+    self._config = config
+    self._size = size
+    # The pool index of each leased member, by project name
+    self._held = {}
+    self._lock = threading.Lock()
+
+  @property
+  def pool_dir(self):
+    """
+    The directory holding the volumes and lease files of the pool members.
+    """
+    return '%s-pool' % (self._config.volumes_dir.rstrip('/\\'))
+
+  def member(self, index):
+    """
+    Gets the configuration of a pool member.
+    """
+    base = self._config
+    return Config('%spool%d' % (base.project_name, index), base.source_dir, base.data_dir, \
+      os.path.join(self.pool_dir, str(index), 'volumes'), base.metastore, base.jvm_options, \
+      'auto', base.block_layout)
+
+  def lease_path(self, index):
+    """
+    Gets the lease file of a pool member, which exists while the member is leased.
+    """
+    return os.path.join(self.pool_dir, 'leases', '%d.lease' % (index))
+
+  def _baseline_path(self, member):
+    # Kept outside of the volumes, which a restore replaces
+    return os.path.join(os.path.dirname(member.volumes_dir), 'baseline.json')
+
+  def warm(self):
+    """
+    Provisions (from the shared snapshot where possible) and starts every pool member which is
+    not running yet. The first member to be provisioned takes the snapshot if there is none.
+    """
+    for index in range(self._size):
+      self._ensure_running(self.member(index))
+
+  def _ensure_running(self, member):
+    if gen_health_summary(member).cluster_healthy:
+      return
+    if not os.path.exists(member.volumes_dir):
+      setup(member, use_snapshot=True, snapshot_root=snapshots_dir(self._config))
+    start(member)
+    if not os.path.exists(self._baseline_path(member)):
+      with open(self._baseline_path(member), 'w') as _fp:
+        json.dump(cluster_baseline(member), _fp, indent=2)
+
+  def lease(self, timeout=None, interval=5):
+    """
+    Leases a free pool member, starting it if needed, and returns its configuration. Blocks until
+    a member is free or the timeout in seconds passes.
+    """
+    if not os.path.exists(os.path.dirname(self.lease_path(0))):
+      os.makedirs(os.path.dirname(self.lease_path(0)))
+    _start = time.time()
+    while True:
+      for index in range(self._size):
+        try:
+          _fd = os.open(self.lease_path(index), os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+        except FileExistsError:
+          continue
+        with os.fdopen(_fd, 'w') as _fp:
+          _fp.write('%d %s\n' % (os.getpid(), datetime.datetime.now().isoformat()))
+        member = self.member(index)
+        try:
+          self._ensure_running(member)
+        except BaseException:
+          os.remove(self.lease_path(index))
+          raise
+        with self._lock:
+          self._held[member.project_name] = index
+        print('Leased cluster %s.' % (member.project_name))
+        return member
+      if timeout is not None and time.time() - _start >= timeout:
+        raise RuntimeError('No pool cluster became free within %ds.' % (timeout))
+      time.sleep(interval)
+
+  def release(self, member):
+    """
+    Resets a leased cluster to its baseline and returns it to the pool.
+    """
+    with self._lock:
+      index = self._held.get(member.project_name)
+    if index is None:
+      raise ValueError('Cluster %s is not leased from this pool.' % (member.project_name))
+    try:
+      with open(self._baseline_path(member), 'r') as _fp:
+        baseline = json.load(_fp)
+      reset_cluster(member, baseline, snapshots_dir(self._config))
+    finally:
+      with self._lock:
+        self._held.pop(member.project_name, None)
+      if os.path.exists(self.lease_path(index)):
+        os.remove(self.lease_path(index))
+    print('Released cluster %s.' % (member.project_name))
+
+  @contextlib.contextmanager
+  def leased(self, timeout=None):
+    """
+    Leases a cluster for the duration of a with block.
+    """
+    member = self.lease(timeout)
+    try:
+      yield member
+    finally:
+      self.release(member)
+
+  def clear_leases(self):
+    """
+    Removes all lease files, for example those left behind by killed test runs.
+    """
+    for index in range(self._size):
+      if os.path.exists(self.lease_path(index)):
+        os.remove(self.lease_path(index))
+
+  def stop(self):
+    """
+    Spins down every pool member. Their volumes are kept, so the next warm() is quick.
+    """
+    for index in range(self._size):
+      cluster_down(self.member(index))
+
+  def __enter__(self):
+    return self
+
+  def __exit__(self, exc_type, exc_value, traceback):
+    with self._lock:
+      held = list(self._held.values())
+    for index in held:
+      self.release(self.member(index))
+
+def hive_catalog(config):
+  """
+  Lists the hive databases and their tables and views as {database: [table, ...]}.
+  """
+  catalog = {}
+  with HiveSession(config) as session:
+    databases = [_l.strip() for _l in session.execute('SHOW DATABASES').lines \
+      if re.match(r'^\w+$', _l.strip())]
+    for database in databases:
+      catalog[database] = [_l.strip() for _l in session.execute('SHOW TABLES IN `%s`' % \
+        (database)).lines if re.match(r'^\w+$', _l.strip())]
+  return catalog
+
+def hdfs_list_paths(config, path, skip=('/tmp',)):
+  """
+  Recursively lists the files and directories under an HDFS path as {path: [type, length,
+  modification time]}, leaving out the skipped subtrees (scratch space by default).
+  """
+  jsn = webhdfs_request(config, path, 'LISTSTATUS')
+  if jsn is None:
+    return {}
+  paths = {}
+  for status in jsn['FileStatuses']['FileStatus']:
+    child = '%s/%s' % (path.rstrip('/'), status['pathSuffix']) if status['pathSuffix'] else path
+    if child in skip:
+      continue
+    paths[child] = [status['type'], status['length'], status['modificationTime']]
+    if status['type'] == 'DIRECTORY':
+      paths.update(hdfs_list_paths(config, child, skip))
+  return paths
+
+def cluster_baseline(config):
+  """
+  Records the hive catalog and HDFS paths of a running cluster for reset_cluster().
+  """
+  return {'hive': hive_catalog(config), 'hdfs': hdfs_list_paths(config, '/')}
+
+def reset_cluster(config, baseline, snapshot_root=None):
+  """
+  Drops the hive databases, tables and views and the HDFS paths created since the baseline was
+  recorded (see cluster_baseline()). Baseline directories only compare by existence since their
+  modification times change with their contents. If baseline files were changed or removed, the
+  cluster is restored from its snapshot and restarted instead.
+  """
+  _start = time.time()
+  current = hdfs_list_paths(config, '/')
+  changed = [_p for _p, _s in baseline['hdfs'].items() if _p not in current or \
+    (_s[0] == 'FILE' and current[_p] != _s)]
+  if changed:
+    print('%d baseline HDFS paths changed (for example %s). Restoring the snapshot.' % \
+      (len(changed), changed[0]))
+    restore(config, root=snapshot_root)
+    start(config)
+    return
+
+  catalog = hive_catalog(config)
+  with HiveSession(config) as session:
+    for database, tables in catalog.items():
+      if database not in baseline['hive']:
+        session.execute('DROP DATABASE IF EXISTS `%s` CASCADE' % (database))
+        continue
+      for table in tables:
+        if table in baseline['hive'][database]:
+          continue
+        if session.execute('DROP VIEW IF EXISTS `%s`.`%s`' % (database, table)).error:
+          session.execute('DROP TABLE IF EXISTS `%s`.`%s` PURGE' % (database, table))
+
+  current = hdfs_list_paths(config, '/')
+  created = set(_p for _p in current if _p not in baseline['hdfs'])
+  # Deleting the top-most new paths removes everything below them
+  for path in sorted(created):
+    if path.rsplit('/', 1)[0] not in created:
+      webhdfs_request(config, path, 'DELETE', method='DELETE', params={'recursive': 'true'})
+  print('Cluster %s reset in %fs.' % (config.project_name, time.time() - _start))
+
+def print_port_doc(config):
+  """
+  Prints documentation on the exposed ports.
+  """
+  print('Exposed ports on localhost:')
   for _p in PORT_DOC:
     print('Port: %s, Type: %s, Description: %s' % \
-      (_p[0], _p[1], _p[2]))
+      (host_port(config, _p[0]), _p[1], _p[2]))
 
-def start(config, wait=True):
+def start(config, wait=True, sizing=True):
   """
-  Boots up the cluster and starts all of the daemons on the cluster.
+  Boots up the cluster and starts all of the daemons on the cluster. Unless sizing is disabled, the
+  YARN resources are sized for the host before the daemons start. A suspended cluster is resumed
+  instead (see resume()), since its daemons may still be running.
   """
+  if os.path.exists(state_path(config, 'suspend')):
+    print('The cluster is suspended. Resuming it.')
+    resume(config, wait)
+    print_port_doc(config)
+    return
+
   print('Spinning cluster up.')
   cluster_up(config)
 
+  if sizing:
+    print('Sizing YARN resources for the host.')
+    size_resources(config)
+
   print('Starting Hadoop Daemons.')
   start_hadoop_daemons(config)
 
@@ -641,7 +3042,7 @@ def start(config, wait=True):
     print('Starting wait routine.')
     wait_for_healthy_nodes_print(config, 200)
 
-  print_port_doc()
+  print_port_doc(config)
 
 def stop(config):
   """
@@ -665,9 +3066,179 @@ def destroy_volumes(config):
 
 def print_hadoop_node_logs(config, node_name):
   """
-  Prints the logs of the given hadoop node.
-  """
-  exec_docker(config, node_name, 'cat %s/logs/*.log')
+  Prints the logs of the given hadoop node. See logs() to filter or follow them.
+  """
+  subprocess.run(docker_exec_args(config, node_name, ['bash', '-c', \
+    'cat %s/logs/*.log' % (HADOOP_HOME)]))
+
+def scan_node_logs(config, node_name, offsets, env):
+  """
+  Reads the log records written on a node since the given offsets ({path: [inode, offset]}),
+  filtered on the node (see LOG_SCAN_SCRIPT). Returns the records as (timestamp, node, daemon,
+  text) tuples and the new offsets.
+  """
+  stdin = ''.join('%s %s %s\n' % (path, inode, offset) \
+    for path, (inode, offset) in offsets.items())
+  result = subprocess.run(docker_exec_args(config, node_name, ['bash', '-c', LOG_SCAN_SCRIPT], \
+    keep_stdin=True, env=env), input=stdin, stdout=subprocess.PIPE, universal_newlines=True, \
+    errors='replace')
+  records = []
+  new_offsets = {}
+  daemon = None
+  last_ts = ''
+  for line in result.stdout.splitlines():
+    if line.startswith('\x01'):
+      path, inode, size, daemon = line[1:].split(' ', 3)
+      new_offsets[path] = [inode, int(size)]
+      last_ts = ''
+      continue
+    ts, _, text = line.partition('\t')
+    # Continuation lines keep their place after the previous record of the same file
+    last_ts = ts or last_ts
+    records.append((last_ts, node_name, daemon, text.replace('\x1f', '\n')))
+  return records, new_offsets
+
+def logs(config, nodes=None, level=None, since=None, until=None, regex=None, daemon=None, \
+  follow=False, from_start=False, interval=2):
+  """
+  Prints the log records of the daemons on the given nodes (all hadoop nodes by default), ordered
+  by timestamp across nodes. Records can be filtered by minimum level, time range
+  ('YYYY-MM-DD HH:MM:SS'), a regular expression matched against the whole record (including stack
+  traces), and a daemon name regular expression such as 'namenode'. Filtering happens on the nodes.
+  The read offset of every log file is remembered, so each call only reads what was written since
+  the previous call (unless from_start is set). In follow mode, new records are polled for until
+  interrupted.
+  """
+  nodes = nodes or HADOOP_NODES
+  env = {
+    'LOG_PATTERNS': ' '.join(LOG_FILE_PATTERNS),
+    'LOG_LEVEL': (level or '').upper(),
+    'LOG_SINCE': since or '',
+    'LOG_UNTIL': until or '',
+    'LOG_REGEX': regex or '',
+    'LOG_DAEMON': daemon or '',
+  }
+  state = load_state(config, 'logs')
+  if from_start:
+    state = {}
+  try:
+    while True:
+      results = {}
+      threads = [threading.Thread(target=lambda _n: results.__setitem__(_n, \
+        scan_node_logs(config, _n, state.get(_n, {}), env)), args=(_n,)) for _n in nodes]
+      for _t in threads:
+        _t.start()
+      for _t in threads:
+        _t.join()
+      records = []
+      for node_name, (node_records, offsets) in results.items():
+        records.extend(node_records)
+        state.setdefault(node_name, {}).update(offsets)
+      records.sort(key=lambda _r: _r[0])
+      for _, node_name, daemon_name, text in records:
+        print('[%s %s] %s' % (node_name, daemon_name, text.replace('\n', '\n    ')))
+      save_state(config, 'logs', state)
+      if not follow:
+        return
+      time.sleep(interval)
+  except KeyboardInterrupt:
+    save_state(config, 'logs', state)
+
+def open_log_index(config):
+  """
+  Opens (and creates if needed) the sqlite log index in the volumes directory.
+  """
+  _f = os.path.join(config.volumes_dir, 'state', 'logs.db')
+  if not os.path.exists(os.path.dirname(_f)):
+    os.makedirs(os.path.dirname(_f))
+  conn = sqlite3.connect(_f)
+  conn.create_function('regexp_extract', 3, lambda text, pattern, group: \
+    next((_m.group(group) for _m in [re.search(pattern, text or '')] if _m), None))
+  conn.executescript("""
+    CREATE TABLE IF NOT EXISTS log_records (ts TEXT, node TEXT, daemon TEXT, level TEXT,
+      thread TEXT, logger TEXT, message TEXT);
+    CREATE INDEX IF NOT EXISTS log_records_ts ON log_records (ts);
+    CREATE INDEX IF NOT EXISTS log_records_level ON log_records (level, ts);
+    CREATE INDEX IF NOT EXISTS log_records_daemon ON log_records (daemon, ts);
+    CREATE INDEX IF NOT EXISTS log_records_logger ON log_records (logger);
+    CREATE TABLE IF NOT EXISTS log_files (node TEXT, path TEXT, inode TEXT, offset INTEGER,
+      PRIMARY KEY (node, path));
+  """)
+  return conn
+
+def index_logs(config, nodes=None):
+  """
+  Parses the log4j records written to the daemon logs of the given nodes (all hadoop nodes by
+  default) since the last call into the sqlite log index, one row per record with its timestamp,
+  node, daemon, level, thread, logger and message (including any stack trace). See query_logs()
+  for querying the index.
+  """
+  nodes = nodes or HADOOP_NODES
+  _start = time.time()
+  conn = open_log_index(config)
+  offsets = {}
+  for node_name, path, inode, offset in conn.execute('SELECT * FROM log_files'):
+    offsets.setdefault(node_name, {})[path] = [inode, offset]
+  env = {'LOG_PATTERNS': ' '.join(LOG_FILE_PATTERNS)}
+  results = {}
+  threads = [threading.Thread(target=lambda _n: results.__setitem__(_n, \
+    scan_node_logs(config, _n, offsets.get(_n, {}), env)), args=(_n,)) for _n in nodes]
+  for _t in threads:
+    _t.start()
+  for _t in threads:
+    _t.join()
+
+  count = 0
+  with conn:
+    for node_name, (records, node_offsets) in results.items():
+      rows = []
+      for _, _, daemon, text in records:
+        first_line, _, rest = text.partition('\n')
+        match = re.match(LOG_RECORD_PATTERN, first_line)
+        if match:
+          rows.append((match.group('ts').replace('T', ' ').replace(',', '.'), node_name, daemon, \
+            match.group('level'), match.group('thread'), match.group('logger'), \
+            match.group('message') + ('\n' + rest if rest else '')))
+          continue
+        # Continuation lines of a record indexed by the previous call
+        conn.executemany('INSERT INTO log_records VALUES (?, ?, ?, ?, ?, ?, ?)', rows)
+        count += len(rows)
+        rows = []
+        conn.execute("UPDATE log_records SET message = message || char(10) || ? WHERE rowid =" \
+          " (SELECT max(rowid) FROM log_records WHERE node = ? AND daemon = ?)", \
+          (text, node_name, daemon))
+      conn.executemany('INSERT INTO log_records VALUES (?, ?, ?, ?, ?, ?, ?)', rows)
+      count += len(rows)
+      conn.executemany('INSERT OR REPLACE INTO log_files VALUES (?, ?, ?, ?)', \
+        [(node_name, path, inode, offset) for path, (inode, offset) in node_offsets.items()])
+  total = conn.execute('SELECT count(*) FROM log_records').fetchone()[0]
+  conn.close()
+  print('Indexed %d new log records (%d total) in %fs.' % (count, total, time.time() - _start))
+
+def query_logs(config, name=None, sql=None, threshold=None, limit=20):
+  """
+  Runs a canned query (see LOG_QUERIES) or an sql query against the log index and prints the
+  results. Canned queries take a threshold in milliseconds; run index_logs() first to pick up new
+  records.
+  """
+  if sql is None:
+    if name not in LOG_QUERIES:
+      print('Unknown query "%s". Expected one of: %s' % (name, ', '.join(LOG_QUERIES)))
+      return None
+    description, sql, default_threshold = LOG_QUERIES[name]
+    print(description)
+    threshold = default_threshold if threshold is None else threshold
+  conn = open_log_index(config)
+  try:
+    cursor = conn.execute(sql, {'threshold': threshold or 0, 'limit': limit})
+    rows = cursor.fetchall()
+  finally:
+    conn.close()
+  print(' | '.join(_d[0] for _d in cursor.description))
+  for row in rows:
+    print(' | '.join('' if _v is None else str(_v) for _v in row))
+  print('%d rows.' % (len(rows)))
+  return rows
 
 def beeline_cli(config):
   """
@@ -687,7 +3258,8 @@ def sqlcmd_cli(config, local):
   Launches an interactive sql cli on the client node or local host if specified. 
   """
   if local:
-    os.system('sqlcmd -S tcp:localhost,%d -U sa -P %s' % (PORT_SQL_SQL, SQL_TEST_PASSWORD))
+    os.system('sqlcmd -S tcp:localhost,%d -U sa -P %s' % (host_port(config, PORT_OFFSET_SQL), \
+      SQL_TEST_PASSWORD))
   else:
     exec_docker(config, 'client', '/opt/mssql-tools/bin/sqlcmd -S sql -U sa -P %s' % \
       (SQL_TEST_PASSWORD), workdir='/src', interactive=True)
@@ -718,7 +3290,7 @@ def sqoop_export(config, export_dir, sql_table, database_name='master', delimite
     (SQOOP_HOME, database_name, SQL_TEST_PASSWORD, export_dir, sql_table, delimiter), \
     workdir='/src')
 
-def launch_ssms_win_local(executable_path):
+def launch_ssms_win_local(config, executable_path):
   """
   Launches Sql Server Management Studio locally.
   """
@@ -727,7 +3299,8 @@ def launch_ssms_win_local(executable_path):
       print('Note: Connection will only succeed if "Remember Password" has been checked in ' \
         'the SSMS login previously.')
       print('Use test password: %s' % (SQL_TEST_PASSWORD))
-      os.system('"%s" -S tcp:localhost,%d -U sa' % (executable_path, PORT_SQL_SQL))
+      os.system('"%s" -S tcp:localhost,%d -U sa' % (executable_path, \
+        host_port(config, PORT_OFFSET_SQL)))
     else:
       print('The executable path for ssms does not exist. Please provide the correct one with' \
         ' arg "-f".' \
@@ -735,20 +3308,1276 @@ def launch_ssms_win_local(executable_path):
   else:
     print('This command is not implemented for non-Windows platforms.')
 
-def exec_hive_file(config, src_file):
-  """
-  Executes a hive script file from the source directory on the client node.
-  """
+def exec_hive_file(config, src_file, analyze=False, adaptive=False, \
+  local_threshold=LOCAL_MODE_THRESHOLD):
+  """
+  Executes a hive script file from the source directory on the client node. If analyze is set,
+  statistics are computed afterwards for the tables and partitions the script created or changed.
+  If adaptive is set, each statement is run in local mode or on YARN depending on the size of its
+  input (see adaptive_hive_script()). A session setting profile saved for the script by hive_tune()
+  is applied first.
+  """
+  run_file = src_file
+  tuning = load_state(config, 'hive_tuning').get(hive_tuning_key(src_file))
+  if adaptive or tuning:
+    with open(os.path.join(config.volumes_dir, 'client', src_file), 'r') as _fp:
+      script = _fp.read()
+    prefix = 'adaptive_' if adaptive else 'tuned_'
+    if adaptive:
+      script = adaptive_hive_script(config, script, local_threshold)
+    if tuning:
+      print('Applying the saved hive-tune profile "%s".' % (tuning['profile']))
+      script = ''.join('SET %s=%s;\n' % (_n, _v) for _n, _v in tuning['settings']) + script
+    run_file = write_client_script(config, prefix + os.path.basename(src_file), script)
   exec_docker(config, 'client', '%s/bin/beeline -u jdbc:hive2://hs:10000 -f %s' % \
-    (HIVE_HOME, src_file), workdir='/src')
+    (HIVE_HOME, run_file), workdir='/src')
+  if analyze:
+    analyze_tables(config, find_hive_file_targets(config, src_file))
 
-def exec_hive_query(config, query):
+def exec_hive_query(config, query, adaptive=False, local_threshold=LOCAL_MODE_THRESHOLD):
   """
-  Executes a hive query from the client node.
+  Executes a hive query from the client node. If adaptive is set, the query is run in local mode or
+  on YARN depending on the size of its input (see adaptive_hive_script()).
   """
+  if adaptive:
+    exec_docker(config, 'client', '%s/bin/beeline -u jdbc:hive2://hs:10000 -f %s' % \
+      (HIVE_HOME, write_client_script(config, 'adaptive_query.hql', \
+      adaptive_hive_script(config, query, local_threshold))), workdir='/src')
+    return
   exec_docker(config, 'client', '%s/bin/beeline -u jdbc:hive2://hs:10000 -e "%s"' % \
     (HIVE_HOME, query), workdir='/src')
 
+def beeline_args(query):
+  """
+  Builds a beeline command line which prints the query results as headerless tab separated rows.
+  """
+  return ['%s/bin/beeline' % (HIVE_HOME), '-u', 'jdbc:hive2://hs:10000', '--silent=true', \
+    '--showHeader=false', '--outputformat=tsv2', '-e', query]
+
+def hive_query_rows(config, query, session=None):
+  """
+  Executes a hive query from the client node and returns the result rows as lists of strings. If a
+  HiveSession is given, the statements run in it instead of in a new beeline process.
+  """
+  if session is None:
+    output = subprocess.run(docker_exec_args(config, 'client', beeline_args(query), \
+      workdir='/src'), stdout=subprocess.PIPE, universal_newlines=True, check=True)
+    return list(csv.reader(io.StringIO(output.stdout), delimiter='\t'))
+  lines = []
+  for statement in split_hive_statements(query):
+    result = session.execute(statement)
+    if result.error:
+      raise subprocess.CalledProcessError(1, statement, output=result.error)
+    lines.extend(result.lines)
+  return list(csv.reader(lines, delimiter='\t'))
+
+def strip_hive_comments(script):
+  """
+  Removes the -- line comments from a hive script.
+  """
+  return re.sub(r'--[^\n]*', '', script)
+
+def partition_spec_key(spec):
+  """
+  Normalizes a hive partition specification as written in a script ("k1 = 'v1', k2 = 2") to the
+  form listed by SHOW PARTITIONS ("k1=v1/k2=2").
+  """
+  parts = []
+  for _p in spec.split(','):
+    _k, _v = _p.split('=', 1)
+    parts.append('%s=%s' % (_k.strip().lower(), \
+      urllib.parse.quote(_v.strip().strip('\'"'), safe='')))
+  return '/'.join(parts)
+
+def partition_spec_sql(key):
+  """
+  Converts a SHOW PARTITIONS style partition key ("k1=v1/k2=2") to a PARTITION clause body.
+  """
+  parts = []
+  for _p in key.split('/'):
+    _k, _v = _p.split('=', 1)
+    parts.append("%s='%s'" % (_k, urllib.parse.unquote(_v).replace("'", "\\'")))
+  return ', '.join(parts)
+
+def write_client_script(config, name, text):
+  """
+  Writes a generated script to the client node source volume. Returns the path relative to /src.
+  """
+  rel_path = '.playground/%s' % (name)
+  _f = os.path.join(config.volumes_dir, 'client', '.playground', name)
+  if not os.path.exists(os.path.dirname(_f)):
+    os.makedirs(os.path.dirname(_f))
+  with open(_f, 'w', newline='\n') as _fp:
+    _fp.write(text)
+  return rel_path
+
+def register_partitions(config, table, partition_root=PARTITION_ROOT):
+  """
+  Registers every hive-style partition directory under an HDFS path with a hive table using a
+  single ALTER TABLE ... ADD statement, which the metastore adds as one batch instead of one
+  partition at a time.
+  """
+  partitions = hdfs_partition_dirs(config, partition_root)
+  if not partitions:
+    print('No partition directories found under %s.' % (partition_root))
+    return
+  statement = 'ALTER TABLE %s ADD IF NOT EXISTS\n%s;\n' % (table, '\n'.join( \
+    "  PARTITION (%s) LOCATION '%s'" % (partition_spec_sql(_k), _l) for _k, _l in partitions))
+  _start = time.time()
+  exec_hive_file(config, write_client_script(config, 'register_partitions.hql', statement))
+  print('Registered %d partitions with %s in %fs.' % (len(partitions), table, \
+    time.time() - _start))
+
+def find_hive_script_targets(script):
+  """
+  Finds the tables and partitions that a hive script creates or writes to. Returns a dictionary of
+  table name to a set of partition keys, where an empty set means the whole table.
+  """
+  script = strip_hive_comments(script)
+  targets = collections.OrderedDict()
+  def add(table, partition=None):
+    parts = targets.setdefault(table.lower(), set())
+    if partition is None:
+      targets[table.lower()] = None
+    elif parts is not None:
+      parts.add(partition_spec_key(partition))
+  _flags = re.IGNORECASE | re.DOTALL
+  for _m in re.finditer(r'\bCREATE\s+(?:TEMPORARY\s+|EXTERNAL\s+)*TABLE\s+(?:IF\s+NOT\s+' \
+    r'EXISTS\s+)?([\w.]+)', script, _flags):
+    add(_m.group(1))
+  for _m in re.finditer(r'\b(?:INSERT\s+(?:INTO|OVERWRITE)\s+(?:TABLE\s+)?|LOAD\s+DATA\s+' \
+    r'(?:LOCAL\s+)?INPATH\s+\S+\s+(?:OVERWRITE\s+)?INTO\s+TABLE\s+)([\w.]+)' \
+    r'(?:\s+PARTITION\s*\(([^)]*)\))?', script, _flags):
+    # Dynamic partition inserts (no values) may touch any partition of the table
+    if _m.group(2) and all('=' in _p for _p in _m.group(2).split(',')):
+      add(_m.group(1), _m.group(2))
+    else:
+      add(_m.group(1))
+  for _m in re.finditer(r'\bALTER\s+TABLE\s+([\w.]+)\s+ADD\s+(?:IF\s+NOT\s+EXISTS\s+)?' \
+    r'((?:PARTITION\s*\([^)]*\)(?:\s+LOCATION\s+\S+)?\s*)+)', script, _flags):
+    for _p in re.findall(r'PARTITION\s*\(([^)]*)\)', _m.group(2), _flags):
+      add(_m.group(1), _p)
+  for _m in re.finditer(r'\bMSCK\s+REPAIR\s+TABLE\s+([\w.]+)', script, _flags):
+    add(_m.group(1))
+  return {_t: (_p or set()) for _t, _p in targets.items()}
+
+def find_hive_file_targets(config, src_file):
+  """
+  Finds the tables and partitions written by a hive script in the client node source volume.
+  """
+  with open(os.path.join(config.volumes_dir, 'client', src_file), 'r') as _fp:
+    return find_hive_script_targets(_fp.read())
+
+# The parts of DESCRIBE FORMATTED output used by the playground
+HiveTableInfo = collections.namedtuple('HiveTableInfo', \
+  'name table_type location partition_columns view_text')
+
+def describe_hive_table(config, table, session=None):
+  """
+  Describes a hive table's type, HDFS location and partition columns, or a view's query text.
+  """
+  info = {'Table Type:': None, 'Location:': None, 'View Expanded Text:': None}
+  partition_columns = []
+  section = None
+  for row in hive_query_rows(config, 'DESCRIBE FORMATTED %s' % (table), session):
+    name = row[0].strip() if row else ''
+    if name.startswith('# ') and name != '# col_name':
+      section = name
+    elif section == '# Partition Information' and name and name != '# col_name':
+      partition_columns.append(name)
+    elif name in info and len(row) > 1:
+      info[name] = row[1].strip()
+  return HiveTableInfo(name=table, table_type=info['Table Type:'], \
+    location=hdfs_path(info['Location:']) if info['Location:'] else None, \
+    partition_columns=partition_columns, view_text=info['View Expanded Text:'])
+
+def hive_partition_locations(config, table, session=None):
+  """
+  Lists the partitions of a hive table and their HDFS locations. Every partition is described in a
+  single beeline session (the given HiveSession, if any) to avoid paying the session startup for
+  each one.
+  """
+  keys = [_r[0] for _r in hive_query_rows(config, 'SHOW PARTITIONS %s' % (table), session) if _r]
+  if not keys:
+    return collections.OrderedDict()
+  query = ';\n'.join('DESCRIBE FORMATTED %s PARTITION (%s)' % (table, partition_spec_sql(_k)) \
+    for _k in keys)
+  locations = [hdfs_path(_r[1].strip()) for _r in hive_query_rows(config, query, session) \
+    if len(_r) > 1 and _r[0].strip() == 'Location:']
+  return collections.OrderedDict(zip(keys, locations))
+
+def analyze_tables(config, targets, force=False):
+  """
+  Computes hive table and column statistics for the given tables (a dictionary of table name to
+  the set of partition keys to analyze, where an empty set means every partition). Partitions
+  whose HDFS files have not changed since they were last analyzed are skipped unless forced.
+  """
+  state = load_state(config, 'analyze')
+  _total_start = time.time()
+  for table, partitions in targets.items():
+    info = describe_hive_table(config, table)
+    if info.table_type == 'VIRTUAL_VIEW':
+      print('Skipping view %s (views have no statistics).' % (table))
+      continue
+    table_state = state.setdefault(table, {})
+    if info.partition_columns:
+      locations = hive_partition_locations(config, table)
+      if partitions:
+        locations = collections.OrderedDict((_k, _l) for _k, _l in locations.items() \
+          if _k in partitions)
+    else:
+      locations = collections.OrderedDict([('', info.location)])
+
+    statements = []
+    fingerprints = {}
+    for key, location in locations.items():
+      fingerprints[key] = hdfs_fingerprint(config, location)
+      if not force and fingerprints[key] is not None and table_state.get(key) == fingerprints[key]:
+        continue
+      target = '%s PARTITION (%s)' % (table, partition_spec_sql(key)) if key else table
+      statements.append('ANALYZE TABLE %s COMPUTE STATISTICS' % (target))
+      statements.append('ANALYZE TABLE %s COMPUTE STATISTICS FOR COLUMNS' % (target))
+
+    skipped = len(locations) - len(statements) // 2
+    if not statements:
+      print('Statistics for %s are current (%d partition(s) skipped).' % (table, skipped))
+      continue
+    _start = time.time()
+    exec_docker(config, 'client', '%s/bin/beeline -u jdbc:hive2://hs:10000 -e "%s"' % \
+      (HIVE_HOME, ';\n'.join(statements)), workdir='/src')
+    print('Analyzed %s: %d partition(s) in %fs, %d partition(s) skipped.' % \
+      (table, len(statements) // 2, time.time() - _start, skipped))
+    for key, fingerprint in fingerprints.items():
+      table_state[key] = fingerprint
+    save_state(config, 'analyze', state)
+  print('Statistics collection completed in %fs.' % (time.time() - _total_start))
+
+def hive_column_stats_sql(name, col_type, field, rows):
+  """
+  Builds the UPDATE STATISTICS properties of a hive column from its ingest profile, or None if
+  statistics cannot be seeded for the column type.
+  """
+  col_type = col_type.lower().split('(')[0]
+  numeric = col_type in HIVE_INTEGER_TYPES or col_type in HIVE_DECIMAL_TYPES
+  if not numeric and col_type not in ['string', 'varchar', 'char']:
+    return None
+  properties = [('numDVs', min(DistinctSketch(field['sketch']).estimate(), rows)), \
+    ('numNulls', field['missing'] + (field['non_numeric'] if numeric else 0))]
+  if numeric and field['min'] is not None:
+    _fmt = '%d' if col_type in HIVE_INTEGER_TYPES else '%r'
+    properties += [('lowValue', _fmt % (field['min'])), ('highValue', _fmt % (field['max']))]
+  elif not numeric:
+    properties += [('avgColLen', '%f' % (field['total_length'] / max(field['count'], 1))), \
+      ('maxColLen', field['max_length'])]
+  return 'UPDATE STATISTICS FOR COLUMN %s SET (%s)' % (name, \
+    ', '.join("'%s'='%s'" % _p for _p in properties))
+
+def seed_statistics(config, table):
+  """
+  Sets the statistics of a text table (and each of its partitions) from the ingest manifest, so
+  the optimizer has row counts and column statistics without an ANALYZE scan. The profiles of the
+  files under each table or partition location are merged. A table with a single string column
+  gets the statistics of whole rows; otherwise the table columns are matched by position to the
+  columns the files were split into. The seeded partitions are recorded as analyzed (see
+  analyze_tables()).
+  """
+  manifest = load_state(config, 'ingest')
+  if not manifest.get('files'):
+    print('No ingest manifest found. Run ingest-data with --profile first.')
+    return
+  info = describe_hive_table(config, table)
+  if info.table_type == 'VIRTUAL_VIEW':
+    print('Views have no statistics.')
+    return
+  columns = [_c for _c in describe_hive_columns(config, table) \
+    if _c[0] not in info.partition_columns]
+  if info.partition_columns:
+    locations = hive_partition_locations(config, table)
+  else:
+    locations = collections.OrderedDict([('', info.location)])
+  statements = []
+  seeded = []
+  for key, location in locations.items():
+    profiles = [_e['profile'] for _p, _e in manifest['files'].items() \
+      if _p.startswith(location.rstrip('/') + '/')]
+    if not profiles:
+      print('No profiled files under %s.' % (location))
+      continue
+    profile = merge_profiles(profiles)
+    target = '%s PARTITION (%s)' % (table, partition_spec_sql(key)) if key else table
+    statements.append("ALTER TABLE %s UPDATE STATISTICS SET ('numRows'='%d', 'rawDataSize'='%d')" \
+      % (target, profile['rows'], profile['bytes']))
+    if len(columns) == 1 and columns[0][1].lower() == 'string':
+      fields = [{'count': profile['rows'], 'missing': 0, 'non_numeric': profile['rows'], \
+        'min': None, 'max': None, 'total_length': profile['bytes'], \
+        'max_length': profile['max_row_length'], 'sketch': profile['row_sketch']}]
+    else:
+      fields = profile['fields']
+    for (name, col_type), field in zip(columns, fields):
+      sql = hive_column_stats_sql(name, col_type, field, profile['rows'])
+      if sql:
+        statements.append('ALTER TABLE %s %s' % (target, sql))
+    seeded.append((key, location))
+  if not statements:
+    return
+  _start = time.time()
+  exec_hive_file(config, write_client_script(config, 'seed_statistics_%s.hql' % (table), \
+    ';\n'.join(statements) + ';\n'))
+  state = load_state(config, 'analyze')
+  for key, location in seeded:
+    state.setdefault(table.lower(), {})[key] = hdfs_fingerprint(config, location)
+  save_state(config, 'analyze', state)
+  print('Seeded statistics of %s for %d location(s) in %fs.' % (table, len(seeded), \
+    time.time() - _start))
+
+def seed_ingested_tables(config):
+  """
+  Seeds the statistics (see seed_statistics()) of every hive table whose location or partition
+  locations hold files of the ingest manifest. Tables created after the ingest are seeded by
+  running seed-stats once they exist.
+  """
+  paths = list(load_state(config, 'ingest').get('files', {}).keys())
+  tables = []
+  try:
+    catalog = hive_catalog(config)
+    with HiveSession(config) as session:
+      for database, names in catalog.items():
+        for name in names:
+          table = name if database == 'default' else '%s.%s' % (database, name)
+          info = describe_hive_table(config, table, session)
+          if info.table_type == 'VIRTUAL_VIEW' or not info.location:
+            continue
+          if info.partition_columns:
+            locations = hive_partition_locations(config, table, session).values()
+          else:
+            locations = [info.location]
+          if any(_p.startswith(_l.rstrip('/') + '/') for _l in locations for _p in paths):
+            tables.append(table)
+  except (subprocess.CalledProcessError, EOFError) as err:
+    print('Could not list the hive tables (%s). Run seed-stats once hive is running.' % (err))
+    return
+  if not tables:
+    print('No hive table reads the ingested files yet. Run seed-stats after creating one.')
+  for table in tables:
+    seed_statistics(config, table)
+
+def describe_hive_columns(config, table):
+  """
+  Lists the (name, type) of each column of a hive table or view, including partition columns.
+  """
+  columns = []
+  for row in hive_query_rows(config, 'DESCRIBE %s' % (table)):
+    name = row[0].strip() if row else ''
+    if not name or name.startswith('#'):
+      # Partition columns are repeated in a section after the regular columns
+      break
+    columns.append((name, row[1].strip()))
+  return columns
+
+def table_layout_sql(layout):
+  """
+  Builds the storage clauses of a CREATE TABLE statement for an ORC table with the given layout
+  (see TableLayout). ORC keeps min/max statistics per file, stripe and row group, so filters on
+  the sort columns skip most row groups, and bloom filters skip row groups for point lookups.
+  """
+  clauses = []
+  if layout and layout.cluster_by:
+    clauses.append('CLUSTERED BY (%s)' % (', '.join(layout.cluster_by)))
+    if layout.sort_by:
+      clauses.append('SORTED BY (%s)' % (', '.join(layout.sort_by)))
+    clauses.append('INTO %d BUCKETS' % (layout.buckets or 1))
+  clauses.append('STORED AS ORC')
+  properties = [('orc.create.index', 'true'), ('orc.row.index.stride', str(ORC_ROW_INDEX_STRIDE))]
+  if layout and layout.bloom_filter_columns:
+    properties.append(('orc.bloom.filter.columns', ','.join(layout.bloom_filter_columns)))
+    properties.append(('orc.bloom.filter.fpp', '0.05'))
+  clauses.append('TBLPROPERTIES (%s)' % (', '.join("'%s'='%s'" % _p for _p in properties)))
+  return '\n'.join(clauses)
+
+def create_layout_table(config, source, table, layout):
+  """
+  (Re)creates an ORC table with the given layout (see TableLayout) from a hive table or view. Sort
+  columns require bucketing columns, as in hive.
+  """
+  if layout.sort_by and not layout.cluster_by:
+    print('Sorted tables need bucketing columns to sort within.')
+    return
+  columns = describe_hive_columns(config, source)
+  statements = [
+    'DROP TABLE IF EXISTS %s' % (table),
+    'CREATE TABLE %s (%s)\n%s' % (table, ', '.join('%s %s' % _c for _c in columns), \
+      table_layout_sql(layout)),
+    'INSERT OVERWRITE TABLE %s\nSELECT %s FROM %s' % (table, ', '.join(_c[0] for _c in columns), \
+      source),
+  ]
+  _start = time.time()
+  exec_hive_file(config, write_client_script(config, 'create_%s.hql' % (table), \
+    ';\n'.join(statements) + ';\n'))
+  print('Created %s from %s in %fs.' % (table, source, time.time() - _start))
+
+def job_history_request(config, path):
+  """
+  Sends a request to the map reduce history server REST api. Returns the parsed json, or None on
+  error.
+  """
+  try:
+    _r = requests.get('http://localhost:%d/ws/v1/history/mapreduce%s' % \
+      (host_port(config, PORT_OFFSET_MRHIST), path))
+  except:
+    return None
+  if _r.status_code != 200:
+    return None
+  try:
+    return _r.json()
+  except ValueError:
+    return None
+
+def finished_job_ids(config):
+  """
+  Lists the ids of the map reduce jobs the history server knows of.
+  """
+  jsn = job_history_request(config, '/jobs') or {}
+  return [_j['id'] for _j in ((jsn.get('jobs') or {}).get('job') or [])]
+
+def job_counters(config, job_id):
+  """
+  Gets the total counters of a finished map reduce job as {counter name: value}.
+  """
+  jsn = job_history_request(config, '/jobs/%s/counters' % (job_id)) or {}
+  counters = {}
+  for group in (jsn.get('jobCounters') or {}).get('counterGroup', []):
+    for counter in group.get('counter', []):
+      counters[counter['name']] = counter['totalCounterValue']
+  return counters
+
+def benchmark_layout(config, tables, queries=None, repeat=3, timeout=60):
+  """
+  Runs selective queries against tables with different layouts (for example the text m33 table
+  and a sorted, bucketed ORC copy made by create_layout_table()) and prints the median latency and
+  the bytes and rows each query read, taken from the job counters, to show how much the layout
+  skipped. Queries run as map reduce jobs (no fetch tasks or local mode) so their counters can
+  be collected.
+  """
+  queries = queries or LAYOUT_BENCHMARK_QUERIES
+  results = []
+  with HiveSession(config) as session:
+    session.set_all(HIVE_YARN_MODE_SETTINGS + [('hive.fetch.task.conversion', 'none'), \
+      ('hive.optimize.index.filter', 'true'), ('hive.optimize.ppd', 'true')])
+    for query in queries:
+      for table in tables:
+        timings = []
+        counters = {}
+        for _ in range(int(repeat)):
+          known = set(finished_job_ids(config))
+          result = session.execute(query.format(table=table))
+          if result.error:
+            print('Query failed on %s: %s' % (table, result.error))
+            return None
+          timings.append(result.seconds)
+          # The history server picks finished jobs up after a short delay
+          _start = time.time()
+          new_jobs = []
+          while not new_jobs and time.time() - _start < timeout:
+            new_jobs = [_j for _j in finished_job_ids(config) if _j not in known]
+            if not new_jobs:
+              time.sleep(2)
+          for job_id in new_jobs:
+            for name, value in job_counters(config, job_id).items():
+              counters[name] = counters.get(name, 0) + value
+        timings.sort()
+        results.append((query, table, timings[len(timings) // 2], \
+          counters.get('HDFS_BYTES_READ', 0) // repeat, \
+          counters.get('MAP_INPUT_RECORDS', 0) // repeat))
+
+  for query in queries:
+    print(query.format(table='<table>'))
+    rows = [_r for _r in results if _r[0] == query]
+    for _, table, seconds, bytes_read, records in rows:
+      print('  %-24s median %fs, read %s and %d rows (%.1f%% of the bytes read from %s)' % (table, \
+        seconds, format_bytes(bytes_read), records, 100.0 * bytes_read / rows[0][3] \
+        if rows[0][3] else 0.0, rows[0][1]))
+  return results
+
+def materialize_view(config, view, table=None, source_table=None, force=False, layout=None):
+  """
+  Stores the result of a hive view in an ORC table and keeps it up to date incrementally. The
+  table is partitioned by the columns the view passes through from the partition columns of its
+  source table. On each refresh only the partitions whose source files changed (by HDFS file
+  count, size and modification time) since the last refresh are recomputed, and partitions whose
+  source partitions disappeared are dropped. If the view exposes no source partition columns, the
+  table is unpartitioned and fully recomputed whenever any source file changes. A layout (see
+  TableLayout) can be given for when the table is created.
+  """
+  table = table or '%s_mv' % (view)
+  state = load_state(config, 'materialized_views')
+  mv_state = state.get(table)
+  if mv_state is None or force:
+    mv_state = {'view': view, 'source_table': source_table, 'partitions': {}}
+  source_table = source_table or mv_state['source_table']
+  if not source_table:
+    print('A source table is required the first time a view is materialized.')
+    return
+
+  columns = describe_hive_columns(config, view)
+  source_info = describe_hive_table(config, source_table)
+  partition_columns = [_c for _c in source_info.partition_columns if _c in dict(columns)]
+  value_columns = [_c for _c in columns if _c[0] not in partition_columns]
+
+  if source_info.partition_columns:
+    locations = hive_partition_locations(config, source_table)
+  else:
+    locations = collections.OrderedDict([('', source_info.location)])
+  fingerprints = {_k: hdfs_fingerprint(config, _l) for _k, _l in locations.items()}
+  changed = [_k for _k, _f in fingerprints.items() if mv_state['partitions'].get(_k) != _f]
+  removed = [_k for _k in mv_state['partitions'] if _k not in fingerprints]
+  if not changed and not removed:
+    print('Materialized view %s is up to date.' % (table))
+    return
+
+  def project(key):
+    values = dict(_p.split('=', 1) for _p in key.split('/') if _p)
+    return '/'.join('%s=%s' % (_c, values[_c]) for _c in partition_columns)
+  current = set(project(_k) for _k in fingerprints)
+  refresh = sorted(set(project(_k) for _k in changed + removed))
+
+  statements = ['CREATE TABLE IF NOT EXISTS %s (%s)%s\n%s' % (table, \
+    ', '.join('%s %s' % _c for _c in value_columns), \
+    ' PARTITIONED BY (%s)' % (', '.join('%s %s' % (_c, dict(columns)[_c]) \
+      for _c in partition_columns)) if partition_columns else '', table_layout_sql(layout))]
+  select = 'SELECT %s FROM %s' % (', '.join(_c[0] for _c in value_columns + \
+    [(_p, None) for _p in partition_columns]), view)
+  if partition_columns:
+    statements.append('SET hive.exec.dynamic.partition.mode=nonstrict')
+    for key in refresh:
+      statements.append('ALTER TABLE %s DROP IF EXISTS PARTITION (%s)' % \
+        (table, partition_spec_sql(key)))
+    recompute = [_k for _k in refresh if _k in current]
+    if recompute:
+      statements.append('INSERT INTO TABLE %s PARTITION (%s)\n%s\nWHERE %s' % (table, \
+        ', '.join(partition_columns), select, '\n  OR '.join('(%s)' % \
+        (partition_spec_sql(_k).replace(', ', ' AND ')) for _k in recompute)))
+  else:
+    statements.append('INSERT OVERWRITE TABLE %s\n%s' % (table, select))
+
+  _start = time.time()
+  exec_hive_file(config, write_client_script(config, 'materialize_%s.hql' % (table), \
+    ';\n'.join(statements) + ';\n'))
+  print('Refreshed materialized view %s from %s: %d source partition(s) changed, %d removed,' \
+    ' %d partition(s) refreshed in %fs.' % (table, view, len(changed), len(removed), \
+    len(refresh) if partition_columns else 1, time.time() - _start))
+  mv_state['partitions'] = fingerprints
+  state[table] = mv_state
+  save_state(config, 'materialized_views', state)
+
+# The result of a statement executed in a HiveSession
+HiveSessionResult = collections.namedtuple('HiveSessionResult', 'lines error seconds')
+
+class HiveSession:
+  """
+  A long-lived beeline session on the client node. Statements executed through the session are
+  timed without the beeline and JVM startup cost that every exec_hive_query() call pays.
+  """
+  _MARKER = '__playground_statement_done__'
+
+  def __init__(self, config):
+    self._proc = subprocess.Popen(docker_exec_args(config, 'client', [ \
+      '%s/bin/beeline' % (HIVE_HOME), '-u', 'jdbc:hive2://hs:10000', '--silent=true', \
+      '--showHeader=false', '--outputformat=tsv2', '--force=true'], workdir='/src', \
+      keep_stdin=True), stdin=subprocess.PIPE, stdout=subprocess.PIPE, \
+      stderr=subprocess.STDOUT, universal_newlines=True, bufsize=1)
+
+  def execute(self, statement):
+    """
+    Executes a single statement and blocks until it completes. Beeline reads one statement per
+    line, so comments are removed and the statement is joined onto a single line.
+    """
+    statement = ' '.join(strip_hive_comments(statement).split()).rstrip(';')
+    _start = time.time()
+    self._proc.stdin.write('%s;\n!sh echo %s\n' % (statement, HiveSession._MARKER))
+    self._proc.stdin.flush()
+    lines = []
+    error = None
+    for line in self._proc.stdout:
+      if line.strip() == HiveSession._MARKER:
+        return HiveSessionResult(lines=lines, error=error, seconds=time.time() - _start)
+      if line.startswith('Error:') and error is None:
+        error = line.strip()
+      lines.append(line.rstrip('\n'))
+    raise EOFError('The beeline session ended unexpectedly.')
+
+  def set_all(self, settings):
+    """
+    Applies a list of (name, value) session settings.
+    """
+    for name, value in settings:
+      self.execute('SET %s=%s' % (name, value))
+
+  def close(self):
+    """
+    Ends the beeline session.
+    """
+    try:
+      self._proc.stdin.write('!quit\n')
+      self._proc.stdin.close()
+    except (BrokenPipeError, OSError):
+      pass
+    self._proc.wait()
+
+  def __enter__(self):
+    return self
+
+  def __exit__(self, exc_type, exc_value, traceback):
+    self.close()
+
+def split_hive_statements(script):
+  """
+  Splits a hive script into its statements, ignoring semicolons in quotes and comments.
+  """
+  statements = []
+  current = []
+  quote = None
+  for line in strip_hive_comments(script).splitlines(True):
+    for _c in line:
+      if quote:
+        if _c == quote:
+          quote = None
+      elif _c in ('"', "'", '`'):
+        quote = _c
+      elif _c == ';':
+        statements.append(''.join(current).strip())
+        current = []
+        continue
+      current.append(_c)
+  statements.append(''.join(current).strip())
+  return [_s for _s in statements if _s]
+
+def find_statement_tables(statement):
+  """
+  Finds the names of the tables and views a hive statement reads from.
+  """
+  statement = strip_hive_comments(statement)
+  _flags = re.IGNORECASE
+  if re.match(r'\s*(?:CREATE|ALTER)\s+(?:OR\s+REPLACE\s+)?VIEW\b', statement, _flags):
+    # Defining a view only stores its query
+    return []
+  ctes = set(_m.lower() for _m in re.findall(r'(?:\bWITH|,)\s*(\w+)\s+AS\s*\(', statement, \
+    _flags))
+  tables = []
+  for _m in re.findall(r'\b(?:FROM|JOIN)\s+([\w.`]+)', statement, _flags):
+    name = _m.replace('`', '').lower()
+    if name not in ctes and name not in tables:
+      tables.append(name)
+  return tables
+
+def estimate_hive_input_size(config, table, cache, session=None):
+  """
+  Estimates the number of bytes a query reading a hive table or view scans, from the HDFS sizes of
+  the table, its partitions, or (for views) the tables the view reads. Returns None if the size
+  cannot be determined, for example when the table does not exist yet. The tables are described
+  through the given HiveSession, if any.
+  """
+  if table in cache:
+    return cache[table]
+  # Guards against views which (indirectly) reference themselves
+  cache[table] = None
+  try:
+    info = describe_hive_table(config, table, session)
+  except subprocess.CalledProcessError:
+    return None
+  if info.table_type == 'VIRTUAL_VIEW':
+    sizes = [estimate_hive_input_size(config, _t, cache, session) \
+      for _t in find_statement_tables(info.view_text or '')]
+  elif info.partition_columns:
+    sizes = [hdfs_content_size(config, _l) \
+      for _l in hive_partition_locations(config, table, session).values()]
+  else:
+    sizes = [hdfs_content_size(config, info.location)]
+  cache[table] = None if None in sizes else sum(sizes)
+  return cache[table]
+
+def format_bytes(num_bytes):
+  """
+  Formats a number of bytes for display.
+  """
+  for unit in ['B', 'KB', 'MB', 'GB']:
+    if num_bytes < 1024:
+      return '%.1f%s' % (num_bytes, unit)
+    num_bytes /= 1024.0
+  return '%.1fTB' % (num_bytes)
+
+def adaptive_hive_script(config, script, local_threshold=LOCAL_MODE_THRESHOLD):
+  """
+  Rewrites a hive script so that each statement whose estimated input is smaller than the
+  threshold runs in local mode (or as a fetch task), and every other statement runs on YARN.
+  Statements reading no tables, such as CREATE VIEW, always run locally. Statements whose input
+  size cannot be estimated run on YARN. The decision for each statement is printed. The tables are
+  described in a single beeline session.
+  """
+  cache = {}
+  lines = []
+  local_settings = [(_n, str(local_threshold) if _n == 'hive.fetch.task.conversion.threshold' \
+    else _v) for _n, _v in HIVE_LOCAL_MODE_SETTINGS]
+  statements = [(_s, find_statement_tables(_s)) for _s in split_hive_statements(script)]
+  with contextlib.ExitStack() as _stack:
+    session = _stack.enter_context(HiveSession(config)) \
+      if any(_t for _s, _t in statements) else None
+    for statement, tables in statements:
+      sizes = [estimate_hive_input_size(config, _t, cache, session) for _t in tables]
+      size = None if None in sizes else sum(sizes)
+      local = size is not None and size < local_threshold
+      print('[%s] input %s: %s' % ('local' if local else 'yarn', \
+        format_bytes(size) if size is not None else 'unknown', ' '.join(statement.split())[:80]))
+      for name, value in (local_settings if local else HIVE_YARN_MODE_SETTINGS):
+        lines.append('SET %s=%s;' % (name, value))
+      lines.append('%s;' % (statement))
+  return '\n'.join(lines) + '\n'
+
+def benchmark_local_mode(config, query, repeat=3):
+  """
+  Runs a query repeatedly in local mode and on YARN in one beeline session and prints the latency
+  of each, so the benefit of local mode for small inputs can be measured.
+  """
+  results = {}
+  with HiveSession(config) as session:
+    for mode, settings in [('local', HIVE_LOCAL_MODE_SETTINGS), ('yarn', HIVE_YARN_MODE_SETTINGS)]:
+      session.set_all(settings)
+      timings = []
+      for _ in range(int(repeat)):
+        result = session.execute(query)
+        if result.error:
+          print('Query failed in %s mode: %s' % (mode, result.error))
+          return None
+        timings.append(result.seconds)
+      results[mode] = sorted(timings)
+  for mode, timings in results.items():
+    print('%s: min %fs, median %fs, max %fs over %d runs' % (mode, timings[0], \
+      timings[len(timings) // 2], timings[-1], len(timings)))
+  print('Local mode speedup (median): %.2fx' % \
+    (results['yarn'][len(results['yarn']) // 2] / results['local'][len(results['local']) // 2]))
+  return results
+
+def hive_tuning_key(src_file):
+  """
+  Normalizes a script path relative to the source directory for the hive_tuning state.
+  """
+  return '/'.join(_p for _p in re.split(r'[\\/]', src_file) if _p not in ('', '.'))
+
+def hive_tune(config, src_file=None, query=None, repeat=3, max_repeat=10, save=False):
+  """
+  Runs a hive script from the source directory (or a query) under each profile in
+  HIVE_TUNING_PROFILES and recommends the profile with the lowest median latency. Each profile gets
+  its own beeline session and one warm-up run, then the profiles take turns so that cluster noise
+  affects them alike. Rounds are repeated at least repeat times, and until the timings of every
+  profile are stable or max_repeat is reached. The script must be safe to run repeatedly (for
+  example INSERT OVERWRITE or SELECT statements). If save is set, the recommendation is stored and
+  applied whenever exec_hive_file() runs the script.
+  """
+  if src_file:
+    with open(os.path.join(config.volumes_dir, 'client', src_file), 'r') as _fp:
+      statements = split_hive_statements(_fp.read())
+  else:
+    statements = split_hive_statements(query or '')
+  if not statements:
+    print('Nothing to tune. Use --src-path or --query.')
+    return None
+  sessions = collections.OrderedDict()
+  timings = collections.OrderedDict()
+  failed = {}
+  try:
+    for name, settings in HIVE_TUNING_PROFILES.items():
+      sessions[name] = HiveSession(config)
+      sessions[name].set_all(settings)
+      timings[name] = []
+
+    def run(name):
+      seconds = 0.0
+      for statement in statements:
+        result = sessions[name].execute(statement)
+        if result.error:
+          failed[name] = result.error
+          return None
+        seconds += result.seconds
+      return seconds
+
+    for name in list(sessions.keys()):
+      print('Warming up profile %s...' % (name))
+      run(name)
+    rounds = 0
+    while rounds < int(max_repeat):
+      for name in sessions.keys():
+        if name not in failed:
+          seconds = run(name)
+          if seconds is not None:
+            timings[name].append(seconds)
+      rounds += 1
+      live = [_t for _n, _t in timings.items() if _n not in failed]
+      if not live:
+        break
+      unstable = [_t for _t in live \
+        if statistics.pstdev(_t) / statistics.mean(_t) > HIVE_TUNING_STABLE_CV]
+      print('Round %d: %d of %d profiles stable.' % (rounds, len(live) - len(unstable), \
+        len(live)))
+      if rounds >= int(repeat) and not unstable:
+        break
+  finally:
+    for session in sessions.values():
+      session.close()
+  for name, error in failed.items():
+    print('Profile %s failed: %s' % (name, error))
+  medians = collections.OrderedDict((_n, statistics.median(_t)) for _n, _t in timings.items() \
+    if _n not in failed and _t)
+  if not medians:
+    print('The script failed under every profile.')
+    return None
+  print('%-22s %10s %10s %10s %6s %6s' % ('PROFILE', 'MEDIAN', 'MIN', 'MAX', 'CV', 'RUNS'))
+  for name, median in medians.items():
+    print('%-22s %9.2fs %9.2fs %9.2fs %6.2f %6d' % (name, median, min(timings[name]), \
+      max(timings[name]), statistics.pstdev(timings[name]) / statistics.mean(timings[name]), \
+      len(timings[name])))
+  best = min(medians, key=medians.get)
+  if 'default' in medians and best != 'default' and \
+    medians[best] > medians['default'] * (1 - HIVE_TUNING_MIN_GAIN):
+    print('Profile %s is less than %d%% faster than the defaults.' % (best, \
+      HIVE_TUNING_MIN_GAIN * 100))
+    best = 'default'
+  if 'default' in medians:
+    print('Recommended profile: %s (%.2fx the default median)' % (best, \
+      medians['default'] / medians[best]))
+  else:
+    print('Recommended profile: %s' % (best))
+  if save:
+    if not src_file:
+      print('Only profiles for script files can be saved.')
+    else:
+      state = load_state(config, 'hive_tuning')
+      state[hive_tuning_key(src_file)] = {
+        'profile': best,
+        'settings': HIVE_TUNING_PROFILES[best],
+        'median_seconds': medians[best],
+        'tuned': datetime.datetime.now().isoformat()
+      }
+      save_state(config, 'hive_tuning', state)
+      print('Saved profile %s for %s.' % (best, src_file))
+  return best
+
+def clear_hive_tuning(config, src_file):
+  """
+  Removes the hive-tune profile saved for a script, so it runs with the server defaults again.
+  """
+  state = load_state(config, 'hive_tuning')
+  if state.pop(hive_tuning_key(src_file), None) is None:
+    print('No profile saved for %s.' % (src_file))
+    return
+  save_state(config, 'hive_tuning', state)
+  print('Cleared the profile saved for %s.' % (src_file))
+
+def percentile(sorted_values, pct):
+  """
+  Gets the nearest-rank percentile of a sorted list of values.
+  """
+  rank = max(1, int(-(-len(sorted_values) * pct // 100)))
+  return sorted_values[min(rank, len(sorted_values)) - 1]
+
+def _hive_load_worker(config, index, workload, rng, deadline, iterations, ready, samples, lock):
+  """
+  Runs randomly chosen workload queries in one hive session until the deadline or the iteration
+  count is reached, appending (query name, seconds, error) samples.
+  """
+  names = [_q['name'] for _q in workload['queries']]
+  queries = {_q['name']: _q['query'] for _q in workload['queries']}
+  weights = [_q.get('weight', 1) for _q in workload['queries']]
+  try:
+    with HiveSession(config) as session:
+      # Blocks until the session is connected so every session starts the run together
+      session.set_all(workload.get('settings', []) or [('hive.exec.mode.local.auto', 'false')])
+      ready.wait()
+      count = 0
+      while (iterations is None or count < iterations) and \
+        (deadline[0] is None or time.time() < deadline[0]):
+        name = rng.choices(names, weights)[0]
+        try:
+          result = session.execute(queries[name])
+        except EOFError as err:
+          with lock:
+            samples.append((name, 0.0, 'Session %d: %s' % (index, err)))
+          return
+        with lock:
+          samples.append((name, result.seconds, result.error))
+        count += 1
+  except threading.BrokenBarrierError:
+    return
+  except Exception as err: # pylint: disable=broad-except
+    # Releases hive_load() and the other sessions if this one fails before the run starts
+    ready.abort()
+    print('Hive session %d failed: %s' % (index, err))
+
+def hive_load(config, workload_file, sessions=4, duration=None, iterations=None, seed=0):
+  """
+  Runs a weighted mix of hive queries from concurrent beeline sessions and prints the throughput,
+  latency percentiles and failures of each query. The workload file is json with a list of
+  queries ({"name", "query", "weight"}) and optional session settings ([name, value] pairs). Each
+  session draws its queries from a random generator seeded with seed + its index, so runs with the
+  same seed issue the same queries. Sessions run for the duration in seconds, or for the number of
+  iterations each (10 if neither is given).
+  """
+  with open(workload_file, 'r') as _fp:
+    workload = json.load(_fp)
+  if not workload.get('queries'):
+    print('Workload "%s" has no queries.' % (workload_file))
+    return None
+  if duration is None and iterations is None:
+    iterations = 10
+  if sessions > 1 and config.metastore == 'derby':
+    print('Note: the derby metastore serializes metadata access between sessions. Consider the' \
+      ' mssql metastore for concurrency testing.')
+
+  samples = []
+  lock = threading.Lock()
+  deadline = [None]
+  ready = threading.Barrier(sessions + 1)
+  threads = [threading.Thread(target=_hive_load_worker, args=(config, i, workload, \
+    random.Random(seed + i), deadline, iterations, ready, samples, lock)) for i in range(sessions)]
+  for _t in threads:
+    _t.start()
+  print('Opening %d hive sessions.' % (sessions))
+  try:
+    ready.wait()
+  except threading.BrokenBarrierError:
+    print('A hive session could not be opened.')
+    for _t in threads:
+      _t.join()
+    return None
+  _start = time.time()
+  if duration is not None:
+    deadline[0] = _start + duration
+  print('Running workload.')
+  for _t in threads:
+    _t.join()
+  elapsed = time.time() - _start
+
+  by_query = collections.OrderedDict((_q['name'], []) for _q in workload['queries'])
+  failures = collections.Counter()
+  for name, seconds, error in samples:
+    if error:
+      failures[name] += 1
+      print('%s failed: %s' % (name, error))
+    else:
+      by_query[name].append(seconds)
+  print('%d queries from %d sessions in %fs: %.2f queries/s' % (len(samples), sessions, elapsed, \
+    len(samples) / elapsed if elapsed else 0.0))
+  print('%-24s %8s %8s %10s %10s %10s' % ('query', 'ok', 'failed', 'p50', 'p90', 'p99'))
+  rows = list(by_query.items()) + [('(all)', [_s for _v in by_query.values() for _s in _v])]
+  for name, timings in rows:
+    timings = sorted(timings)
+    failed = sum(failures.values()) if name == '(all)' else failures[name]
+    if timings:
+      print('%-24s %8d %8d %9.3fs %9.3fs %9.3fs' % (name, len(timings), failed, \
+        percentile(timings, 50), percentile(timings, 90), percentile(timings, 99)))
+    else:
+      print('%-24s %8d %8d %10s %10s %10s' % (name, 0, failed, '-', '-', '-'))
+  return samples
+
+def sqlcmd_args(database_name='master'):
+  """
+  Builds a sqlcmd command line on the client node which reads its statements from stdin.
+  """
+  return ['/opt/mssql-tools/bin/sqlcmd', '-S', 'sql', '-U', 'sa', '-P', SQL_TEST_PASSWORD, \
+    '-d', database_name, '-b', '-I']
+
+def sql_literal(value):
+  """
+  Formats a hive output value as a T-SQL literal. Hive NULLs become SQL NULLs, and numbers are
+  written as numeric literals so sql server does not convert them from strings.
+  """
+  if value is None or value == 'NULL':
+    return 'NULL'
+  if re.fullmatch(SQL_NUMBER_PATTERN, value):
+    return value
+  return "N'%s'" % (value.replace("'", "''"))
+
+def _queue_put(_q, item, failed):
+  """
+  Puts an item on a bounded queue, blocking while it is full unless the transfer has failed.
+  Returns False if the transfer failed before the item could be queued.
+  """
+  while not failed.is_set():
+    try:
+      _q.put(item, timeout=1)
+      return True
+    except queue.Full:
+      pass
+  return False
+
+def _hive_to_sql_write(config, sql_table, database_name, batches, failed, stats, lock):
+  """
+  Drains batches from the queue into a single long-lived sqlcmd session.
+  """
+  proc = subprocess.Popen(docker_exec_args(config, 'client', sqlcmd_args(database_name), \
+    keep_stdin=True), stdin=subprocess.PIPE, universal_newlines=True)
+  try:
+    proc.stdin.write('SET NOCOUNT ON\nGO\n')
+    while not failed.is_set():
+      try:
+        batch = batches.get(timeout=1)
+      except queue.Empty:
+        continue
+      if batch is None:
+        break
+      for _i in range(0, len(batch), SQL_MAX_INSERT_ROWS):
+        rows = batch[_i:_i + SQL_MAX_INSERT_ROWS]
+        proc.stdin.write('INSERT INTO %s VALUES\n%s;\n' % (sql_table, ',\n'.join( \
+          '(%s)' % (', '.join(sql_literal(_v) for _v in _r)) for _r in rows)))
+      proc.stdin.write('GO\n')
+      proc.stdin.flush()
+      with lock:
+        stats['rows_written'] += len(batch)
+  except (BrokenPipeError, OSError):
+    failed.set()
+  finally:
+    try:
+      proc.stdin.close()
+    except (BrokenPipeError, OSError):
+      pass
+    if proc.wait() != 0:
+      with lock:
+        stats['failed_cmd'] = 'sqlcmd'
+      failed.set()
+
+def hive_to_sql(config, query, sql_table, database_name='master', \
+  batch_size=HIVE_TO_SQL_BATCH_SIZE, queue_size=HIVE_TO_SQL_QUEUE_SIZE, writers=2):
+  """
+  Streams the results of a hive query straight into an existing sql table, without materializing
+  an intermediate delimited table in HDFS. Rows are read from beeline in batches and handed to
+  concurrent sqlcmd writers through a bounded queue, so the reader blocks (and beeline with it)
+  whenever the writers fall behind. At most (queue_size + writers + 1) * batch_size rows are held
+  in memory regardless of the result size.
+  """
+  batch_size = int(batch_size)
+  writers = int(writers)
+  if writers < 1:
+    raise ValueError('At least one sql writer is required.')
+  batches = queue.Queue(maxsize=int(queue_size))
+  failed = threading.Event()
+  stats = {'rows_read': 0, 'rows_written': 0, 'batches': 0, 'failed_cmd': None}
+  lock = threading.Lock()
+  _start = time.time()
+
+  writer_threads = [threading.Thread(target=_hive_to_sql_write, args=(config, sql_table, \
+    database_name, batches, failed, stats, lock)) for _ in range(writers)]
+  for _t in writer_threads:
+    _t.start()
+
+  reader = subprocess.Popen(docker_exec_args(config, 'client', beeline_args(query), \
+    workdir='/src'), stdout=subprocess.PIPE, universal_newlines=True)
+  batch = []
+  for row in csv.reader(reader.stdout, delimiter='\t'):
+    batch.append(row)
+    if len(batch) >= batch_size:
+      if not _queue_put(batches, batch, failed):
+        break
+      stats['rows_read'] += len(batch)
+      stats['batches'] += 1
+      batch = []
+  if batch and _queue_put(batches, batch, failed):
+    stats['rows_read'] += len(batch)
+    stats['batches'] += 1
+
+  if failed.is_set():
+    reader.kill()
+  if reader.wait() != 0 and not failed.is_set():
+    with lock:
+      stats['failed_cmd'] = 'beeline'
+    failed.set()
+  for _t in writer_threads:
+    _queue_put(batches, None, failed)
+  for _t in writer_threads:
+    _t.join()
+
+  _elapsed = time.time() - _start
+  print('Transferred %d of %d rows in %d batches to %s.%s in %fs (%f rows/s).' % \
+    (stats['rows_written'], stats['rows_read'], stats['batches'], database_name, sql_table, \
+    _elapsed, stats['rows_written'] / _elapsed if _elapsed > 0 else 0))
+  if failed.is_set():
+    raise subprocess.CalledProcessError(1, stats['failed_cmd'] or 'hive-to-sql')
+  return stats['rows_written']
+
+def load_pipeline(pipeline_file):
+  """
+  Loads a pipeline file and checks that its steps have unique names, known kinds and known
+  dependencies, and that the dependencies have no cycles. Raises a ValueError otherwise.
+  """
+  with open(pipeline_file, 'r') as _fp:
+    steps = json.load(_fp)['steps']
+  names = [_s['name'] for _s in steps]
+  for step in steps:
+    if names.count(step['name']) > 1:
+      raise ValueError('Pipeline step "%s" is defined more than once.' % (step['name']))
+    if step['kind'] not in PIPELINE_STEP_KINDS:
+      raise ValueError('Pipeline step "%s" has an unknown kind "%s".' % (step['name'], \
+        step['kind']))
+    for need in step.get('needs', []):
+      if need not in names:
+        raise ValueError('Pipeline step "%s" needs an unknown step "%s".' % (step['name'], need))
+  ordered = []
+  while len(ordered) < len(steps):
+    ready = [_s['name'] for _s in steps if _s['name'] not in ordered and \
+      all(_n in ordered for _n in _s.get('needs', []))]
+    if not ready:
+      raise ValueError('The pipeline steps %s depend on each other.' % \
+        (', '.join(_n for _n in names if _n not in ordered)))
+    ordered.extend(ready)
+  return collections.OrderedDict((_s['name'], _s) for _s in steps)
+
+def pipeline_input_fingerprint(config, item):
+  """
+  Fingerprints a pipeline step input: a file in the source directory ("src:hive/script.hql"), the
+  data directory or a path within it ("data:" or "data:m33_0.01/cp") from its file sizes and
+  modification times, or an HDFS path ("hdfs:/user/hive/warehouse/m33", see hdfs_fingerprint()).
+  """
+  kind, _sep, path = item.partition(':')
+  if kind == 'src':
+    _f = os.path.join(config.source_dir, *path.split('/'))
+    if not os.path.exists(_f):
+      return 'missing'
+    with open(_f, 'rb') as _fp:
+      return hashlib.sha256(_fp.read()).hexdigest()
+  if kind == 'data':
+    root = os.path.join(config.data_dir, *[_p for _p in path.split('/') if _p])
+    listing = []
+    for _dir, _dirs, _files in os.walk(root):
+      _dirs.sort()
+      for name in sorted(_files):
+        _stat = os.stat(os.path.join(_dir, name))
+        listing.append([os.path.relpath(os.path.join(_dir, name), root).replace(os.sep, '/'), \
+          _stat.st_size, _stat.st_mtime])
+    return hashlib.sha256(json.dumps(listing).encode()).hexdigest()
+  if kind == 'hdfs':
+    return json.dumps(hdfs_fingerprint(config, path))
+  raise ValueError('Unknown pipeline input "%s".' % (item))
+
+def pipeline_output_exists(config, item):
+  """
+  Checks that a pipeline step output still exists: an HDFS path ("hdfs:/path") or a hive table or
+  view ("hive:m33"). Other outputs (for example "sql:astroDB.m33") are not checked.
+  """
+  kind, _sep, path = item.partition(':')
+  if kind == 'hdfs':
+    return webhdfs_request(config, path, 'GETFILESTATUS') is not None
+  if kind == 'hive':
+    return bool(hive_query_rows(config, "SHOW TABLES LIKE '%s'" % (path)))
+  return True
+
+def pipeline_step_key(config, step, need_keys):
+  """
+  Hashes a pipeline step definition, the fingerprints of its inputs (including the script file of
+  hive-file and sql-file steps) and the keys of the steps it needs, so that a change to any of them
+  changes the key.
+  """
+  digest = hashlib.sha256(json.dumps(step, sort_keys=True).encode())
+  for key in need_keys:
+    digest.update(key.encode())
+  inputs = list(step.get('inputs', []))
+  if step['kind'] in ['hive-file', 'sql-file']:
+    inputs.append('src:%s' % (step['file']))
+  for item in inputs:
+    digest.update(item.encode())
+    digest.update(pipeline_input_fingerprint(config, item).encode())
+  return digest.hexdigest()
+
+def run_pipeline_step(config, step):
+  """
+  Runs a single pipeline step. Raises a subprocess.CalledProcessError if a command fails.
+  """
+  kind = step['kind']
+  if kind == 'setup':
+    setup(config, use_snapshot=step.get('snapshot', False))
+  elif kind == 'start':
+    if gen_health_summary(config).cluster_healthy:
+      print('The cluster is already running.')
+    else:
+      start(config)
+  elif kind == 'stop':
+    stop(config)
+  elif kind == 'hive-file':
+    exec_hive_file(config, step['file'], analyze=step.get('analyze', False))
+  elif kind == 'hive-query':
+    exec_hive_query(config, step['query'])
+  elif kind == 'sql-file':
+    sql_exec_file(config, step['file'])
+  elif kind == 'sql-query':
+    sql_exec_query(config, step['query'], step.get('database', 'master'))
+  elif kind == 'sqoop-export':
+    sqoop_export(config, step['export_dir'], step['table'], step.get('database', 'master'), \
+      step.get('delimiter', ','))
+
+def run_pipeline(config, pipeline_file, workers=4, force=None):
+  """
+  Runs the steps of a pipeline file (see ./examples/pipeline.json) as a DAG: each step starts as
+  soon as the steps it needs have completed, up to workers steps at once. A step has a name, a
+  kind (see PIPELINE_STEP_KINDS) with its options, the steps it needs, its inputs (see
+  pipeline_input_fingerprint()) and its outputs (see pipeline_output_exists()). Steps whose key
+  (see pipeline_step_key()) matches their last successful run and whose outputs still exist are
+  skipped, so after a failure the next run resumes from the failed step. Start and stop steps
+  always run, and steps named in force (or all steps, if force is 'all') are rerun. With the derby
+  metastore, hive steps run one at a time. Returns True if every step succeeded.
+  """
+  steps = load_pipeline(pipeline_file)
+  force = force or []
+  copy_source(config)
+  state = load_state(config, 'pipeline')
+  results = state.setdefault(os.path.abspath(pipeline_file), {})
+  keys = {}
+  done = set()
+  failed = []
+  hive_lock = threading.Lock() if config.metastore == 'derby' else contextlib.nullcontext()
+
+  def run(name):
+    step = steps[name]
+    keys[name] = pipeline_step_key(config, step, [keys[_n] for _n in step.get('needs', [])])
+    if step['kind'] not in PIPELINE_UNCACHED_KINDS and step.get('cache', True) and \
+      name not in force and 'all' not in force and results.get(name) == keys[name] and \
+      all(pipeline_output_exists(config, _o) for _o in step.get('outputs', [])):
+      print('[%s] Skipped, nothing changed.' % (name))
+      return False
+    print('[%s] Running %s step.' % (name, step['kind']))
+    _start = time.time()
+    with hive_lock if step['kind'] in PIPELINE_HIVE_KINDS else contextlib.nullcontext():
+      run_pipeline_step(config, step)
+    print('[%s] Completed in %fs.' % (name, time.time() - _start))
+    return True
+
+  _start = time.time()
+  with concurrent.futures.ThreadPoolExecutor(max_workers=workers) as executor:
+    running = {}
+    while True:
+      if not failed:
+        for name, step in steps.items():
+          if name not in done and name not in running.values() and \
+            all(_n in done for _n in step.get('needs', [])):
+            running[executor.submit(run, name)] = name
+      if not running:
+        break
+      finished, _pending = concurrent.futures.wait(running, \
+        return_when=concurrent.futures.FIRST_COMPLETED)
+      for future in finished:
+        name = running.pop(future)
+        try:
+          future.result()
+        except Exception as err: # pylint: disable=broad-except
+          print('[%s] Failed: %s' % (name, err))
+          failed.append(name)
+          results.pop(name, None)
+          continue
+        done.add(name)
+        results[name] = keys[name]
+      save_state(config, 'pipeline', state)
+  if failed:
+    print('Pipeline failed at %s after %fs. %d of %d steps completed; run it again to resume.' \
+      % (', '.join(failed), time.time() - _start, len(done), len(steps)))
+    return False
+  print('Pipeline completed in %fs.' % (time.time() - _start))
+  return True
+
 def input_with_validator(prompt, failure_msg, validator_func):
   """
   Prompts for interactive user input using a validator function.
@@ -795,6 +4624,8 @@ def set_environment(config):
   os.environ['data_dir'] = config.data_dir
   os.environ['volumes_dir'] = config.volumes_dir
   os.environ['sql_test_password'] = SQL_TEST_PASSWORD
+  for port, name in PORT_ENV_VARS:
+    os.environ[name] = str(host_port(config, port))
 
 def configure(args):
   """
@@ -826,8 +4657,17 @@ def configure(args):
       config.data_dir = args.data_dir
     if args.volumes_dir:
       config.volumes_dir = args.volumes_dir
+    if args.metastore:
+      config.metastore = args.metastore
   else:
-    config = Config(args.project_name, args.source_dir, args.data_dir, args.volumes_dir)
+    config = Config(args.project_name, args.source_dir, args.data_dir, args.volumes_dir, \
+      args.metastore or 'derby')
+  if args.port_base:
+    config.port_base = args.port_base
+  if args.block_layout:
+    config.block_layout = args.block_layout
+  if args.jvm_opts:
+    config.jvm_options = dict(config.jvm_options, **dict(_o.split('=', 1) for _o in args.jvm_opts))
 
   return config
 
@@ -862,7 +4702,7 @@ def build_img_cmd(config, args):
   """
   Command line function. See build_img() for documentation.
   """
-  build_img(config)
+  build_img(config, args.force)
 
 def format_hdfs_cmd(config, args):
   """
@@ -874,7 +4714,42 @@ def ingest_data_cmd(config, args):
   """
   Command line function. See ingest_data() for documentation.
   """
-  ingest_data(config)
+  ingest_data(config, args.partition_pattern, args.partition_root, args.block_size, \
+    args.replication, args.profile, args.header_lines)
+
+def local_preview_cmd(config, args):
+  """
+  Command line function. See local_preview() for documentation.
+  """
+  local_preview(config, args.path, args.workers, args.limit, args.chunk_size)
+
+def seed_statistics_cmd(config, args):
+  """
+  Command line function. See seed_statistics() for documentation.
+  """
+  seed_statistics(config, args.table)
+
+def ingest_normalized_cmd(config, args):
+  """
+  Command line function. See ingest_normalized() for documentation.
+  """
+  columns = parse_hive_columns(args.columns) if args.columns else None
+  ingest_normalized(config, args.table, columns, args.partition_pattern, args.header_lines, \
+    args.root, workers=args.workers)
+
+def ingest_compacted_cmd(config, args):
+  """
+  Command line function. See ingest_compacted() for documentation.
+  """
+  columns = parse_hive_columns(args.columns) if args.columns else None
+  ingest_compacted(config, args.table, columns, args.partition_pattern, args.header_lines, \
+    args.root, args.block_size, workers=args.workers)
+
+def register_partitions_cmd(config, args):
+  """
+  Command line function. See register_partitions() for documentation.
+  """
+  register_partitions(config, args.table, args.partition_root)
 
 def copy_source_cmd(config, args):
   """
@@ -906,6 +4781,24 @@ def start_hive_server_cmd(config, args):
   """
   start_hive_server(config)
 
+def pool_cmd(config, args):
+  """
+  Command line function. Manages the cluster pool (see ClusterPool) used by test suites.
+  """
+  pool = ClusterPool(config, args.size)
+  if args.action == 'warm':
+    pool.warm()
+  elif args.action == 'stop':
+    pool.stop()
+  elif args.action == 'clear-leases':
+    pool.clear_leases()
+  else:
+    for index in range(args.size):
+      member = pool.member(index)
+      leased = os.path.exists(pool.lease_path(index))
+      print('%s: %s, %s' % (member.project_name, get_summary_preview_str( \
+        gen_health_summary(member)), 'leased' if leased else 'free'))
+
 def cluster_down_cmd(config, args):
   """
   Command line function. See cluster_down() for documentation.
@@ -917,7 +4810,7 @@ def setup_cmd(config, args):
   Command line function. See setup() for documentation.
   """
   if args.skip_confirm:
-    setup(config)
+    setup(config, use_snapshot=args.snapshot)
     return
 
   result = input_with_validator('Are you sure you want to delete directory "%s" and all of its' \
@@ -926,15 +4819,37 @@ def setup_cmd(config, args):
     validate_yn \
   ).lower()
   if result == 'y':
-    setup(config)
+    setup(config, use_snapshot=args.snapshot)
   else:
     print('Cancelling.')
 
+def snapshot_cmd(config, args):
+  """
+  Command line function. See snapshot() for documentation.
+  """
+  snapshot(config, archive=args.archive)
+
+def restore_cmd(config, args):
+  """
+  Command line function. See restore() for documentation.
+  """
+  if not restore(config, args.label):
+    sys.exit(1)
+
 def start_cmd(config, args):
   """
   Command line function. See start() for documentation.
   """
-  start(config, wait=not args.no_wait)
+  start(config, wait=not args.no_wait, sizing=not args.no_sizing)
+
+def size_resources_cmd(config, args):
+  """
+  Command line function. See size_resources() for documentation.
+  """
+  if args.dry_run:
+    print_resource_plan(plan_resources(*detect_host_resources()))
+    return
+  size_resources(config, args.force)
 
 def stop_cmd(config, args):
   """
@@ -942,6 +4857,18 @@ def stop_cmd(config, args):
   """
   stop(config)
 
+def suspend_cmd(config, args):
+  """
+  Command line function. See suspend() for documentation.
+  """
+  suspend(config, args.mode)
+
+def resume_cmd(config, args):
+  """
+  Command line function. See resume() for documentation.
+  """
+  resume(config, wait=not args.no_wait, timeout=args.timeout)
+
 def destroy_volumes_cmd(config, args):
   """
   Command line function. See destroy_volumes() for documentation.
@@ -966,6 +4893,25 @@ def print_hadoop_node_logs_cmd(config, args):
   """
   print_hadoop_node_logs(config, args.node)
 
+def logs_cmd(config, args):
+  """
+  Command line function. See logs() for documentation.
+  """
+  logs(config, args.node, args.level, args.since, args.until, args.regex, args.daemon, \
+    args.follow, args.from_start)
+
+def index_logs_cmd(config, args):
+  """
+  Command line function. See index_logs() for documentation.
+  """
+  index_logs(config, args.node)
+
+def query_logs_cmd(config, args):
+  """
+  Command line function. See query_logs() for documentation.
+  """
+  query_logs(config, args.query, args.sql, args.threshold, args.limit)
+
 def beeline_cli_cmd(config, args):
   """
   Command line function. See beeline_cli() for documentation.
@@ -1006,7 +4952,7 @@ def local_sql_info_cmd(config, args):
   """
   Command line function. Prints out non-secured sql server connection info.
   """
-  print('SERVER NAME: tcp:localhost,%d' % (PORT_SQL_SQL))
+  print('SERVER NAME: tcp:localhost,%d' % (host_port(config, PORT_OFFSET_SQL)))
   print('AUTHENTICATION: SQL Server AUthentication')
   print('LOGIN: sa')
   print('PASSWORD: %s' % (SQL_TEST_PASSWORD))
@@ -1015,19 +4961,93 @@ def launch_ssms_win_local_cmd(config, args):
   """
   Command line function. See launch_ssms_win_local() for documentation.
   """
-  launch_ssms_win_local(args.executable_path)
+  launch_ssms_win_local(config, args.executable_path)
 
 def exec_hive_file_cmd(config, args):
   """
   Command line function. See exec_hive_file() for documentation.
   """
-  exec_hive_file(config, args.src_path)
+  exec_hive_file(config, args.src_path, analyze=args.analyze, adaptive=args.adaptive, \
+    local_threshold=args.local_threshold)
+
+def analyze_cmd(config, args):
+  """
+  Command line function. See analyze_tables() for documentation.
+  """
+  targets = {}
+  if args.src_path:
+    targets.update(find_hive_file_targets(config, args.src_path))
+  for table in args.tables or []:
+    targets[table.lower()] = set()
+  if not targets:
+    print('No tables to analyze. Use --tables or --src-path.')
+    return
+  analyze_tables(config, targets, force=args.force)
 
 def exec_hive_query_cmd(config, args):
   """
   Command line function. See exec_hive_query() for documentation.
   """
-  exec_hive_query(config, args.query)
+  exec_hive_query(config, args.query, adaptive=args.adaptive, \
+    local_threshold=args.local_threshold)
+
+def benchmark_local_mode_cmd(config, args):
+  """
+  Command line function. See benchmark_local_mode() for documentation.
+  """
+  benchmark_local_mode(config, args.query, args.repeat)
+
+def hive_tune_cmd(config, args):
+  """
+  Command line function. See hive_tune() for documentation.
+  """
+  if args.clear:
+    if not args.src_path:
+      print('Use --src-path with --clear.')
+      return
+    clear_hive_tuning(config, args.src_path)
+    return
+  hive_tune(config, args.src_path, args.query, args.repeat, args.max_repeat, args.save)
+
+def hive_load_cmd(config, args):
+  """
+  Command line function. See hive_load() for documentation.
+  """
+  hive_load(config, args.workload, args.sessions, args.duration, args.iterations, args.seed)
+
+def hive_to_sql_cmd(config, args):
+  """
+  Command line function. See hive_to_sql() for documentation.
+  """
+  hive_to_sql(config, args.query, args.sql_table, args.database_name, args.batch_size, \
+    args.queue_size, args.writers)
+
+def run_pipeline_cmd(config, args):
+  """
+  Command line function. See run_pipeline() for documentation.
+  """
+  if not run_pipeline(config, args.pipeline, args.workers, args.force):
+    sys.exit(1)
+
+def materialize_view_cmd(config, args):
+  """
+  Command line function. See materialize_view() for documentation.
+  """
+  materialize_view(config, args.view, args.table, args.source_table, args.force, \
+    TableLayout(args.cluster_by, args.sort_by, args.buckets, args.bloom_filter))
+
+def create_layout_table_cmd(config, args):
+  """
+  Command line function. See create_layout_table() for documentation.
+  """
+  create_layout_table(config, args.source, args.table, TableLayout(args.cluster_by, \
+    args.sort_by, args.buckets, args.bloom_filter))
+
+def benchmark_layout_cmd(config, args):
+  """
+  Command line function. See benchmark_layout() for documentation.
+  """
+  benchmark_layout(config, args.table, args.query, args.repeat)
 
 def print_health_cmd(config, args):
   """
@@ -1065,21 +5085,122 @@ def main():
   config_group.add_argument('--source-dir', '-s')
   config_group.add_argument('--data-dir', '-d')
   config_group.add_argument('--volumes-dir', '-v')
-  config_group.set_defaults(project_name=None, source_dir=None, data_dir=None, volumes_dir=None)
+  config_group.add_argument('--metastore', choices=METASTORE_TYPES)
+  config_group.add_argument('--jvm-opts', action='append', metavar='DAEMON=OPTIONS', help='Extra' \
+    ' jvm options of a daemon. May be repeated.')
+  config_group.add_argument('--port-base', help='The first localhost port the nodes are exposed' \
+    ' on, or "auto" to pick free ports.')
+  config_group.add_argument('--block-layout', choices=BLOCK_LAYOUTS, help='How setup chooses the' \
+    ' block size and replication of the ingested data.')
+  config_group.set_defaults(project_name=None, source_dir=None, data_dir=None, volumes_dir=None, \
+    metastore=None, jvm_opts=None, port_base=None, block_layout=None)
 
   subparsers = parser.add_subparsers()
 
   # build-img
-  subparsers.add_parser('build-img', help='Builds or rebuilds the required Docker images. Do this' \
-    ' when you change the Dockerfile or anything in ./bin/.').set_defaults(func=build_img_cmd)
+  build_img_p = subparsers.add_parser('build-img', help='Builds or rebuilds the required Docker' \
+    ' images. Do this when you change the Dockerfile or anything in ./bin/. Skipped when neither' \
+    ' changed since the last build.')
+  build_img_p.add_argument('--force', action='store_true', help='Builds even if the image inputs' \
+    ' did not change.')
+  build_img_p.set_defaults(func=build_img_cmd, force=False)
 
   # format-hdfs
   subparsers.add_parser('format-hdfs', help='Formats the entire distributed file system of the' \
     ' running cluster.').set_defaults(func=format_hdfs_cmd)
 
   # ingest-data
-  subparsers.add_parser('ingest-data', help='Copies the mounted data volume to HDFS at /data on' \
-    ' the running cluster.').set_defaults(func=ingest_data_cmd)
+  ingest_data_p = subparsers.add_parser('ingest-data', help='Copies the mounted data volume to' \
+    ' HDFS at /data on the running cluster.')
+  ingest_data_p.add_argument('--partition-pattern', nargs='?', const=M33_PARTITION_PATTERN, \
+    help='A regular expression searched for in each data file path. Its named groups become hive' \
+    ' partition directories (default without a value: "%s" for the example data). The matching' \
+    ' files are moved out of /data, so tables over /data (like m33_raw) no longer see them.' \
+    % (M33_PARTITION_PATTERN.replace('%', '%%')))
+  ingest_data_p.add_argument('--partition-root', help='The HDFS directory to lay the partition' \
+    ' directories out under.')
+  ingest_data_p.add_argument('--block-size', help='The HDFS block size in bytes, or "auto" to' \
+    ' choose it from the data file sizes and the cluster parallelism.')
+  ingest_data_p.add_argument('--replication', help='The HDFS replication factor, or "auto" to' \
+    ' choose it from the number of data nodes.')
+  ingest_data_p.add_argument('--profile', action='store_true', help='Profiles the data files' \
+    ' while they are copied (row counts, min/max, nulls and distinct counts per column) and sets' \
+    ' the statistics of the hive tables over them.')
+  ingest_data_p.add_argument('--header-lines', type=int, help='The number of header lines at the' \
+    ' start of each data file left out of the profiles (default: %d, as in the example data).' \
+    % (M33_HEADER_LINES))
+  ingest_data_p.set_defaults(func=ingest_data_cmd, partition_pattern=None, \
+    partition_root=PARTITION_ROOT, block_size=None, replication=None, profile=False, \
+    header_lines=M33_HEADER_LINES)
+
+  # seed-stats
+  seed_stats_p = subparsers.add_parser('seed-stats', help='Sets the hive statistics of a text' \
+    ' table and its partitions from the profiles taken by ingest-data --profile, for tables' \
+    ' created after the ingest.')
+  seed_stats_p.add_argument('--table', '-t', help='The hive table reading the ingested files.')
+  seed_stats_p.set_defaults(func=seed_statistics_cmd)
+
+  # local-preview
+  local_preview_p = subparsers.add_parser('local-preview', help='Runs the m33_schem view' \
+    ' transformation over the local data files with NumPy, without the cluster.')
+  local_preview_p.add_argument('--path', '-d', help='A file or directory relative to the data' \
+    ' folder to preview instead of the whole folder.')
+  local_preview_p.add_argument('--workers', '-j', type=int, help='The number of parsing processes' \
+    ' (default: one per cpu).')
+  local_preview_p.add_argument('--limit', '-n', type=int, help='The number of sample rows to' \
+    ' print.')
+  local_preview_p.add_argument('--chunk-size', type=int, help='The number of bytes of a file each' \
+    ' task parses.')
+  local_preview_p.set_defaults(func=local_preview_cmd, path=None, workers=None, limit=10, \
+    chunk_size=LOCAL_PREVIEW_CHUNK_SIZE)
+
+  # ingest-normalized
+  ingest_normalized_p = subparsers.add_parser('ingest-normalized', help='Ingests the data' \
+    ' files without headers and with tab separated values, and creates a delimited hive table' \
+    ' over them.')
+  ingest_normalized_p.add_argument('--table', '-t', help='The external hive table to (re)create.')
+  ingest_normalized_p.add_argument('--columns', '-c', help='The table columns, for example' \
+    ' "wavelength DOUBLE, flam DOUBLE". Inferred from the first data file if not given.')
+  ingest_normalized_p.add_argument('--partition-pattern', help='A regular expression whose named' \
+    ' groups become partition directories and columns (see ingest-data).')
+  ingest_normalized_p.add_argument('--header-lines', type=int, help='The number of header lines' \
+    ' to strip from each data file.')
+  ingest_normalized_p.add_argument('--root', '-r', help='The HDFS directory to write to. It is' \
+    ' emptied first, so it must be empty or written by an earlier ingest.')
+  ingest_normalized_p.add_argument('--workers', '-j', type=int, help='The number of files' \
+    ' streamed at once.')
+  ingest_normalized_p.set_defaults(func=ingest_normalized_cmd, columns=None, \
+    partition_pattern=None, header_lines=0, root=NORMALIZED_ROOT, workers=4)
+
+  # ingest-compacted
+  ingest_compacted_p = subparsers.add_parser('ingest-compacted', help='Ingests many small data' \
+    ' files packed into block sized container files, with a source_file column, and creates a' \
+    ' delimited hive table over them.')
+  ingest_compacted_p.add_argument('--table', '-t', help='The external hive table to (re)create.')
+  ingest_compacted_p.add_argument('--columns', '-c', help='The data columns after source_file,' \
+    ' for example "wavelength DOUBLE, flam DOUBLE". Inferred from the first data file if not' \
+    ' given.')
+  ingest_compacted_p.add_argument('--partition-pattern', help='A regular expression whose named' \
+    ' groups become partition directories and columns (see ingest-data).')
+  ingest_compacted_p.add_argument('--header-lines', type=int, help='The number of header lines' \
+    ' to strip from each data file.')
+  ingest_compacted_p.add_argument('--root', '-r', help='The HDFS directory to write to. It is' \
+    ' emptied first, so it must be empty or written by an earlier ingest.')
+  ingest_compacted_p.add_argument('--block-size', type=int, help='The container file and HDFS' \
+    ' block size in bytes.')
+  ingest_compacted_p.add_argument('--workers', '-j', type=int, help='The number of partitions' \
+    ' packed at once.')
+  ingest_compacted_p.set_defaults(func=ingest_compacted_cmd, columns=None, \
+    partition_pattern=None, header_lines=0, root=COMPACTED_ROOT, block_size=COMPACT_BLOCK_SIZE, \
+    workers=4)
+
+  # register-partitions
+  register_partitions_p = subparsers.add_parser('register-partitions', help='Registers all' \
+    ' hive-style partition directories under an HDFS path with a hive table in one batch.')
+  register_partitions_p.add_argument('--table', '-t', help='The partitioned hive table.')
+  register_partitions_p.add_argument('--partition-root', '-r', help='The HDFS directory' \
+    ' containing the partition directories.')
+  register_partitions_p.set_defaults(func=register_partitions_cmd, partition_root=PARTITION_ROOT)
 
   # copy-source
   subparsers.add_parser('copy-source', help='Copies the configured source folder to the mounted' \
@@ -1110,19 +5231,69 @@ def main():
   setup_p = subparsers.add_parser('setup', help='Sets up the cluster for the first time.')
   setup_p.add_argument('--skip-confirm', '-y', action='store_true', help='Skips any confirmation' \
     ' messages')
-  setup_p.set_defaults(func=setup_cmd, skip_confirm=False)
+  setup_p.add_argument('--snapshot', action='store_true', help='Restores a snapshot matching the' \
+    ' data directory and configuration if there is one, or takes one after setting up otherwise.')
+  setup_p.set_defaults(func=setup_cmd, skip_confirm=False, snapshot=False)
+
+  # snapshot
+  snapshot_p = subparsers.add_parser('snapshot', help='Captures the volumes of a set up cluster,' \
+    ' labeled by a hash of the data directory and configuration.')
+  snapshot_p.add_argument('--archive', action='store_true', help='Stores the snapshot as a' \
+    ' compressed archive instead of a copy.')
+  snapshot_p.set_defaults(func=snapshot_cmd, archive=False)
+
+  # pool
+  pool_p = subparsers.add_parser('pool', help='Manages a pool of pre-started clusters which test' \
+    ' suites lease through the ClusterPool python api.')
+  pool_p.add_argument('action', choices=['warm', 'status', 'stop', 'clear-leases'], help='warm' \
+    ' provisions and starts the pool clusters, stop spins them down, and clear-leases frees the' \
+    ' clusters leased by killed test runs.')
+  pool_p.add_argument('--size', '-k', type=int, help='The number of clusters in the pool.')
+  pool_p.set_defaults(func=pool_cmd, size=2)
+
+  # restore
+  restore_p = subparsers.add_parser('restore', help='Replaces the volumes with a snapshot.')
+  restore_p.add_argument('--label', '-l', help='The snapshot label. Defaults to the label of the' \
+    ' current data directory and configuration.')
+  restore_p.set_defaults(func=restore_cmd, label=None)
 
   # start
   start_p = subparsers.add_parser('start', help='Spins up the cluster and starts the daemons on ' \
     'each node.')
   start_p.add_argument('--no-wait', '-w', action='store_true', help='Exits immediately after ' \
     'the cluster daemons have been told to start rather than blocking until the nodes are healthy.')
-  start_p.set_defaults(func=start_cmd, no_wait=False)
+  start_p.add_argument('--no-sizing', action='store_true', help='Keeps the YARN resource' \
+    ' configuration as is instead of sizing it for the host.')
+  start_p.set_defaults(func=start_cmd, no_wait=False, no_sizing=False)
+
+  # size-resources
+  size_resources_p = subparsers.add_parser('size-resources', help='Sizes the YARN and MapReduce' \
+    ' resources for the host cpus and memory. Daemons must be restarted to pick up the sizes.')
+  size_resources_p.add_argument('--dry-run', action='store_true', help='Only prints the plan.')
+  size_resources_p.add_argument('--force', action='store_true', help='Also sizes configuration' \
+    ' files with local edits.')
+  size_resources_p.set_defaults(func=size_resources_cmd, dry_run=False, force=False)
 
   # stop
   subparsers.add_parser('stop', help='Stops all of the services and shuts down all of the nodes.') \
     .set_defaults(func=stop_cmd)
 
+  # suspend
+  suspend_p = subparsers.add_parser('suspend', help='Suspends the cluster without removing its' \
+    ' containers, so resume brings it back quickly.')
+  suspend_p.add_argument('--mode', '-m', choices=SUSPEND_MODES, help='pause (default) keeps the' \
+    ' daemons in memory; stop frees the memory and restarts the daemons on resume.')
+  suspend_p.set_defaults(func=suspend_cmd, mode='pause')
+
+  # resume
+  resume_p = subparsers.add_parser('resume', help='Resumes a suspended cluster, starting only the' \
+    ' daemons which are not running, and waits for it to be healthy.')
+  resume_p.add_argument('--no-wait', action='store_true', help='Does not wait for the nodes to' \
+    ' be healthy.')
+  resume_p.add_argument('--timeout', '-t', type=int, help='The seconds to wait for the nodes to' \
+    ' be healthy.')
+  resume_p.set_defaults(func=resume_cmd, no_wait=False, timeout=200)
+
   # destroy-vol
   destroy_vol_p = subparsers.add_parser('destroy-vol', help='Removes all persisted cluster files.')
   destroy_vol_p.add_argument('--skip-confirm', '-y', action='store_true')
@@ -1134,6 +5305,45 @@ def main():
   print_hadoop_node_logs_p.add_argument('--node', '-n', help='The node to check the logs for.')
   print_hadoop_node_logs_p.set_defaults(func=print_hadoop_node_logs_cmd)
 
+  # logs
+  logs_p = subparsers.add_parser('logs', help='Prints the new log records of the hadoop and hive' \
+    ' daemons, filtered on the nodes and ordered by timestamp.')
+  logs_p.add_argument('--node', '-n', action='append', choices=HADOOP_NODES, help='A node to read' \
+    ' the logs of. May be repeated. Defaults to all hadoop nodes.')
+  logs_p.add_argument('--level', '-l', type=str.upper, choices=LOG_LEVELS, help='The minimum log' \
+    ' level.')
+  logs_p.add_argument('--since', help='Only records at or after this time (YYYY-MM-DD HH:MM:SS).')
+  logs_p.add_argument('--until', help='Only records at or before this time (YYYY-MM-DD HH:MM:SS).')
+  logs_p.add_argument('--regex', '-e', help='Only records (including stack traces) matching this' \
+    ' regular expression.')
+  logs_p.add_argument('--daemon', '-d', help='Only logs of daemons matching this regular' \
+    ' expression, for example namenode or hive.')
+  logs_p.add_argument('--follow', '-f', action='store_true', help='Keeps printing new records' \
+    ' until interrupted.')
+  logs_p.add_argument('--from-start', action='store_true', help='Reads the logs from the start' \
+    ' instead of where the previous call stopped.')
+  logs_p.set_defaults(func=logs_cmd, node=None, level=None, since=None, until=None, regex=None, \
+    daemon=None, follow=False, from_start=False)
+
+  # index-logs
+  index_logs_p = subparsers.add_parser('index-logs', help='Parses the new hadoop and hive log' \
+    ' records into a local sqlite index for query-logs.')
+  index_logs_p.add_argument('--node', '-n', action='append', choices=HADOOP_NODES, help='A node' \
+    ' to index the logs of. May be repeated. Defaults to all hadoop nodes.')
+  index_logs_p.set_defaults(func=index_logs_cmd, node=None)
+
+  # query-logs
+  query_logs_p = subparsers.add_parser('query-logs', help='Queries the log index built by' \
+    ' index-logs.')
+  query_logs_p.add_argument('--query', '-q', choices=list(LOG_QUERIES), help='A canned query.')
+  query_logs_p.add_argument('--sql', help='An sql query against the log_records table (ts, node,' \
+    ' daemon, level, thread, logger, message) instead of a canned query.')
+  query_logs_p.add_argument('--threshold', '-t', type=int, help='The threshold in milliseconds' \
+    ' of the canned query.')
+  query_logs_p.add_argument('--limit', type=int, help='The maximum number of rows.')
+  query_logs_p.set_defaults(func=query_logs_cmd, query='gc-pauses', sql=None, threshold=None, \
+    limit=20)
+
   # beeline-cli
   subparsers.add_parser('beeline-cli', help='Launches a cli using beeline on the client node.') \
     .set_defaults(func=beeline_cli_cmd)
@@ -1196,13 +5406,143 @@ def main():
     ' the src folder.')
   exec_hive_file_p.add_argument('--src-path', '-f', help='The relative path to the file on the ' \
     'linux node')
-  exec_hive_file_p.set_defaults(func=exec_hive_file_cmd)
+  exec_hive_file_p.add_argument('--analyze', '-a', action='store_true', help='Computes table and' \
+    ' column statistics for the tables and partitions the script created or changed.')
+  exec_hive_file_p.add_argument('--adaptive', action='store_true', help='Runs each statement in' \
+    ' local mode if its estimated input is below the local threshold, and on YARN otherwise.')
+  exec_hive_file_p.add_argument('--local-threshold', type=int, help='The input size in bytes' \
+    ' below which adaptive execution runs a statement in local mode.')
+  exec_hive_file_p.set_defaults(func=exec_hive_file_cmd, analyze=False, adaptive=False, \
+    local_threshold=LOCAL_MODE_THRESHOLD)
+
+  # analyze
+  analyze_p = subparsers.add_parser('analyze', help='Computes hive table and column statistics,' \
+    ' skipping partitions whose files have not changed since they were last analyzed.')
+  analyze_p.add_argument('--tables', '-t', nargs='+', help='The names of the tables to analyze.')
+  analyze_p.add_argument('--src-path', '-f', help='The relative path to a hive script in the src' \
+    ' folder. The tables and partitions it creates or writes to are analyzed.')
+  analyze_p.add_argument('--force', action='store_true', help='Analyzes partitions even if their' \
+    ' statistics are current.')
+  analyze_p.set_defaults(func=analyze_cmd, tables=None, src_path=None, force=False)
 
   # exec-hive-query
   exec_hive_query_p = subparsers.add_parser('exec-hive-query', help='Executes a single' \
     ' hive query.')
   exec_hive_query_p.add_argument('--query', '-e', help='The hive query string to execute.')
-  exec_hive_query_p.set_defaults(func=exec_hive_query_cmd)
+  exec_hive_query_p.add_argument('--adaptive', action='store_true', help='Runs the query in' \
+    ' local mode if its estimated input is below the local threshold, and on YARN otherwise.')
+  exec_hive_query_p.add_argument('--local-threshold', type=int, help='The input size in bytes' \
+    ' below which adaptive execution runs the query in local mode.')
+  exec_hive_query_p.set_defaults(func=exec_hive_query_cmd, adaptive=False, \
+    local_threshold=LOCAL_MODE_THRESHOLD)
+
+  # bench-local-mode
+  bench_local_mode_p = subparsers.add_parser('bench-local-mode', help='Measures the latency of a' \
+    ' hive query in local mode versus on YARN.')
+  bench_local_mode_p.add_argument('--query', '-e', help='The hive query string to benchmark.')
+  bench_local_mode_p.add_argument('--repeat', '-r', type=int, help='The number of runs per mode.')
+  bench_local_mode_p.set_defaults(func=benchmark_local_mode_cmd, repeat=3)
+
+  # hive-tune
+  hive_tune_p = subparsers.add_parser('hive-tune', help='Times a hive script under several' \
+    ' session setting profiles and recommends (and optionally saves) the fastest.')
+  hive_tune_p.add_argument('--src-path', '-f', help='The hive script to tune, relative to the src' \
+    ' folder. It must be safe to run repeatedly.')
+  hive_tune_p.add_argument('--query', '-e', help='A hive query to tune instead of a script.')
+  hive_tune_p.add_argument('--repeat', '-r', type=int, help='The minimum number of timed runs per' \
+    ' profile.')
+  hive_tune_p.add_argument('--max-repeat', type=int, help='The maximum number of timed runs per' \
+    ' profile while the timings are not yet stable.')
+  hive_tune_p.add_argument('--save', action='store_true', help='Saves the recommended profile so' \
+    ' exec-hive-file applies it to the script.')
+  hive_tune_p.add_argument('--clear', action='store_true', help='Removes the profile saved for' \
+    ' the script instead of tuning.')
+  hive_tune_p.set_defaults(func=hive_tune_cmd, repeat=3, max_repeat=10, save=False, clear=False)
+
+  # hive-load
+  hive_load_p = subparsers.add_parser('hive-load', help='Runs a weighted mix of hive queries from' \
+    ' concurrent sessions and reports throughput, latency percentiles and failures.')
+  hive_load_p.add_argument('--workload', '-w', help='The local json file listing the queries' \
+    ' (name, query, weight) and optional session settings.')
+  hive_load_p.add_argument('--sessions', '-n', type=int, help='The number of concurrent sessions.')
+  hive_load_p.add_argument('--duration', type=float, help='Runs for this many seconds.')
+  hive_load_p.add_argument('--iterations', '-r', type=int, help='Runs this many queries per' \
+    ' session. Defaults to 10 if no duration is given.')
+  hive_load_p.add_argument('--seed', type=int, help='Seeds the query choice of the sessions.')
+  hive_load_p.set_defaults(func=hive_load_cmd, sessions=4, duration=None, iterations=None, seed=0)
+
+  # hive-to-sql
+  hive_to_sql_p = subparsers.add_parser('hive-to-sql', help='Streams the results of a hive query' \
+    ' into an existing sql table without an intermediate HDFS table.')
+  hive_to_sql_p.add_argument('--query', '-e', help='The hive query whose results are transferred.')
+  hive_to_sql_p.add_argument('--sql-table', '-t', help='The name of the sql table to insert into.' \
+    ' Note: this table should already exist with columns in the same order as the query.')
+  hive_to_sql_p.add_argument('--database-name', '-b', help='The name of the database to' \
+    ' insert into.')
+  hive_to_sql_p.add_argument('--batch-size', type=int, help='The number of rows per insert batch.')
+  hive_to_sql_p.add_argument('--queue-size', type=int, help='The number of batches that may be' \
+    ' buffered in memory before the hive reader is paused.')
+  hive_to_sql_p.add_argument('--writers', type=int, help='The number of concurrent sql sessions' \
+    ' inserting batches.')
+  hive_to_sql_p.set_defaults(func=hive_to_sql_cmd, database_name='master', \
+    batch_size=HIVE_TO_SQL_BATCH_SIZE, queue_size=HIVE_TO_SQL_QUEUE_SIZE, writers=2)
+
+  # run-pipeline
+  run_pipeline_p = subparsers.add_parser('run-pipeline', help='Runs the steps of a pipeline file' \
+    ' in dependency order, in parallel where possible, skipping steps whose inputs have not' \
+    ' changed since they last succeeded.')
+  run_pipeline_p.add_argument('--pipeline', '-f', help='The local json pipeline file.')
+  run_pipeline_p.add_argument('--workers', '-j', type=int, help='The number of steps run at once.')
+  run_pipeline_p.add_argument('--force', nargs='+', help='The names of steps to rerun even if' \
+    ' nothing changed, or "all".')
+  run_pipeline_p.set_defaults(func=run_pipeline_cmd, workers=4, force=None)
+
+  # materialize-view
+  materialize_view_p = subparsers.add_parser('materialize-view', help='Stores the result of a' \
+    ' hive view in a partitioned table, or incrementally refreshes a previously stored view.')
+  materialize_view_p.add_argument('--view', '-w', help='The hive view to materialize.')
+  materialize_view_p.add_argument('--table', '-t', help='The table storing the view. Defaults to' \
+    ' the view name with a "_mv" suffix.')
+  materialize_view_p.add_argument('--source-table', '-s', help='The partitioned table the view' \
+    ' reads from. Only required the first time.')
+  materialize_view_p.add_argument('--force', action='store_true', help='Recomputes every' \
+    ' partition.')
+  materialize_view_p.add_argument('--cluster-by', nargs='+', help='The bucketing columns of a new' \
+    ' table.')
+  materialize_view_p.add_argument('--sort-by', nargs='+', help='The columns a new table is sorted' \
+    ' by within each bucket.')
+  materialize_view_p.add_argument('--buckets', type=int, help='The bucket count of a new table.')
+  materialize_view_p.add_argument('--bloom-filter', nargs='+', help='The columns of a new table' \
+    ' with bloom filter indexes.')
+  materialize_view_p.set_defaults(func=materialize_view_cmd, table=None, source_table=None, \
+    force=False, cluster_by=None, sort_by=None, buckets=None, bloom_filter=None)
+
+  # create-layout-table
+  create_layout_table_p = subparsers.add_parser('create-layout-table', help='Copies a hive table' \
+    ' or view into a bucketed, sorted ORC table with min/max and bloom filter indexes.')
+  create_layout_table_p.add_argument('--source', '-s', help='The table or view to copy.')
+  create_layout_table_p.add_argument('--table', '-t', help='The table to (re)create.')
+  create_layout_table_p.add_argument('--cluster-by', nargs='+', help='The bucketing columns.')
+  create_layout_table_p.add_argument('--sort-by', nargs='+', help='The columns sorted by within' \
+    ' each bucket. Sort by the columns of range filters.')
+  create_layout_table_p.add_argument('--buckets', type=int, help='The bucket count.')
+  create_layout_table_p.add_argument('--bloom-filter', nargs='+', help='The columns with bloom' \
+    ' filter indexes. Use the columns of point lookups.')
+  create_layout_table_p.set_defaults(func=create_layout_table_cmd, cluster_by=None, sort_by=None, \
+    buckets=None, bloom_filter=None)
+
+  # bench-layout
+  bench_layout_p = subparsers.add_parser('bench-layout', help='Compares the latency and the bytes' \
+    ' and rows read of selective queries against tables with different layouts.')
+  bench_layout_p.add_argument('--table', '-t', nargs='+', help='The tables to compare. The first' \
+    ' one is the baseline.')
+  bench_layout_p.add_argument('--query', '-e', action='append', help='A query to run, with' \
+    ' {table} in place of the table name. May be repeated. Defaults to range and point queries on' \
+    ' the m33 columns.')
+  bench_layout_p.add_argument('--repeat', '-r', type=int, help='The number of runs per query and' \
+    ' table.')
+  bench_layout_p.set_defaults(func=benchmark_layout_cmd, table=['m33', 'm33_sorted'], query=None, \
+    repeat=3)
 
   # print-health
   subparsers.add_parser('print-health', help='Prints the cluster health information.') \
@@ -0,0 +1,44 @@
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import playground  # pylint: disable=wrong-import-position
+
+MB = 1048576
+
+class CountBlocksTest(unittest.TestCase):
+
+  def test_partial_blocks_count(self):
+    self.assertEqual(playground.count_blocks([0, 1, MB, MB + 1, 3 * MB], MB), 0 + 1 + 1 + 2 + 3)
+
+class PlanBlockLayoutTest(unittest.TestCase):
+
+  def test_no_files(self):
+    self.assertEqual(playground.plan_block_layout([], 1, 8), (playground.MAX_BLOCK_SIZE, 1))
+
+  def test_replication_capped_by_data_nodes(self):
+    self.assertEqual(playground.plan_block_layout([MB], 1, 8)[1], 1)
+    self.assertEqual(playground.plan_block_layout([MB], 2, 8)[1], 2)
+    self.assertEqual(playground.plan_block_layout([MB], 5, 8)[1], 3)
+
+  def test_blocks_keep_every_task_busy(self):
+    # 40MB in four files fills 8 tasks with 8MB blocks (8 blocks), not 16MB ones (4 blocks)
+    self.assertEqual(playground.plan_block_layout([10 * MB] * 4, 1, 8)[0], 8 * MB)
+
+  def test_large_data_gets_large_blocks(self):
+    self.assertEqual(playground.plan_block_layout([4096 * MB], 1, 8)[0], \
+      playground.MAX_BLOCK_SIZE)
+
+  def test_small_files_get_one_block_each(self):
+    block_size, _replication = playground.plan_block_layout([1000] * 3, 1, 100)
+    self.assertEqual(playground.count_blocks([1000] * 3, block_size), 3)
+    self.assertEqual(block_size, playground.MAX_BLOCK_SIZE)
+
+  def test_block_size_bounds(self):
+    block_size, _replication = playground.plan_block_layout([64 * MB], 1, 1000)
+    self.assertEqual(block_size, playground.MIN_BLOCK_SIZE)
+
+if __name__ == '__main__':
+  unittest.main()
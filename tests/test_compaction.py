@@ -0,0 +1,78 @@
+import os
+import sys
+import tempfile
+import unittest
+from unittest import mock
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import playground  # pylint: disable=wrong-import-position
+
+class CompactionTest(unittest.TestCase):
+
+  def setUp(self):
+    self._dir = tempfile.TemporaryDirectory()
+    self.files = []
+    for index, rows in enumerate([3, 1, 4, 1, 5]):
+      rel_path = 'cp/hmix.a%06d' % (index)
+      path = os.path.join(self._dir.name, 'hmix.a%06d' % (index))
+      with open(path, 'wb') as _fp:
+        _fp.write(b'# header\n' + b''.join(b'  %d.5  %d\r\n' % (_r, index) for _r in range(rows)))
+      self.files.append((path, rel_path))
+    self.written = {}
+
+  def tearDown(self):
+    self._dir.cleanup()
+
+  def put(self, config, dst, chunks, properties=None):
+    self.written[dst] = (b''.join(chunks), properties)
+    return len(self.written[dst][0])
+
+  def compact(self, block_size):
+    with mock.patch.object(playground, 'hdfs_put_stream', self.put):
+      return playground.compact_files(None, '/data_compact', self.files, 1, block_size)
+
+  def test_source_tagged_rows(self):
+    rows = b''.join(playground.source_tagged_chunks(self.files[:2], 1, '\t')).split(b'\n')
+    self.assertEqual(rows, [b'cp/hmix.a000000\t0.5\t0', b'cp/hmix.a000000\t1.5\t0', \
+      b'cp/hmix.a000000\t2.5\t0', b'cp/hmix.a000001\t0.5\t1', b''])
+
+  def test_source_tagged_chunk_boundaries(self):
+    path, rel_path = self.files[2]
+    with mock.patch.object(playground, 'normalized_chunks', lambda _p, _h, _d: \
+      [b'0.5\x012\n1.5\x012\n', b'2.5\x012\n']):
+      chunks = list(playground.source_tagged_chunks([(path, rel_path)], 1, '\x01'))
+    self.assertEqual(chunks, [b'cp/hmix.a000002\x010.5\x012\ncp/hmix.a000002\x011.5\x012\n', \
+      b'cp/hmix.a000002\x012.5\x012\n'])
+
+  def test_one_container(self):
+    self.assertEqual(self.compact(1048576), 1)
+    data, properties = self.written['/data_compact/part-00000']
+    self.assertEqual(data, b''.join(playground.source_tagged_chunks(self.files, 1)))
+    self.assertEqual(properties, {'dfs.blocksize': 1048576})
+
+  def test_containers_fit_the_block_size(self):
+    chunks = list(playground.source_tagged_chunks(self.files, 1))
+    block_size = max(len(_c) for _c in chunks) + 10
+    # Chunks are packed in order, and a container is closed when the next chunk does not fit
+    expected = [b'']
+    for chunk in chunks:
+      if expected[-1] and len(expected[-1]) + len(chunk) > block_size:
+        expected.append(b'')
+      expected[-1] += chunk
+    self.assertGreater(len(expected), 1)
+    self.assertEqual(self.compact(block_size), len(expected))
+    self.assertEqual([self.written['/data_compact/part-%05d' % (_i)][0] \
+      for _i in range(len(expected))], expected)
+
+  def test_chunk_larger_than_a_block(self):
+    containers = self.compact(1)
+    self.assertEqual(containers, len(self.files))
+
+  def test_no_files(self):
+    self.files = []
+    self.assertEqual(self.compact(1048576), 0)
+    self.assertEqual(self.written, {})
+
+if __name__ == '__main__':
+  unittest.main()
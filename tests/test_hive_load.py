@@ -0,0 +1,97 @@
+import contextlib
+import io
+import json
+import os
+import random
+import sys
+import tempfile
+import types
+import unittest
+from unittest import mock
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import playground  # pylint: disable=wrong-import-position
+
+WORKLOAD = {'queries': [
+  {'name': 'scan', 'query': 'SELECT COUNT(*) FROM m33_raw', 'weight': 3},
+  {'name': 'agg', 'query': 'SELECT age, AVG(flam) FROM m33_schem GROUP BY age'},
+  {'name': 'point', 'query': 'SELECT * FROM m33_schem WHERE age = 11', 'weight': 2}
+]}
+
+class PercentileTest(unittest.TestCase):
+
+  def test_nearest_rank(self):
+    values = [15, 20, 35, 40, 50]
+    self.assertEqual(playground.percentile(values, 5), 15)
+    self.assertEqual(playground.percentile(values, 30), 20)
+    self.assertEqual(playground.percentile(values, 40), 20)
+    self.assertEqual(playground.percentile(values, 50), 35)
+    self.assertEqual(playground.percentile(values, 100), 50)
+
+  def test_bounds(self):
+    self.assertEqual(playground.percentile([7], 0), 7)
+    self.assertEqual(playground.percentile([7], 99), 7)
+    self.assertEqual(playground.percentile(list(range(1, 101)), 99), 99)
+
+class FakeHiveSession:
+  """
+  Stands in for a beeline session, recording the statements of every session opened.
+  """
+  opened = []
+
+  def __init__(self, config):
+    self.statements = []
+    FakeHiveSession.opened.append(self)
+
+  def execute(self, statement):
+    self.statements.append(statement)
+    return playground.HiveSessionResult(lines=[], error=None, seconds=0.001)
+
+  def set_all(self, settings):
+    pass
+
+  def __enter__(self):
+    return self
+
+  def __exit__(self, exc_type, exc_value, traceback):
+    pass
+
+class HiveLoadSeedTest(unittest.TestCase):
+
+  def setUp(self):
+    self._dir = tempfile.TemporaryDirectory()
+    self.workload_file = os.path.join(self._dir.name, 'workload.json')
+    with open(self.workload_file, 'w') as _fp:
+      json.dump(WORKLOAD, _fp)
+
+  def tearDown(self):
+    self._dir.cleanup()
+
+  def run_sessions(self, seed, sessions=3, iterations=20):
+    """
+    Runs hive_load() against fake sessions and returns the query sequence of each session, sorted
+    since the sessions are not opened in a fixed order.
+    """
+    FakeHiveSession.opened = []
+    config = types.SimpleNamespace(metastore='mssql')
+    with mock.patch.object(playground, 'HiveSession', FakeHiveSession), \
+      contextlib.redirect_stdout(io.StringIO()):
+      samples = playground.hive_load(config, self.workload_file, sessions, iterations=iterations, \
+        seed=seed)
+    self.assertEqual(len(samples), sessions * iterations)
+    return sorted(_s.statements for _s in FakeHiveSession.opened)
+
+  def test_same_seed_same_queries(self):
+    self.assertEqual(self.run_sessions(7), self.run_sessions(7))
+    self.assertNotEqual(self.run_sessions(7), self.run_sessions(8))
+
+  def test_sessions_seeded_by_index(self):
+    queries = [_q['query'] for _q in WORKLOAD['queries']]
+    weights = [_q.get('weight', 1) for _q in WORKLOAD['queries']]
+    rngs = [random.Random(5 + _i) for _i in range(3)]
+    expected = sorted([_r.choices(queries, weights)[0] for _n in range(20)] for _r in rngs)
+    self.assertEqual(self.run_sessions(5), expected)
+
+if __name__ == '__main__':
+  unittest.main()
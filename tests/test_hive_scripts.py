@@ -0,0 +1,52 @@
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import playground  # pylint: disable=wrong-import-position
+
+class SplitHiveStatementsTest(unittest.TestCase):
+
+  def test_split(self):
+    self.assertEqual(playground.split_hive_statements('SELECT 1;\nSELECT 2;'), \
+      ['SELECT 1', 'SELECT 2'])
+
+  def test_quoted_semicolons(self):
+    script = "SELECT ';' FROM t;\nSELECT \"a;b\", `c;d` FROM u"
+    self.assertEqual(playground.split_hive_statements(script), \
+      ["SELECT ';' FROM t", 'SELECT "a;b", `c;d` FROM u'])
+
+  def test_comments_and_empty_statements(self):
+    script = '-- first; comment\nSELECT 1; ;\n-- trailing comment;\n'
+    self.assertEqual(playground.split_hive_statements(script), ['SELECT 1'])
+
+class FindHiveScriptTargetsTest(unittest.TestCase):
+
+  def test_create_table(self):
+    script = 'CREATE EXTERNAL TABLE IF NOT EXISTS M33_Raw (row_str STRING) LOCATION \'/data\';'
+    self.assertEqual(playground.find_hive_script_targets(script), {'m33_raw': set()})
+
+  def test_static_partitions(self):
+    script = "INSERT OVERWRITE TABLE m33 PARTITION (peculiarity = 'cp', age = 11) SELECT 1;\n" \
+      "ALTER TABLE m33 ADD IF NOT EXISTS PARTITION (peculiarity='nocp', age='12') LOCATION '/x'" \
+      " PARTITION (peculiarity='cp', age='13');"
+    self.assertEqual(playground.find_hive_script_targets(script), \
+      {'m33': {'peculiarity=cp/age=11', 'peculiarity=nocp/age=12', 'peculiarity=cp/age=13'}})
+
+  def test_dynamic_partitions_mean_the_whole_table(self):
+    script = "INSERT INTO TABLE m33 PARTITION (peculiarity='cp') SELECT 1;\n" \
+      'INSERT INTO m33 PARTITION (peculiarity) SELECT 1;\n' \
+      "INSERT INTO TABLE m33 PARTITION (peculiarity='nocp') SELECT 1;"
+    self.assertEqual(playground.find_hive_script_targets(script), {'m33': set()})
+
+  def test_load_data_and_repair(self):
+    script = "LOAD DATA LOCAL INPATH '/src/x' OVERWRITE INTO TABLE db.t1;\nMSCK REPAIR TABLE t2;"
+    self.assertEqual(playground.find_hive_script_targets(script), {'db.t1': set(), 't2': set()})
+
+  def test_commented_out_statements(self):
+    script = '-- INSERT INTO TABLE t1 SELECT 1;\nSELECT * FROM t2;'
+    self.assertEqual(playground.find_hive_script_targets(script), {})
+
+if __name__ == '__main__':
+  unittest.main()
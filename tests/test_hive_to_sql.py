@@ -0,0 +1,39 @@
+import os
+import re
+import sys
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import playground  # pylint: disable=wrong-import-position
+
+class SqlNumberPatternTest(unittest.TestCase):
+
+  def test_numbers(self):
+    for value in ['0', '-7', '42', '3.25', '-0.5', '1e10', '6.02E+23', '1.5e-3']:
+      self.assertIsNotNone(re.fullmatch(playground.SQL_NUMBER_PATTERN, value), value)
+
+  def test_not_numbers(self):
+    for value in ['', '007', '-', '1.', '.5', '+1', '1e', '1,5', '0x1F', 'NaN', 'Infinity', \
+      ' 1', '1 ']:
+      self.assertIsNone(re.fullmatch(playground.SQL_NUMBER_PATTERN, value), value)
+
+class SqlLiteralTest(unittest.TestCase):
+
+  def test_null(self):
+    self.assertEqual(playground.sql_literal(None), 'NULL')
+    self.assertEqual(playground.sql_literal('NULL'), 'NULL')
+
+  def test_number(self):
+    self.assertEqual(playground.sql_literal('-12.5'), '-12.5')
+    self.assertEqual(playground.sql_literal('1e-3'), '1e-3')
+
+  def test_leading_zeros_stay_strings(self):
+    self.assertEqual(playground.sql_literal('00042'), "N'00042'")
+
+  def test_string_quotes_are_escaped(self):
+    self.assertEqual(playground.sql_literal("it's"), "N'it''s'")
+    self.assertEqual(playground.sql_literal(''), "N''")
+
+if __name__ == '__main__':
+  unittest.main()
@@ -0,0 +1,111 @@
+import math
+import os
+import sys
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import playground  # pylint: disable=wrong-import-position
+
+# A data file with a header line, a row missing its second column, a non-numeric value, Windows
+# line endings and no newline after its last row
+DATA_FILE = b'# wavelength flam\n' \
+  b'  1.5  2.5\r\n' \
+  b'3.0  abc\n' \
+  b'1.5\n' \
+  b'  1.5  2.5\r\n' \
+  b'-4  7'
+
+def sketch_of(values, size=playground.PROFILE_SKETCH_SIZE):
+  sketch = playground.DistinctSketch(size=size)
+  for value in values:
+    sketch.add(value)
+  return sketch
+
+class DistinctSketchTest(unittest.TestCase):
+
+  def test_exact_below_size(self):
+    sketch = sketch_of([b'%d' % (_i % 100) for _i in range(1000)])
+    self.assertEqual(sketch.estimate(), 100)
+
+  def test_estimate_error(self):
+    bound = 3 / math.sqrt(playground.PROFILE_SKETCH_SIZE)
+    for count in [1000, 10000, 100000]:
+      estimate = sketch_of([b'value %d' % (_i) for _i in range(count)]).estimate()
+      self.assertLess(abs(estimate - count) / count, bound, count)
+
+  def test_duplicates_do_not_count(self):
+    values = [b'value %d' % (_i) for _i in range(5000)]
+    self.assertEqual(sketch_of(values * 3).hashes(), sketch_of(values).hashes())
+
+  def test_merge_is_the_sketch_of_the_union(self):
+    first = [b'value %d' % (_i) for _i in range(0, 6000)]
+    second = [b'value %d' % (_i) for _i in range(4000, 10000)]
+    merged = sketch_of(first)
+    merged.merge(sketch_of(second))
+    self.assertEqual(merged.hashes(), sketch_of(first + second).hashes())
+    self.assertEqual(merged.estimate(), sketch_of(first + second).estimate())
+
+  def test_round_trip(self):
+    sketch = sketch_of([b'value %d' % (_i) for _i in range(1000)])
+    self.assertEqual(playground.DistinctSketch(sketch.hashes()).hashes(), sketch.hashes())
+
+class DataFileProfilerTest(unittest.TestCase):
+
+  def profile(self, chunk_size):
+    with tempfile.TemporaryDirectory() as data_dir:
+      path = os.path.join(data_dir, 'hmix.a000011')
+      with open(path, 'wb') as _fp:
+        _fp.write(DATA_FILE)
+      profiler = playground.DataFileProfiler(header_lines=1)
+      chunks = list(playground.profiled_chunks(path, profiler, chunk_size))
+    self.assertEqual(b''.join(chunks), DATA_FILE)
+    return profiler.result()
+
+  def test_profile(self):
+    profile = self.profile(1048576)
+    self.assertEqual(profile['rows'], 5)
+    self.assertEqual(profile['bytes'], len(b'  1.5  2.5' b'3.0  abc' b'1.5' b'  1.5  2.5' b'-4  7'))
+    self.assertEqual(profile['max_row_length'], 10)
+    self.assertEqual(playground.DistinctSketch(profile['row_sketch']).estimate(), 4)
+    first, second = profile['fields']
+    self.assertEqual([first['count'], first['missing'], first['non_numeric']], [5, 0, 0])
+    self.assertEqual([first['min'], first['max']], [-4.0, 3.0])
+    self.assertEqual(playground.DistinctSketch(first['sketch']).estimate(), 3)
+    self.assertEqual([second['count'], second['missing'], second['non_numeric']], [4, 1, 1])
+    self.assertEqual([second['min'], second['max']], [2.5, 7.0])
+    self.assertEqual([second['total_length'], second['max_length']], [3 + 3 + 3 + 1, 3])
+
+  def test_chunk_boundaries(self):
+    expected = self.profile(1048576)
+    for chunk_size in [1, 2, 5, 11]:
+      self.assertEqual(self.profile(chunk_size), expected, chunk_size)
+
+  def test_new_columns_count_earlier_rows_as_missing(self):
+    profiler = playground.DataFileProfiler()
+    profiler.update(b'1\n2\n3 4\n')
+    fields = profiler.result()['fields']
+    self.assertEqual([fields[1]['count'], fields[1]['missing']], [1, 2])
+
+  def test_delimiter(self):
+    profiler = playground.DataFileProfiler(delimiter=',')
+    profiler.update(b'a b,1\nc,\n')
+    fields = profiler.result()['fields']
+    self.assertEqual([fields[0]['max_length'], fields[1]['non_numeric']], [3, 1])
+
+class MergeProfilesTest(unittest.TestCase):
+
+  def profile(self, data):
+    profiler = playground.DataFileProfiler()
+    profiler.update(data)
+    return profiler.result()
+
+  def test_merge_is_the_profile_of_all_rows(self):
+    first = b'1 a\n2 b\n'
+    second = b'3\n2 c 9\n'
+    merged = playground.merge_profiles([self.profile(first), self.profile(second)])
+    self.assertEqual(merged, self.profile(first + second))
+
+if __name__ == '__main__':
+  unittest.main()
@@ -0,0 +1,95 @@
+import math
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import playground  # pylint: disable=wrong-import-position
+
+try:
+  import numpy  # pylint: disable=unused-import
+  HAVE_NUMPY = True
+except ImportError:
+  HAVE_NUMPY = False
+
+# An m33 data file: three header lines, then rows the m33_schem view splits with
+# split(trim(row_str), '  ') and casts to DOUBLE (NULL where the cast fails or a value is missing)
+MIXED_FILE = b'# header 1\n# header 2\n# header 3\n' \
+  b'  1.5  2.5  \n' \
+  b'3.0  4.0e-3\n' \
+  b'5.0 6.0\n' \
+  b'7.0  abc\n' \
+  b'8.0\n'
+MIXED_ROWS = [(1.5, 2.5), (3.0, 0.004), (None, None), (7.0, None), (8.0, None)]
+
+# A file whose rows are all separated by exactly two spaces (the NumPy fast path)
+REGULAR_FILE = b'# header 1\n# header 2\n# header 3\n' + \
+  b''.join(b'%d.5  %d.25\n' % (_i, _i * 2) for _i in range(200))
+REGULAR_ROWS = [(_i + 0.5, _i * 2 + 0.25) for _i in range(200)]
+
+def nullable(values):
+  return tuple(None if math.isnan(_v) else _v for _v in values)
+
+class M33ParseTest(unittest.TestCase):
+
+  def test_parse_row(self):
+    rows = MIXED_FILE.split(b'\n')[3:-1]
+    self.assertEqual([nullable(playground.m33_parse_row(_r)) for _r in rows], MIXED_ROWS)
+
+  def test_file_columns(self):
+    self.assertEqual(playground.m33_file_columns('m33_0.01/cp/hmix.a000011z0790'), (11, 1))
+    self.assertEqual(playground.m33_file_columns('m33_0.01/nocp/hmix.a000200z0790'), (200, 0))
+    self.assertEqual(playground.m33_file_columns('other.txt'), (None, -1))
+
+@unittest.skipUnless(HAVE_NUMPY, 'needs numpy')
+class LocalPreviewChunkTest(unittest.TestCase):
+
+  def setUp(self):
+    self.data_dir = tempfile.mkdtemp()
+    os.makedirs(os.path.join(self.data_dir, 'cp'))
+
+  def tearDown(self):
+    shutil.rmtree(self.data_dir)
+
+  def chunk(self, name, content, start=0, end=None):
+    path = os.path.join(self.data_dir, 'cp', name)
+    with open(path, 'wb') as _fp:
+      _fp.write(content)
+    return playground._local_preview_chunk(path, 'cp/' + name, start, \
+      len(content) if end is None else end, 1000)  # pylint: disable=protected-access
+
+  def test_mixed_separators_match_the_view(self):
+    result = self.chunk('hmix.a000011z0790', MIXED_FILE)
+    self.assertEqual(result['rows'], 5)
+    self.assertEqual([_r[1:3] for _r in result['sample']], MIXED_ROWS)
+    self.assertEqual(set(_r[0] for _r in result['sample']), {11})
+    self.assertEqual(set(_r[3] for _r in result['sample']), {1})
+    self.assertEqual(result['columns']['wavelength'][:3], [4, 1.5, 8.0])
+    self.assertEqual(result['columns']['flam'][:3], [2, 0.004, 2.5])
+
+  def test_regular_rows_match_the_view(self):
+    result = self.chunk('hmix.a000011z0790', REGULAR_FILE)
+    self.assertEqual(result['rows'], 200)
+    self.assertEqual([_r[1:3] for _r in result['sample']], REGULAR_ROWS)
+
+  def test_chunks_split_at_row_boundaries(self):
+    size = len(REGULAR_FILE)
+    rows = sum(self.chunk('hmix.a000011z0790', REGULAR_FILE, _s, min(_s + 100, size))['rows'] \
+      for _s in range(0, size, 100))
+    self.assertEqual(rows, 200)
+
+  def test_local_preview_totals(self):
+    with open(os.path.join(self.data_dir, 'cp', 'hmix.a000011z0790'), 'wb') as _fp:
+      _fp.write(MIXED_FILE)
+    config = playground.Config('test', self.data_dir, self.data_dir, self.data_dir)
+    result = playground.local_preview(config, workers=1, chunk_size=16)
+    self.assertEqual(result['rows'], 5)
+    self.assertEqual(result['columns']['wavelength']['nulls'], 1)
+    self.assertEqual(result['columns']['flam']['nulls'], 3)
+    self.assertEqual(result['columns']['age_mil']['min'], 11)
+
+if __name__ == '__main__':
+  unittest.main()
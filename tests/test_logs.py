@@ -0,0 +1,58 @@
+import os
+import re
+import shutil
+import subprocess
+import sys
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import playground  # pylint: disable=wrong-import-position
+
+# One record as written by the hadoop daemons and one as written by hive's log4j2 layout
+HADOOP_LINE = '2021-01-01 10:00:00,123 INFO org.apache.hadoop.hdfs.StateChange: BLOCK* allocate'
+HIVE_LINE = '2021-01-01T10:00:01,456  WARN [main] conf.HiveConf: HiveConf of name does not exist'
+
+class LogRecordPatternTest(unittest.TestCase):
+
+  def test_hadoop_line(self):
+    match = re.match(playground.LOG_RECORD_PATTERN, HADOOP_LINE)
+    self.assertEqual(match.group('ts'), '2021-01-01 10:00:00,123')
+    self.assertEqual(match.group('level'), 'INFO')
+    self.assertIsNone(match.group('thread'))
+    self.assertEqual(match.group('logger'), 'org.apache.hadoop.hdfs.StateChange')
+    self.assertEqual(match.group('message'), 'BLOCK* allocate')
+
+  def test_hive_line(self):
+    match = re.match(playground.LOG_RECORD_PATTERN, HIVE_LINE)
+    self.assertEqual(match.group('ts'), '2021-01-01T10:00:01,456')
+    self.assertEqual(match.group('level'), 'WARN')
+    self.assertEqual(match.group('thread'), 'main')
+    self.assertEqual(match.group('logger'), 'conf.HiveConf')
+    self.assertEqual(match.group('message'), 'HiveConf of name does not exist')
+
+@unittest.skipUnless(shutil.which('bash') and shutil.which('awk'), 'needs bash and awk')
+class LogScanScriptTest(unittest.TestCase):
+
+  def scan(self, line, level=''):
+    with tempfile.TemporaryDirectory() as log_dir:
+      path = os.path.join(log_dir, 'daemon.log')
+      with open(path, 'w') as log_file:
+        log_file.write(line + '\n')
+      env = dict(os.environ, LOG_PATTERNS=path, LOG_LEVEL=level, LOG_SINCE='', LOG_UNTIL='', \
+        LOG_REGEX='', LOG_DAEMON='')
+      result = subprocess.run(['bash', '-c', playground.LOG_SCAN_SCRIPT], input='', env=env, \
+        stdout=subprocess.PIPE, universal_newlines=True, check=True)
+    return [_l.split('\t', 1) for _l in result.stdout.splitlines() if not _l.startswith('\x01')]
+
+  def test_hadoop_line(self):
+    self.assertEqual(self.scan(HADOOP_LINE, 'INFO'), [['2021-01-01 10:00:00,123', HADOOP_LINE]])
+    self.assertEqual(self.scan(HADOOP_LINE, 'WARN'), [])
+
+  def test_hive_line(self):
+    self.assertEqual(self.scan(HIVE_LINE, 'WARN'), [['2021-01-01 10:00:01,456', HIVE_LINE]])
+    self.assertEqual(self.scan(HIVE_LINE, 'ERROR'), [])
+
+if __name__ == '__main__':
+  unittest.main()
@@ -0,0 +1,57 @@
+import os
+import sys
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import playground  # pylint: disable=wrong-import-position
+
+class PlanPartitionLayoutTest(unittest.TestCase):
+
+  def setUp(self):
+    self._dir = tempfile.TemporaryDirectory()
+    self.data_dir = self._dir.name
+    for rel_path in ['m33_0.01/cp/hmix.a000011z0790', 'm33_0.01/nocp/hmix.a000012z0790', \
+      'm33_0.01/other/hmix.a000013z0790', 'README']:
+      path = os.path.join(self.data_dir, *rel_path.split('/'))
+      os.makedirs(os.path.dirname(path), exist_ok=True)
+      open(path, 'w').close()
+
+  def tearDown(self):
+    self._dir.cleanup()
+
+  def test_example_pattern(self):
+    moves = playground.plan_partition_layout(self.data_dir, playground.M33_PARTITION_PATTERN)
+    self.assertEqual(moves, [
+      ('/data/m33_0.01/cp/hmix.a000011z0790', \
+        '/data_part/peculiarity=cp/age=000011/hmix.a000011z0790'),
+      ('/data/m33_0.01/nocp/hmix.a000012z0790', \
+        '/data_part/peculiarity=nocp/age=000012/hmix.a000012z0790')])
+
+  def test_columns_in_declared_order(self):
+    moves = playground.plan_partition_layout(self.data_dir, \
+      r'(?P<run>m33_[\d.]+)/(?P<kind>cp)/', '/root/')
+    self.assertEqual(moves, [('/data/m33_0.01/cp/hmix.a000011z0790', \
+      '/root/run=m33_0.01/kind=cp/hmix.a000011z0790')])
+
+  def test_values_are_escaped(self):
+    os.makedirs(os.path.join(self.data_dir, 'a b=c'))
+    open(os.path.join(self.data_dir, 'a b=c', 'f'), 'w').close()
+    moves = playground.plan_partition_layout(self.data_dir, r'^(?P<dir>[^/]+)/f$')
+    self.assertEqual(moves, [('/data/a b=c/f', '/data_part/dir=a%20b%3Dc/f')])
+
+class PartitionSpecKeyTest(unittest.TestCase):
+
+  def test_normalized(self):
+    self.assertEqual(playground.partition_spec_key("Peculiarity = 'cp', AGE = 11"), \
+      'peculiarity=cp/age=11')
+    self.assertEqual(playground.partition_spec_key('dir="a b=c"'), 'dir=a%20b%3Dc')
+
+  def test_round_trip(self):
+    key = playground.partition_spec_key("k1='v 1', k2=2")
+    self.assertEqual(playground.partition_spec_sql(key), "k1='v 1', k2='2'")
+    self.assertEqual(playground.partition_spec_key(playground.partition_spec_sql(key)), key)
+
+if __name__ == '__main__':
+  unittest.main()
@@ -0,0 +1,109 @@
+import json
+import os
+import sys
+import tempfile
+import types
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import playground  # pylint: disable=wrong-import-position
+
+class LoadPipelineTest(unittest.TestCase):
+
+  def setUp(self):
+    self._dir = tempfile.TemporaryDirectory()
+    self.pipeline_file = os.path.join(self._dir.name, 'pipeline.json')
+
+  def tearDown(self):
+    self._dir.cleanup()
+
+  def load(self, steps):
+    with open(self.pipeline_file, 'w') as _fp:
+      json.dump({'steps': steps}, _fp)
+    return playground.load_pipeline(self.pipeline_file)
+
+  def test_steps_in_file_order(self):
+    steps = self.load([
+      {'name': 'schem', 'kind': 'hive-file', 'file': 'hive/schem.hql', 'needs': ['raw']},
+      {'name': 'raw', 'kind': 'hive-file', 'file': 'hive/raw.hql'}])
+    self.assertEqual(list(steps.keys()), ['schem', 'raw'])
+
+  def test_cycle(self):
+    with self.assertRaisesRegex(ValueError, 'depend on each other'):
+      self.load([
+        {'name': 'a', 'kind': 'hive-query', 'needs': ['c']},
+        {'name': 'b', 'kind': 'hive-query', 'needs': ['a']},
+        {'name': 'c', 'kind': 'hive-query', 'needs': ['b']},
+        {'name': 'd', 'kind': 'hive-query'}])
+
+  def test_self_dependency(self):
+    with self.assertRaisesRegex(ValueError, 'depend on each other'):
+      self.load([{'name': 'a', 'kind': 'hive-query', 'needs': ['a']}])
+
+  def test_unknown_need(self):
+    with self.assertRaisesRegex(ValueError, 'unknown step "missing"'):
+      self.load([{'name': 'a', 'kind': 'hive-query', 'needs': ['missing']}])
+
+  def test_unknown_kind(self):
+    with self.assertRaisesRegex(ValueError, 'unknown kind'):
+      self.load([{'name': 'a', 'kind': 'pig-script'}])
+
+  def test_duplicate_name(self):
+    with self.assertRaisesRegex(ValueError, 'more than once'):
+      self.load([{'name': 'a', 'kind': 'stop'}, {'name': 'a', 'kind': 'start'}])
+
+class PipelineStepKeyTest(unittest.TestCase):
+
+  def setUp(self):
+    self._dir = tempfile.TemporaryDirectory()
+    self.config = types.SimpleNamespace(source_dir=os.path.join(self._dir.name, 'src'), \
+      data_dir=os.path.join(self._dir.name, 'data'))
+    os.makedirs(os.path.join(self.config.source_dir, 'hive'))
+    os.makedirs(os.path.join(self.config.data_dir, 'cp'))
+    self.write('src', 'hive/raw.hql', 'SELECT 1;')
+    self.write('data', 'cp/hmix.a000011', '1.0  2.0\n')
+    self.step = {'name': 'raw', 'kind': 'hive-file', 'file': 'hive/raw.hql', 'inputs': ['data:cp']}
+
+  def tearDown(self):
+    self._dir.cleanup()
+
+  def write(self, kind, rel_path, text):
+    root = self.config.source_dir if kind == 'src' else self.config.data_dir
+    path = os.path.join(root, *rel_path.split('/'))
+    with open(path, 'w') as _fp:
+      _fp.write(text)
+
+  def key(self, step=None, need_keys=()):
+    return playground.pipeline_step_key(self.config, step or self.step, list(need_keys))
+
+  def test_stable(self):
+    self.assertEqual(self.key(), self.key())
+
+  def test_script_change(self):
+    key = self.key()
+    self.write('src', 'hive/raw.hql', 'SELECT 2;')
+    self.assertNotEqual(self.key(), key)
+
+  def test_data_change(self):
+    key = self.key()
+    self.write('data', 'cp/hmix.a000012', '3.0  4.0\n')
+    self.assertNotEqual(self.key(), key)
+
+  def test_data_outside_the_inputs(self):
+    key = self.key()
+    self.write('data', 'other', 'x\n')
+    self.assertEqual(self.key(), key)
+
+  def test_definition_change(self):
+    self.assertNotEqual(self.key(dict(self.step, inputs=[])), self.key())
+
+  def test_needed_step_change(self):
+    self.assertNotEqual(self.key(need_keys=['a']), self.key(need_keys=['b']))
+
+  def test_unknown_input(self):
+    with self.assertRaises(ValueError):
+      self.key(dict(self.step, inputs=['ftp:/data']))
+
+if __name__ == '__main__':
+  unittest.main()
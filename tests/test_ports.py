@@ -0,0 +1,93 @@
+import contextlib
+import io
+import json
+import os
+import sys
+import tempfile
+import time
+import types
+import unittest
+from unittest import mock
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import playground  # pylint: disable=wrong-import-position
+
+class PortsTest(unittest.TestCase):
+
+  def setUp(self):
+    self._dir = tempfile.TemporaryDirectory()
+    self.reservations_file = os.path.join(self._dir.name, 'port-reservations.json')
+    self.busy = set()
+    stack = contextlib.ExitStack()
+    self.addCleanup(stack.close)
+    for patch in [
+      mock.patch.object(playground, 'PORT_RESERVATIONS_FILE', self.reservations_file),
+      mock.patch.object(playground, 'PORT_RESERVATIONS_LOCK', self.reservations_file + '.lock'),
+      mock.patch.object(playground, 'ports_free', lambda _b: _b not in self.busy),
+      mock.patch.object(playground, 'gen_docker_health_report', \
+        lambda _c, _n: types.SimpleNamespace(is_healthy=False)),
+      contextlib.redirect_stdout(io.StringIO())]:
+      stack.enter_context(patch)
+
+  def tearDown(self):
+    self._dir.cleanup()
+
+  def project(self, name, port_base='auto'):
+    return types.SimpleNamespace(project_name=name, port_base=port_base, \
+      volumes_dir=os.path.join(self._dir.name, name))
+
+  def test_configured_base(self):
+    config = self.project('fixed', 5000)
+    self.assertEqual(playground.allocate_ports(config), 5000)
+    self.assertEqual(playground.host_port(config, playground.PORT_OFFSET_HS), 5005)
+    self.assertFalse(os.path.exists(self.reservations_file))
+
+  def test_default_base(self):
+    config = self.project('one')
+    self.assertEqual(playground.host_port(config, playground.PORT_OFFSET_NN1), \
+      playground.DEFAULT_PORT_BASE)
+    self.assertEqual(playground.allocate_ports(config), playground.DEFAULT_PORT_BASE)
+    self.assertEqual(playground.host_port(config, playground.PORT_OFFSET_SQL), \
+      playground.DEFAULT_PORT_BASE + playground.PORT_OFFSET_SQL)
+
+  def test_reserved_bases_are_skipped(self):
+    first = playground.allocate_ports(self.project('one'))
+    second = playground.allocate_ports(self.project('two'))
+    self.assertEqual(second, first + playground.PORT_BASE_STEP)
+    with open(self.reservations_file, 'r') as _fp:
+      self.assertEqual({_p: _r['base'] for _p, _r in json.load(_fp).items()}, \
+        {'one': first, 'two': second})
+    # A project keeps its own reservation
+    self.assertEqual(playground.allocate_ports(self.project('one')), first)
+    self.assertFalse(os.path.exists(self.reservations_file + '.lock'))
+
+  def test_busy_ports_are_skipped(self):
+    self.busy = {playground.DEFAULT_PORT_BASE, \
+      playground.DEFAULT_PORT_BASE + playground.PORT_BASE_STEP}
+    self.assertEqual(playground.allocate_ports(self.project('one')), \
+      playground.DEFAULT_PORT_BASE + 2 * playground.PORT_BASE_STEP)
+
+  def test_previous_base_moves_when_taken(self):
+    config = self.project('one')
+    playground.save_state(config, 'ports', {'base': 4000})
+    self.assertEqual(playground.allocate_ports(config), 4000)
+    self.busy = {4000}
+    self.assertEqual(playground.allocate_ports(config), playground.DEFAULT_PORT_BASE)
+    self.assertEqual(playground.load_state(config, 'ports')['base'], playground.DEFAULT_PORT_BASE)
+
+  def test_expired_reservations_are_dropped(self):
+    with open(self.reservations_file, 'w') as _fp:
+      json.dump({'old': {'base': playground.DEFAULT_PORT_BASE, \
+        'time': time.time() - playground.PORT_RESERVATION_SECONDS - 1}}, _fp)
+    self.assertEqual(playground.allocate_ports(self.project('one')), \
+      playground.DEFAULT_PORT_BASE)
+
+  def test_lock_timeout(self):
+    open(self.reservations_file + '.lock', 'w').close()
+    with self.assertRaises(RuntimeError):
+      with playground.port_reservations_lock(timeout=0):
+        pass
+
+if __name__ == '__main__':
+  unittest.main()
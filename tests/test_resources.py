@@ -0,0 +1,68 @@
+import os
+import sys
+import unittest
+import xml.etree.ElementTree
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import playground  # pylint: disable=wrong-import-position
+
+# Hosts as (cpus, memory in MB, node managers), from a small laptop to a workstation
+HOSTS = [(1, 1024, 1), (2, 4096, 1), (4, 8192, 1), (8, 16384, 1), (16, 65536, 2), (64, 262144, 3)]
+
+class PlanResourcesTest(unittest.TestCase):
+
+  def test_laptop(self):
+    plan = playground.plan_resources(8, 16384)
+    self.assertEqual(plan.node_memory_mb, 8192)
+    # One cpu is left to the master daemons
+    self.assertEqual(plan.node_vcores, 7)
+    self.assertEqual(plan.min_allocation_mb, 512)
+    self.assertEqual(plan.map_memory_mb, 1024)
+    self.assertEqual(plan.reduce_memory_mb, 2048)
+    self.assertEqual(plan.am_memory_mb, 2048)
+
+  def test_workers_share_the_host(self):
+    plan = playground.plan_resources(16, 65536, 2)
+    self.assertEqual(plan.node_memory_mb, (65536 - playground.RESERVED_MEMORY_MB) // 2)
+    self.assertEqual(plan.node_vcores, 7)
+    self.assertEqual(plan.min_allocation_mb, 1024)
+    self.assertEqual(plan.map_memory_mb, 4096)
+
+  def test_containers_fit_the_node(self):
+    for host in HOSTS:
+      plan = playground.plan_resources(*host)
+      self.assertGreaterEqual(plan.node_vcores, 1, host)
+      self.assertEqual(plan.map_memory_mb % plan.min_allocation_mb, 0, host)
+      self.assertLessEqual(plan.map_memory_mb, plan.node_memory_mb, host)
+      self.assertLessEqual(plan.reduce_memory_mb, plan.node_memory_mb, host)
+      self.assertEqual(plan.am_memory_mb, max(plan.map_memory_mb, plan.reduce_memory_mb), host)
+
+  def test_uber_threshold(self):
+    for host in HOSTS:
+      plan = playground.plan_resources(*host)
+      heap_bytes = int(plan.am_memory_mb * playground.CONTAINER_HEAP_RATIO) * 1048576
+      self.assertEqual(plan.uber_max_bytes, \
+        min(heap_bytes // 4, playground.UBER_MAX_BYTES_LIMIT), host)
+
+class SitePropertiesTest(unittest.TestCase):
+
+  def test_properties(self):
+    plan = playground.plan_resources(8, 16384)
+    properties = playground.resource_plan_properties(plan)
+    self.assertEqual(properties['yarn-site.xml']['yarn.nodemanager.resource.memory-mb'], 8192)
+    self.assertEqual(properties['mapred-site.xml']['mapreduce.map.java.opts'], '-Xmx819m')
+    self.assertEqual(properties['mapred-site.xml']['mapreduce.job.ubertask.maxbytes'], \
+      plan.uber_max_bytes)
+
+  def test_merge_keeps_other_properties(self):
+    site_xml = '<?xml version="1.0"?>\n<configuration>\n' \
+      '<property><name>a</name><value>1</value></property>\n' \
+      '<property><name>b</name><value>2</value></property>\n</configuration>\n'
+    merged = playground.merge_site_properties(site_xml, {'b': 3, 'c': 'x'})
+    root = xml.etree.ElementTree.fromstring(merged.split('\n', 1)[1])
+    self.assertEqual([(_p.findtext('name'), _p.findtext('value')) \
+      for _p in root.findall('property')], [('a', '1'), ('b', '3'), ('c', 'x')])
+
+if __name__ == '__main__':
+  unittest.main()